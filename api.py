@@ -3,30 +3,48 @@
 project name: guess-a-game
 game: tic-tac-toe
 """
-import re
-from collections import defaultdict
-import operator
-import json
 import endpoints
+from google.appengine.ext import ndb
 from protorpc import remote, messages
-from google.appengine.api import memcache
-from google.appengine.api import taskqueue
 
-from models import Result, User, Game, Score, StringMessage, NewGameForm, GameForm, MakeMoveForm, ScoreForms, BoardMessage, GameForms, UserTotalScoreForm, UserTotalScoreForms
-
-from utils import get_by_urlsafe, get_endpoints_current_user
+import chances
+import directory
+import gamecache
+import leaderboard
+import matchmaking
+import metrics
+import moves
+import ratelimit
+import ratings
+import repository
+import writebehind
+from models import Result, User, Game, GameStatus, Score, StringMessage, NewGameForm, GameForm, MakeMoveForm, ScoreForms, BoardMessage, GameForms, UserTotalScoreForm, UserTotalScoreForms
+from models import UserRankingForm, UserRankingForms, UserForm, UserForms
+from models import MoveForm, MoveForms, WinningChanceForm, GamePollForm
+from models import BatchMoveForms, MoveResultForm, MoveResultForms, MatchForm
+
+from utils import get_by_urlsafe, get_endpoints_current_user, fetch_page, key_from_urlsafe, get_referenced
 
 NEW_GAME_REQUEST = endpoints.ResourceContainer(NewGameForm)
 GET_GAME_REQUEST = endpoints.ResourceContainer(
         urlsafe_game_key=messages.StringField(1),)
+POLL_GAME_REQUEST = endpoints.ResourceContainer(
+        urlsafe_game_key=messages.StringField(1),
+        known_version=messages.IntegerField(2),)
 MAKE_MOVE_REQUEST = endpoints.ResourceContainer(
     MakeMoveForm,
     urlsafe_game_key=messages.StringField(1),)
 USER_REQUEST = endpoints.ResourceContainer(user_name=messages.StringField(1),
                                            email=messages.StringField(2))
+PAGE_REQUEST = endpoints.ResourceContainer(page_size=messages.IntegerField(1),
+                                           cursor=messages.StringField(2))
+
 
-MEMCACHE_WINNING_CHANCE = 'WINNING_CHANCE'
-GLOBAL_CURRENT_USER_NAME = ""
+def _repository():
+    """The repository moves are played against, see writebehind.py"""
+    if writebehind.ENABLED:
+        return writebehind.WriteBehindRepository()
+    return repository.NdbRepository()
 
 
 @endpoints.api(name='tic_tac_toe', version='v1')
@@ -37,6 +55,7 @@ class TicTacToeApi(remote.Service):
                       path='user',
                       name='create_user',
                       http_method='POST')
+    @metrics.instrumented('create_user')
     def create_user(self, request):
         """
         Args:
@@ -48,11 +67,9 @@ class TicTacToeApi(remote.Service):
         Raises:
             endpoints.ConflictException: If the user already exists.
         """
-        if User.query(User.name == request.user_name).get():
+        if not directory.create_user(request.user_name, request.email):
             raise endpoints.ConflictException(
                     'A User with that name already exists!')
-        user = User(name=request.user_name, email=request.email)
-        user.put()
         return StringMessage(message='User {} created!'.format(
                 request.user_name))
 
@@ -61,15 +78,16 @@ class TicTacToeApi(remote.Service):
                       path='game',
                       name='new_game',
                       http_method='POST')
+    @metrics.instrumented('new_game')
     def new_game(self, request):
         """Creates new game"""
-        user = User.query(User.name == request.user_name).get()
+        user = directory.get_user(request.user_name)
         if not user:
             raise endpoints.NotFoundException(
                     'A User with that name %s does not exist!' % request.user_name)
         
         ### user b is another user online
-        opponent = User.query(User.name == request.opponent_name).get()
+        opponent = directory.get_user(request.opponent_name)
         if not opponent:
             raise endpoints.NotFoundException(
                     'A User with that name %s does not exist!' % request.opponent_name)
@@ -78,180 +96,265 @@ class TicTacToeApi(remote.Service):
             ### user is the one for the first move in the new game
             game = Game.new_game(user=user.key, user_tic=request.user_tic, 
               opponent=opponent.key, opponent_tic=request.opponent_tic, 
-              user_of_next_move=user.key)
-        except ValueError:
-            raise endpoints.BadRequestException('Value Error')
-
-        # Use a task queue to cache winning chance
-        taskqueue.add(url='/tasks/cache_winning_chance/')
-
-        taskqueue.add(url='/tasks/cache_winning_chance/', target="worker", 
-            params={'user_name':request.user_name}, name="cache-winning-chance")
-
-        GLOBAL_CURRENT_USER_NAME = request.user_name
-        
-        return game.to_form('Good luck playing Tic-Tac-Toe!')
+              user_of_next_move=user.key,
+              rows=request.rows, cols=request.cols, k=request.k)
+        except ValueError as error:
+            raise endpoints.BadRequestException(str(error))
+
+        ### the computer opens when it is the user of the game
+        if game.user_of_next_move == directory.get_computer().key:
+            moves.computer_reply(game)
+            game.put()
+
+        form = game.to_form('Good luck playing Tic-Tac-Toe!')
+        gamecache.store(form)
+        return form
+
+    @endpoints.method(request_message=endpoints.ResourceContainer(
+                          user_name=messages.StringField(1),),
+                      response_message=MatchForm,
+                      path='match',
+                      name='find_match',
+                      http_method='POST')
+    @metrics.instrumented('find_match')
+    def find_match(self, request):
+        """
+        Starts a game with a waiting player of a close rating, or waits
+        for one. A waiting user polls the ticket with poll_match.
+        """
+        user = directory.get_user(request.user_name)
+        if not user:
+            raise endpoints.NotFoundException(
+                    'A User with that name %s does not exist!' % request.user_name)
+        try:
+            ticket, status, game = matchmaking.find_match(user)
+        except matchmaking.MatchmakingBusyError:
+            raise endpoints.ConflictException(
+                    'Too many players are looking for a game, please try again')
+        if game is None:
+            return MatchForm(status=status, ticket=ticket,
+                             message='Waiting for an opponent')
+        gamecache.store(game.to_form(''))
+        return MatchForm(status=status, urlsafe_game_key=game.key.urlsafe(),
+                         message='Good luck playing Tic-Tac-Toe!')
+
+    @endpoints.method(request_message=endpoints.ResourceContainer(
+                          ticket=messages.StringField(1),),
+                      response_message=MatchForm,
+                      path='match/{ticket}',
+                      name='poll_match',
+                      http_method='GET')
+    @metrics.instrumented('poll_match')
+    def poll_match(self, request):
+        """Tells whether a waiting ticket was matched, from memcache alone"""
+        status, urlsafe_game_key = matchmaking.poll(request.ticket)
+        return MatchForm(status=status, ticket=request.ticket,
+                         urlsafe_game_key=urlsafe_game_key)
 
     @endpoints.method(request_message=GET_GAME_REQUEST,
                       response_message=GameForm,
                       path='game/{urlsafe_game_key}',
                       name='get_game',
                       http_method='GET')
+    @metrics.instrumented('get_game')
     def get_game(self, request):
-        """Return the current game"""
-        game = get_by_urlsafe(request.urlsafe_game_key, Game)
-        if game:
-            return game.to_form('Time to make a move!')
+        """Return the current game. Calls are rate limited per client
+        address."""
+        ratelimit.check('get_game', self.request_state.remote_address)
+        form = gamecache.get(request.urlsafe_game_key)
+        if form:
+            form.message = 'Time to make a move!'
+            return form
         else:
             raise endpoints.NotFoundException('Game not found!')
 
+    @endpoints.method(request_message=POLL_GAME_REQUEST,
+                      response_message=GamePollForm,
+                      path='game/{urlsafe_game_key}/poll',
+                      name='poll_game',
+                      http_method='GET')
+    @metrics.instrumented('poll_game')
+    def poll_game(self, request):
+        """
+        Tells whether a game changed since known_version, the version of
+        the game the client has. The game is only sent when it changed.
+        """
+        ratelimit.check('poll_game', self.request_state.remote_address)
+        version = gamecache.get_version(request.urlsafe_game_key)
+        if version is not None and version == request.known_version:
+            ### answered from memcache alone
+            return GamePollForm(changed=False, version=version)
+
+        form = gamecache.get(request.urlsafe_game_key)
+        if not form:
+            raise endpoints.NotFoundException('Game not found!')
+        if form.version == request.known_version:
+            return GamePollForm(changed=False, version=form.version)
+        form.message = 'Time to make a move!'
+        return GamePollForm(changed=True, version=form.version, game=form)
+
     @endpoints.method(request_message=MAKE_MOVE_REQUEST,
                       response_message=GameForm,
                       path='game/{urlsafe_game_key}',
                       name='make_move',
                       http_method='PUT')
+    @metrics.instrumented('make_move')
     def make_move(self, request):
         """Makes a move in tic-tac-toe"""
-        game = get_by_urlsafe(request.urlsafe_game_key, Game)
-        if game.game_over:
-            ##return game.to_form('Game already over!')
-            raise endpoints.ForbiddenException('Illegal action: Game is already over.')
-        if game.is_canceled:
-            ##return game.to_form('Game already canceled!')
-            raise endpoints.ForbiddenException('Illegal action: Game is already canceled.')
-            
-
-        if request.user_of_move!= game.user.get().name and request.user_of_move!= game.opponent.get().name:
-              raise endpoints.NotFoundException(
-                    'A User with that name %s are not players of current game' % request.user_of_move)
-
-        user_of_move_key = User.query(User.name == request.user_of_move)
-        user_of_move = user_of_move_key.get()
-        
-        if not user_of_move:
-            raise endpoints.NotFoundException(
-                    'User %s does not exist!' % request.user_of_move)
-
-        if game.user_of_next_move.get().name != request.user_of_move:
-            ## return game.to_form('User %s is not the game of the current move, %s please!' % (request.user_of_move, game.user_of_next_move.get().name))
-
-            raise endpoints.ForbiddenException('User %s is not the game of the current move, %s please!' % (request.user_of_move, game.user_of_next_move.get().name))
-            
-        
-        ### request.position is integer as defined in models.py
-        new_position = request.position
-        if new_position >= 9:
-            ##return game.to_form("position %s is out of the grid! Choose another position" % new_position)
-            raise endpoints.ForbiddenException("position %s is out of the grid! Choose another position" % new_position)
-
-        # board_state from string into char list
-        board_state_list = list(game.board_state)
-
-        free_indices = [match.start()
-                                for match in re.finditer("-", game.board_state)]
-        if new_position not in free_indices:
-            return game.to_form("position  %s  has already been taken! Choose another position" % new_position)
-
+        ratelimit.check('make_move', self.request_state.remote_address)
+        game_key = key_from_urlsafe(request.urlsafe_game_key)
+        game, message, players = moves.make_move(
+            _repository(), game_key, request.user_of_move, request.position)
+        form = game.to_form(message, players)
+        gamecache.store(form)
+        return form
+
+    @endpoints.method(request_message=BatchMoveForms,
+                      response_message=MoveResultForms,
+                      path='games/moves',
+                      name='make_moves',
+                      http_method='POST')
+    @metrics.instrumented('make_moves')
+    def make_moves(self, request):
+        """
+        Makes a batch of moves, each with the rules of make_move, and
+        returns one result per move. A move that fails does not fail the
+        others, its result has the error make_move would have raised.
+        """
+        if len(request.items) > moves.MAX_BATCH_MOVES:
+            raise endpoints.BadRequestException(
+                    'At most %d moves per batch' % moves.MAX_BATCH_MOVES)
+        items = [(item.urlsafe_game_key, item.user_of_move, item.position)
+                 for item in request.items]
+        ### each move takes a make_move token, the moves past the tokens
+        ### left fail
+        allowed = 0
+        if items:
+            allowed = ratelimit.check('make_move',
+                                      self.request_state.remote_address,
+                                      len(items))
+        results, players = moves.make_moves(_repository(), items[:allowed])
+        results.extend([(None, None, ratelimit.limited('make_move'))] *
+                       (len(items) - allowed))
 
-        if request.user_of_move == game.user.get().name:
-            board_state_list[new_position] = game.user_tic
-            game.user_of_next_move = game.opponent
-        else:
-            board_state_list[new_position] = game.opponent_tic
-            game.user_of_next_move = game.user
-
-        new_board_state = "".join(board_state_list)
-        game.board_state = new_board_state
-
-        ## after each move, record history
-        game.history += "(%s,%s)," %(request.user_of_move, request.position)
-
-        ### after every successful move, check the board board_state
-        ### check whether some one has won, or a tie
-        game_result = game.judge_game()
-        game.put()
-        if game_result["end"]: 
-            if game_result["result"] =="TIE":
-                return game.to_form("Game Over, it is a tie!")
+        forms = []
+        latest = {}
+        for item, (game, message, error) in zip(request.items, results):
+            form = MoveResultForm(urlsafe_game_key=item.urlsafe_game_key)
+            if error is not None:
+                form.error = str(error)
+                form.status = error.http_status
             else:
-                return game.to_form("Game Over, %s has won" % game_result["winner"])
-
-        
-        return game.to_form("Next move: %s" % game.user_of_next_move.get().name)
-
+                form.game = game.to_form(message, players)
+                latest[game.key] = form.game
+            forms.append(form)
+        gamecache.store_multi(latest.values())
+        return MoveResultForms(items=forms)
 
-    @endpoints.method(response_message=ScoreForms,
+    @endpoints.method(request_message=PAGE_REQUEST,
+                      response_message=ScoreForms,
                       path='scores',
                       name='get_scores',
                       http_method='GET')
+    @metrics.instrumented('get_scores')
     def get_scores(self, request):
-        """Return all scores"""
-        return ScoreForms(items=[score.to_form() for score in Score.query()])
+        """Return a page of scores"""
+        scores, next_cursor, more = fetch_page(
+            Score.query(), request.page_size, request.cursor)
+        forms = Score.to_forms(scores)
+        forms.next_cursor, forms.more = next_cursor, more
+        return forms
 
     @endpoints.method(
         request_message=endpoints.ResourceContainer(
-                user_name=messages.StringField(1),),
+                user_name=messages.StringField(1),
+                page_size=messages.IntegerField(2),
+                cursor=messages.StringField(3),),
         response_message=ScoreForms,
         path='scores/user/{user_name}',
         name='get_user_scores',
         http_method='GET')
+    @metrics.instrumented('get_user_scores')
     def get_user_scores(self, request):
-        """Returns a list of an individual User's scores"""
-        user = User.query(User.name == request.user_name).get()
+        """Returns a page of an individual User's scores"""
+        user = directory.get_user(request.user_name)
         if not user:
             raise endpoints.NotFoundException(
                     'A User with that name does not exist!')
-        scores = Score.query(Score.user == user.key)
-        return ScoreForms(items=[score.to_form() for score in scores])
+        scores, next_cursor, more = fetch_page(
+            Score.query(Score.user == user.key), request.page_size, request.cursor)
+        forms = Score.to_forms(scores)
+        forms.next_cursor, forms.more = next_cursor, more
+        return forms
 
    
 
-    @endpoints.method(response_message=GameForms,
+    @endpoints.method(request_message=PAGE_REQUEST,
+                      response_message=GameForms,
                       path='games',
                       name='get_games',
                       http_method='GET')
+    @metrics.instrumented('get_games')
     def get_games(self, request):
-        """List all the games"""
-        return GameForms(items=[game.to_form("") for game in Game.query()])
-
-    @endpoints.method(response_message=StringMessage,
+        """List a page of the games"""
+        games, next_cursor, more = fetch_page(
+            Game.query(), request.page_size, request.cursor)
+        forms = Game.to_forms(games)
+        forms.next_cursor, forms.more = next_cursor, more
+        return forms
+
+    @endpoints.method(request_message=PAGE_REQUEST,
+                      response_message=UserForms,
                       path='users',
                       name='get_users',
                       http_method='GET')
+    @metrics.instrumented('get_users')
     def get_users(self, request):
-        """List all the registered user name and email"""
-        users = User.query()
-        strs = ""
-        for user in users:
-            strs += "(%s, %s)" % (user.name, user.email)
-        return StringMessage(message = strs)
+        """List a page of the registered user name and email"""
+        ### only name and email are needed, read them from the index
+        users, next_cursor, more = fetch_page(
+            User.query(), request.page_size, request.cursor,
+            projection=[User.name, User.email])
+        return UserForms(items=[UserForm(user_name=user.name, email=user.email)
+                                for user in users],
+                         next_cursor=next_cursor, more=more)
 
 
     
     @endpoints.method(
         request_message=endpoints.ResourceContainer(
-        user_name=messages.StringField(1),),
+        user_name=messages.StringField(1),
+        page_size=messages.IntegerField(2),
+        cursor=messages.StringField(3),),
         response_message=GameForms,
         path='games/user/{user_name}/active',
         name='get_user_games',
         http_method='GET')
+    @metrics.instrumented('get_user_games')
     def get_user_games(self, request):
         """
-        Return all of a user's active games, not include canceled games.
+        Return a page of a user's active games, as user or as opponent,
+        not include canceled games.
         """
-        user = User.query(User.name == request.user_name).get()
+        user = directory.get_user(request.user_name)
         if not user:
             raise endpoints.NotFoundException(
                     'A User with that name %s does not exist!' % request.user_name)
-        
-        active_games = Game.query(Game.user == user.key).filter(Game.game_over != True)
-    
-        forms = []
-        for game in active_games:
-            if not game.is_canceled:
-                forms.append(game.to_form(""))
-        
-        return GameForms(items=forms)
+
+        ### the keys come from the index, the games from memcache when cached
+        keys, next_cursor, more = fetch_page(
+            Game.query(Game.participants == user.key,
+                       Game.status == GameStatus.ACTIVE.name),
+            request.page_size, request.cursor, keys_only=True)
+        if writebehind.ENABLED:
+            active_games = writebehind.get_games(keys)
+        else:
+            active_games = [game for game in ndb.get_multi(keys)
+                            if game is not None]
+
+        forms = Game.to_forms(active_games)
+        forms.next_cursor, forms.more = next_cursor, more
+        return forms
 
 
     @endpoints.method(
@@ -261,25 +364,16 @@ class TicTacToeApi(remote.Service):
         path='/games/{urlsafe_game_key}/cancel', 
         name='cancel_game',
         http_method='PUT')
+    @metrics.instrumented('cancel_game')
     def cancel_game(self, request):
         """
         This endpoint allows users to cancel a game in progress.
         """
-        game = get_by_urlsafe(request.urlsafe_game_key, Game)
-        if not game:
-            raise endpoints.NotFoundException('Game not found!')
-        
-        if game.is_canceled:
-            return game.to_form("You have already canceled the game!")
-        
-        if game.game_over:
-            return game.to_form("Game is already over!")
-
-        if not game.game_over and not game.is_canceled:
-            game.is_canceled = True
-        
-        game.put()
-        return game.to_form("You just canceled the game!")
+        game_key = key_from_urlsafe(request.urlsafe_game_key)
+        game, message = moves.cancel_game(_repository(), game_key)
+        form = game.to_form(message)
+        gamecache.store(form)
+        return form
         
 
     @endpoints.method(
@@ -288,113 +382,101 @@ class TicTacToeApi(remote.Service):
         path='/scores/total/top/{max_number}', 
         name='get_high_total_scores',
         http_method='GET')    
+    @metrics.instrumented('get_high_total_scores')
     def get_high_total_scores(self, request):
         """
         List the top high total score list, each item is (username, total_score). Total score is the sum of all the scores user earned.
         """
-        max_number = int(request.max_number)
-
-        scores = Score.query()
-        score_dict = defaultdict(int)
-
-        for score in scores:
-            score_dict[score.user.get().name] += score.user_score_to_int()
-        
-        score_dict = dict(score_dict)
-        score_list_sorted = sorted(score_dict.items(), key=operator.itemgetter(1), reverse=True)[0:max_number]
+        ### only the top LEADERBOARD_SIZE totals are kept
+        max_number = max(min(int(request.max_number or 0),
+                             leaderboard.LEADERBOARD_SIZE), 0)
 
-        forms = []
-        for item in score_list_sorted:
-            form = UserTotalScoreForm(user_name=item[0], total_score=item[1])
-            forms.append(form)
+        forms = [UserTotalScoreForm(user_name=user_name, total_score=total)
+                 for user_name, total in leaderboard.get_top(max_number)]
         
         return UserTotalScoreForms(items=forms)
     
     @endpoints.method(
         request_message=endpoints.ResourceContainer(max_number=messages.IntegerField(1),),
-        response_message=StringMessage,
+        response_message=UserRankingForms,
         path='/rankings/top/{max_number}', 
         name="get_user_rankings",
         http_method="GET")
+    @metrics.instrumented('get_user_rankings')
     def get_user_rankings(self, request):
         """
-        The ranking is defined by the ratio of sum(score)/(2*game)
+        The ranking is defined by the Elo rating of users who have finished a game
         """
-        scores = Score.query()
-        scores_list_dict = defaultdict(list)
-
-        for score in scores:
-            scores_list_dict[score.user.get().name].append(score.user_score_to_int())
-        
-        scores_list_dict = dict(scores_list_dict)
-        
-        performances_dict = {}
-        for k, v in scores_list_dict.iteritems():
-            performance = sum(v)/(2*len(v))
-            performances_dict[k]=performance
+        ### at most ratings.MAX_TOP users are listed
+        users = ratings.get_top(int(request.max_number or 0))
+        forms = [UserRankingForm(user_name=user.name, rating=user.rating,
+                                 rank=rank, games=user.rated_games or 0)
+                 for rank, user in enumerate(users, 1)]
+        return UserRankingForms(items=forms)
 
-        performances_list_sorted = sorted(performances_dict.items(), key=operator.itemgetter(1), reverse=True)[0: request.max_number]
-
-        strs = json.dumps(performances_list_sorted)
-
-        return StringMessage(message=strs)
+    @endpoints.method(
+        request_message=endpoints.ResourceContainer(
+        user_name=messages.StringField(1),),
+        response_message=UserRankingForm,
+        path='/rankings/user/{user_name}', 
+        name="get_user_rank",
+        http_method="GET")
+    @metrics.instrumented('get_user_rank')
+    def get_user_rank(self, request):
+        """
+        The rating of a user and its rank among rated users
+        """
+        user = directory.get_user(request.user_name)
+        if not user:
+            raise endpoints.NotFoundException(
+                    'A User with that name %s does not exist!' % request.user_name)
+        if user.rating is None:
+            raise endpoints.NotFoundException(
+                    'User %s has not finished a game yet' % request.user_name)
+        return UserRankingForm(user_name=user.name, rating=user.rating,
+                               rank=ratings.get_rank(user),
+                               games=user.rated_games or 0)
 
 
     @endpoints.method(
                 request_message=endpoints.ResourceContainer(
                 urlsafe_game_key=messages.StringField(1),),
-                response_message=StringMessage,
+                response_message=MoveForms,
                 path="games/{urlsafe_game_key}/history", 
                 name="get_game_history",
                 http_method="GET")
+    @metrics.instrumented('get_game_history')
     def get_game_history(self, request):
         """
-        The history of game, each move is record as (user_of_move, position_of_move)
+        The history of game, each move is (number, user_of_move, position_of_move)
         """
-        game = get_by_urlsafe(request.urlsafe_game_key, Game)
+        if writebehind.ENABLED:
+            game = writebehind.get_game(key_from_urlsafe(request.urlsafe_game_key))
+        else:
+            game = get_by_urlsafe(request.urlsafe_game_key, Game)
         if not game:
             raise endpoints.NotFoundException('Game not found!')
 
-        return StringMessage(message =game.history)
-
-
-    @staticmethod
-    def _cache_winning_chance(user_name):
-        """Populates memcache with the average moves remaining of Games"""
-        
-        ## the scores user earned when it is user in games
-        user_chance = 0
-        oppo_chance = 0
-
-        user_scores = Score.query(Game.user.get().name == user_name).fetch()
-        if user_scores:
-            total = 2*len(user_scores)
-            wins = sum([score.user_score_to_int() for score in user_scores])
-            user_chance = wins/float(total)
-        
-        ## score the user earned when it is the opponent in games
-        oppo_scores = Score.query(Game.user.get().name == GLOBAL_CURRENT_USER_NAME).fetch()
-        if user_scores:
-            total = 2*len(oppo_scores)
-            wins = sum([score.user_score_to_int() for score in oppo_scores])
-            oppo_chance = wins/float(total)
-        if user_chance == 0 or oppo_chance == 0:
-            chance = user_chance | oppo_chance
-        else:
-            change = (user_chance+oppo_chance)/2
+        players = get_referenced([game], 'user', 'opponent')
+        return MoveForms(items=[
+            MoveForm(number=number, user_name=players[player].name,
+                     position=position)
+            for number, (player, position) in enumerate(game.moves(), 1)])
 
-        print "Winning chance of {} is {}".format(GLOBAL_CURRENT_USER_NAME, chance)
-        memcache.set(MEMCACHE_WINNING_CHANCE,
-                         'The winning chance is {:.2f}'.format(chance))
 
     @endpoints.method(
-        response_message=StringMessage,
-        path='games/winning_chance/',
+        request_message=endpoints.ResourceContainer(
+        user_name=messages.StringField(1),),
+        response_message=WinningChanceForm,
+        path='games/winning_chance/{user_name}',
         name='get_winning_chance',
         http_method='GET')
+    @metrics.instrumented('get_winning_chance')
     def get_winning_chance(self, request):
-        """Get the cached average moves remaining"""
-        return StringMessage(message=memcache.get(MEMCACHE_WINNING_CHANCE) or '')
+        """Get the cached winning chance of a user"""
+        chance, games = chances.get_winning_chance(request.user_name)
+        return WinningChanceForm(user_name=request.user_name, chance=chance,
+                                 games=games)
 
 
 
@@ -0,0 +1,137 @@
+"""audit.py - Judges many boards at once with numpy.
+
+Boards are loaded into an (N, 9) int8 array of judge digits and judged
+against the 8 win lines in a few vectorized operations. It re-validates
+the stored results of Scores in bulk, by a chain of batch tasks (see
+taskchain.py), and can be called directly for analytics."""
+import logging
+
+import numpy as np
+from google.appengine.ext import ndb
+
+import judge
+import taskchain
+from models import Result, Score, ScoreAudit
+from utils import query_page
+
+BATCH_URL = '/tasks/audit_scores'
+BATCH_SIZE = 5000
+MAX_SAMPLES = 100
+EMPTY_CHAR = '-'
+## Scores recorded before they kept the user's mark were mostly played
+## with the default mark
+DEFAULT_USER_TIC = 'O'
+
+LINES = np.array(judge.WIN_LINES, dtype=np.intp)
+_EXPECTED = {
+    Result.WIN: judge.USER_WINS,
+    Result.LOSE: judge.OPPONENT_WINS,
+    Result.TIE: judge.TIE,
+}
+
+
+def to_cells(board_states, user_tics):
+    """Returns the (N, 9) int8 array of judge digits of N 9 character
+    boards, given the user's mark on each. Any other mark is the
+    opponent's."""
+    count = len(board_states)
+    chars = np.frombuffer(''.join(board_states), dtype=np.uint8)
+    chars = chars.reshape(count, judge.SIZE)
+    user = np.frombuffer(''.join(user_tics), dtype=np.uint8).reshape(count, 1)
+    cells = np.empty((count, judge.SIZE), dtype=np.int8)
+    cells.fill(judge.OPPONENT)
+    cells[chars == ord(EMPTY_CHAR)] = judge.EMPTY
+    cells[chars == user] = judge.USER
+    return cells
+
+
+def judge_boards(cells):
+    """Judges an (N, 9) array of judge digits like judge.outcome.
+    Returns an int8 array of N ONGOING, USER_WINS, OPPONENT_WINS or TIE."""
+    lines = cells[:, LINES]
+    complete = (lines[:, :, 0] == lines[:, :, 1]) & (lines[:, :, 1] == lines[:, :, 2])
+    user_line = (complete & (lines[:, :, 0] == judge.USER)).any(axis=1)
+    opponent_line = (complete & (lines[:, :, 0] == judge.OPPONENT)).any(axis=1)
+    full = (cells != judge.EMPTY).all(axis=1)
+
+    outcomes = np.empty(len(cells), dtype=np.int8)
+    outcomes.fill(judge.ONGOING)
+    outcomes[full] = judge.TIE
+    outcomes[user_line] = judge.USER_WINS
+    outcomes[opponent_line] = judge.OPPONENT_WINS
+    ## a board where both players have a line counts as a tie, as in judge
+    outcomes[user_line & opponent_line] = judge.TIE
+    return outcomes
+
+
+def check_scores(scores):
+    """Judges the boards of scores and compares them with their results.
+    Scores without their user's mark are only checked for a decisive
+    result, as the winner's mark is unknown. Scores of games on other
+    boards than 3 x 3 are not checked.
+    Returns:
+        (mismatched, legacy) where mismatched lists the scores whose
+        result does not match their board and legacy counts the scores
+        checked without their marks.
+    """
+    scores = [score for score in scores if len(score.board_state) == judge.SIZE]
+    valid = [len(score.user_tic or DEFAULT_USER_TIC) == 1 for score in scores]
+    mismatched = [score for score, ok in zip(scores, valid) if not ok]
+    scores = [score for score, ok in zip(scores, valid) if ok]
+    if not scores:
+        return mismatched, 0
+
+    legacy = np.array([score.user_tic is None for score in scores])
+    outcomes = judge_boards(to_cells(
+        [str(score.board_state) for score in scores],
+        [str(score.user_tic or DEFAULT_USER_TIC) for score in scores]))
+    expected = np.array([_EXPECTED[score.result] for score in scores], dtype=np.int8)
+
+    wrong = outcomes != expected
+    decisive = (outcomes == judge.USER_WINS) | (outcomes == judge.OPPONENT_WINS)
+    expected_decisive = expected != judge.TIE
+    wrong[legacy] = (decisive != expected_decisive)[legacy]
+    mismatched.extend(score for score, bad in zip(scores, wrong) if bad)
+    return mismatched, int(legacy.sum())
+
+
+def start():
+    """Starts an audit of every Score. Returns the id of the run."""
+    run = taskchain.new_run()
+    ScoreAudit(id=run).put()
+    taskchain.enqueue(BATCH_URL, 'audit', run, 0)
+    return run
+
+
+def audit_batch(run, page, cursor=None):
+    """Checks one batch of Scores and adds its counts to the run's
+    ScoreAudit, then hands the rest of the run to the next task.
+    Args:
+        run: Id of the audit run
+        page: Number of the batch in the run
+        cursor: Urlsafe cursor where the batch starts
+    """
+    scores, next_cursor = query_page(Score.query(), BATCH_SIZE, cursor)
+    mismatched, legacy = check_scores(scores)
+    for score in mismatched:
+        logging.warning('Score %s: %s does not match board %s', score.key.id(),
+                        score.result, score.board_state)
+    _record(run, page, len(scores), mismatched, legacy, next_cursor is None)
+    if next_cursor:
+        taskchain.enqueue(BATCH_URL, 'audit', run, page + 1, cursor=next_cursor)
+
+
+@ndb.transactional
+def _record(run, page, checked, mismatched, legacy, done):
+    audit = ScoreAudit.get_by_id(run)
+    if audit.pages != page:
+        ## a retried batch that was already recorded
+        return
+    audit.pages += 1
+    audit.checked += checked
+    audit.mismatched += len(mismatched)
+    audit.legacy += legacy
+    room = MAX_SAMPLES - len(audit.samples)
+    audit.samples.extend(score.key for score in mismatched[:max(room, 0)])
+    audit.done = done
+    audit.put()
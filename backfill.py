@@ -0,0 +1,75 @@
+"""backfill.py - Brings entities stored by older versions up to date.
+
+Game.participants and Game.status are only in the index once a game is
+written again. A chain of tasks pages through every game and rewrites
+each one in its own transaction, so a move made meanwhile is not
+overwritten. Another chain maps the name of every user created before
+names were ids to its key with a UserName, and records when it is done
+so that directory.py finds users by key alone from then on."""
+import logging
+
+from google.appengine.ext import ndb
+
+import taskchain
+from models import BackfillDone, Game, User, UserName
+from utils import query_page
+
+BATCH_URL = '/tasks/backfill_games'
+USER_NAMES_URL = '/tasks/backfill_user_names'
+BATCH_SIZE = 200
+USER_NAMES_DONE = ndb.Key(BackfillDone, 'user-names')
+
+
+def start():
+    """Starts a backfill run"""
+    run = taskchain.new_run()
+    taskchain.enqueue(BATCH_URL, 'backfill', run, 0)
+    return run
+
+
+@ndb.transactional_tasklet
+def _rewrite_async(key):
+    game = yield key.get_async()
+    if game is not None:
+        yield game.put_async()
+
+
+def backfill_batch(run, page, cursor=None):
+    """Rewrites one batch of games, then hands the rest of the run to the
+    next task.
+    Args:
+        run: Id of the backfill run
+        page: Number of the batch in the run
+        cursor: Urlsafe cursor where the batch starts
+    """
+    keys, next_cursor = query_page(Game.query(), BATCH_SIZE, cursor,
+                                   keys_only=True)
+    ndb.Future.wait_all([_rewrite_async(key) for key in keys])
+    if next_cursor:
+        taskchain.enqueue(BATCH_URL, 'backfill', run, page + 1,
+                          cursor=next_cursor)
+    else:
+        logging.info('Backfill %s of games done after %d batches', run, page + 1)
+
+
+def start_user_names():
+    """Starts a run mapping the names of users not keyed by name"""
+    run = taskchain.new_run()
+    taskchain.enqueue(USER_NAMES_URL, 'user-names', run, 0)
+    return run
+
+
+def user_names_batch(run, page, cursor=None):
+    """Maps the names of one batch of users, then hands the rest of the
+    run to the next task. Args as backfill_batch."""
+    users, next_cursor = query_page(User.query(), BATCH_SIZE, cursor)
+    ndb.Future.wait_all([
+        UserName.get_or_insert_async(user.name, user=user.key)
+        for user in users if user.key.id() != user.name])
+    if next_cursor:
+        taskchain.enqueue(USER_NAMES_URL, 'user-names', run, page + 1,
+                          cursor=next_cursor)
+    else:
+        BackfillDone(key=USER_NAMES_DONE).put()
+        logging.info('Backfill %s of user names done after %d batches',
+                     run, page + 1)
@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+"""benchmark.py - Measures the game engine and the API hot paths.
+
+Runs against local datastore, memcache and task queue stubs set up with
+the App Engine testbed, seeded with a synthetic dataset, and reports
+throughput, latency percentiles and API RPC counts per benchmark.
+
+    python benchmark.py --sdk ~/google-cloud-sdk/platform/google_appengine \\
+        --users 10000 --scores 1000000 --output bench.json
+"""
+import argparse
+import collections
+import json
+import os
+import random
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+class RpcCounter(object):
+    """Counts the API calls made through the apiproxy, by service.call"""
+    def __init__(self):
+        self.counts = collections.Counter()
+
+    def count(self, service, call, request, response):
+        self.counts['%s.%s' % (service, call)] += 1
+
+    def install(self):
+        from google.appengine.api import apiproxy_stub_map
+        ## hooks must be functions or bound methods, the SDK inspects them
+        apiproxy_stub_map.apiproxy.GetPreCallHooks().Append(
+            'benchmark', self.count)
+
+    def reset(self):
+        self.counts.clear()
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def measure(name, operation, iterations, counter):
+    """Runs operation(i) iterations times and returns its statistics"""
+    from google.appengine.ext import ndb
+    latencies = []
+    counter.reset()
+    began = time.time()
+    for i in range(iterations):
+        start = time.time()
+        operation(i)
+        latencies.append(time.time() - start)
+        ## measure each call cold, as a new request would be
+        ndb.get_context().clear_cache()
+    elapsed = time.time() - began
+    latencies.sort()
+    result = {
+        'name': name,
+        'iterations': iterations,
+        'seconds': elapsed,
+        'ops_per_second': iterations / elapsed if elapsed else 0.0,
+        'latency_ms': dict((label, 1000 * percentile(latencies, fraction))
+                           for label, fraction in (('p50', 0.5), ('p90', 0.9),
+                                                   ('p99', 0.99), ('max', 1.0))),
+        'rpcs_per_op': dict((call, count / float(iterations))
+                            for call, count in sorted(counter.counts.items())),
+    }
+    print '%-24s %10.1f ops/s  p50 %8.3f ms  p99 %8.3f ms  rpcs/op %s' % (
+        name, result['ops_per_second'], result['latency_ms']['p50'],
+        result['latency_ms']['p99'],
+        sum(result['rpcs_per_op'].values()))
+    return result
+
+
+def setup_testbed():
+    from google.appengine.datastore import datastore_stub_util
+    from google.appengine.ext import testbed
+    bed = testbed.Testbed()
+    bed.activate()
+    ## endpoints reads the app revision from the version id
+    bed.setup_env(current_version_id='benchmark.1', overwrite=True)
+    bed.init_datastore_v3_stub(
+        consistency_policy=datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+            probability=1))
+    bed.init_memcache_stub()
+    bed.init_taskqueue_stub(root_path=ROOT)
+    bed.init_app_identity_stub()
+    bed.init_mail_stub()
+    return bed
+
+
+def seed(users, scores, games, rng):
+    """Writes users, finished scores with their totals, rated users and
+    unfinished games"""
+    from datetime import date
+    from google.appengine.ext import ndb
+    import leaderboard
+    import ratings
+    from models import Game, RatingBucket, Result, Score, User
+
+    names = ['user%d' % i for i in range(users)]
+    keys = []
+    for start in range(0, users, 500):
+        batch = [User(id=name, name=name, email='%s@example.com' % name,
+                      rating=rng.gauss(ratings.INITIAL_RATING, 200),
+                      rated_games=1)
+                 for name in names[start:start + 500]]
+        keys.extend(ndb.put_multi(batch))
+
+    histogram = collections.Counter(
+        ratings.bucket_floor(user.rating) for user in ndb.get_multi(keys))
+    ndb.put_multi([RatingBucket(key=ratings.bucket_key(floor),
+                                floor=floor, count=count)
+                   for floor, count in histogram.items()])
+
+    results = (Result.WIN, Result.TIE, Result.LOSE)
+    for start in range(0, scores, 500):
+        ndb.put_multi([Score(user=rng.choice(keys), opponent=rng.choice(keys),
+                             date=date.today(), board_state='OOOXX----',
+                             result=rng.choice(results))
+                       for _ in range(min(500, scores - start))])
+    leaderboard.rebuild()
+
+    for start in range(0, games, 500):
+        batch = []
+        for _ in range(min(500, games - start)):
+            user, opponent = rng.sample(keys, 2)
+            batch.append(Game(user=user, opponent=opponent, user_tic='O',
+                              opponent_tic='X', board_state='---------',
+                              board_code=0, user_of_next_move=user))
+        ndb.put_multi(batch)
+    return names
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    counter = RpcCounter()
+    counter.install()
+
+    ## a cold start: importing the apps should make no API calls, the
+    ## warmup request prepares the in-process state
+    results = []
+    for module in ('api', 'main'):
+        started = time.time()
+        __import__(module)
+        results.append({'name': 'import_' + module,
+                        'seconds': time.time() - started,
+                        'rpcs': dict(counter.counts)})
+        counter.reset()
+        print '%-24s %10.3f s' % ('import_' + module, results[-1]['seconds'])
+    import api
+    import directory
+    import judge
+    import main
+    import models
+    import moves
+    import ratelimit
+    import repository
+    import webapp2
+    from protorpc import remote
+    warmup = main.Warmup(webapp2.Request.blank('/_ah/warmup'), webapp2.Response())
+    results.append(measure('warmup', lambda i: warmup.get(), 1, counter))
+
+    print 'seeding %s users, %s scores, %s games' % (args.users, args.scores, args.games)
+    names = seed(args.users, args.scores, args.games, rng)
+    service = api.TicTacToeApi()
+    ## the rate limits key on the client address, and the buckets are
+    ## still read and written but never run dry
+    service.initialize_request_state(
+        remote.HttpRequestState(remote_address='127.0.0.1'))
+    for endpoint in ratelimit.LIMITS:
+        ratelimit.LIMITS[endpoint] = (10 ** 9, 10 ** 9)
+
+    codes = [rng.randrange(judge.STATES) for _ in range(10000)]
+    judge.outcomes()
+    results.append(measure('judge.outcome', lambda i: judge.outcome(codes[i % len(codes)]),
+                           args.iterations * 100, counter))
+
+    computer = directory.get_computer()
+    game = models.Game(user=computer.key, opponent=computer.key,
+                       user_tic='O', opponent_tic='X', board_state='---------')
+    def judge_game(i):
+        game.board_code = codes[i % len(codes)]
+        game.judge_game()
+    results.append(measure('Game.judge_game', judge_game, args.iterations * 100, counter))
+
+    ## games against the computer, which replies in the same request
+    new_game = api.NEW_GAME_REQUEST.combined_message_class
+    make_move = api.MAKE_MOVE_REQUEST.combined_message_class
+    state = {}
+    def play(i):
+        form = state.get('game')
+        if form is None:
+            form = service.new_game(new_game(
+                user_name=rng.choice(names), opponent_name=models.COMPUTER_NAME))
+        position = rng.choice(judge.free_positions(judge.encode(
+            form.board_state, form.user_tic, form.opponent_tic)))
+        form = service.make_move(make_move(urlsafe_game_key=form.urlsafe_key,
+                                           user_of_move=form.user_of_next_move,
+                                           position=position))
+        state['game'] = None if form.game_over else form
+    results.append(measure('make_move', play, args.iterations, counter))
+
+    ## the same rules against the in-memory repository, without API calls
+    memory = repository.MemoryRepository()
+    player = memory.add_user('player')
+    def play_in_memory(i):
+        game_key = state.get('memory')
+        if game_key is None:
+            game_key = memory.add_game(models.Game.build(
+                user=player.key, user_tic='O', opponent=memory.computer_key(),
+                opponent_tic='X', user_of_next_move=player.key))
+        game = memory.get_game(game_key)
+        position = rng.choice(judge.free_positions(game.board))
+        game, _, _ = moves.play_move(memory, game_key, player.name, position)
+        state['memory'] = None if game.game_over else game_key
+    results.append(measure('play_move (memory)', play_in_memory,
+                           args.iterations * 10, counter))
+
+    top = endpoints_request(service.get_high_total_scores)
+    results.append(measure('get_high_total_scores',
+                           lambda i: service.get_high_total_scores(top(max_number=10)),
+                           args.iterations, counter))
+    rankings = endpoints_request(service.get_user_rankings)
+    results.append(measure('get_user_rankings',
+                           lambda i: service.get_user_rankings(rankings(max_number=10)),
+                           args.iterations, counter))
+    rank = endpoints_request(service.get_user_rank)
+    results.append(measure('get_user_rank',
+                           lambda i: service.get_user_rank(rank(user_name=rng.choice(names))),
+                           args.iterations, counter))
+    page = api.PAGE_REQUEST.combined_message_class
+    results.append(measure('get_scores', lambda i: service.get_scores(page()),
+                           args.iterations, counter))
+    results.append(measure('get_games', lambda i: service.get_games(page()),
+                           args.iterations, counter))
+    return results
+
+
+def endpoints_request(method):
+    """Returns the request class an endpoints method expects"""
+    return method.remote.request_type
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sdk', default=os.environ.get('APPENGINE_SDK'),
+                        help='path of the App Engine SDK (google_appengine)')
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--scores', type=int, default=2000)
+    parser.add_argument('--games', type=int, default=200)
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the results as JSON here')
+    args = parser.parse_args()
+
+    if args.sdk:
+        sys.path.insert(0, args.sdk)
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+    sys.path.insert(0, ROOT)
+
+    bed = setup_testbed()
+    try:
+        results = run(args)
+    finally:
+        bed.deactivate()
+
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({'args': vars(args), 'results': results}, output,
+                      indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
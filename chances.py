@@ -0,0 +1,91 @@
+"""chances.py - Per user winning chances, precomputed in the background.
+
+The chance of a user is the share of the points it could have earned
+that it did earn (a win is worth 2, a tie 1), read from the user's total
+score aggregate. Recomputations are debounced: each user gets at most
+one task per DEBOUNCE_SECONDS, named after the user and the time bucket,
+and the result is cached per user in memcache.
+
+The chance starts from a prior, the chance of the PRIOR_POLICY self-play
+policy against PRIOR_OPPONENT in priors.json (see selfplay.py), which
+counts as PRIOR_GAMES games. New users get the prior itself."""
+import hashlib
+import json
+import logging
+import os
+import time
+
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+
+import leaderboard
+
+DEBOUNCE_SECONDS = 60
+CACHE_URL = '/tasks/cache_winning_chance'
+MEMCACHE_WINNING_CHANCE = 'WINNING_CHANCE:'
+## the prior when priors.json cannot be read
+DEFAULT_CHANCE = 0.5
+PRIORS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           'priors.json')
+## new users are assumed to play like the greedy policy against the computer
+PRIOR_POLICY = 'greedy'
+PRIOR_OPPONENT = 'perfect'
+PRIOR_GAMES = 5
+
+_prior = None
+
+
+def prior_chance():
+    """The chance of PRIOR_POLICY against PRIOR_OPPONENT, as often first
+    as second, read from priors.json once per process"""
+    global _prior
+    if _prior is None:
+        try:
+            with open(PRIORS_PATH) as priors:
+                pairs = json.load(priors)['pairs']
+            _, wins, _, ties = pairs['%s-%s' % (PRIOR_POLICY, PRIOR_OPPONENT)]['']
+            _, _, second_wins, second_ties = pairs[
+                '%s-%s' % (PRIOR_OPPONENT, PRIOR_POLICY)]['']
+            _prior = (wins + ties / 2.0 + second_wins + second_ties / 2.0) / 2
+        except (IOError, ValueError, KeyError):
+            logging.exception('Could not read the priors, using %s',
+                              DEFAULT_CHANCE)
+            _prior = DEFAULT_CHANCE
+    return _prior
+
+
+def schedule(user_name):
+    """Enqueues a recomputation of the chance of a user, unless one is
+    already pending for the current time bucket"""
+    now = time.time()
+    bucket = int(now // DEBOUNCE_SECONDS)
+    ## task names only allow letters, digits, - and _
+    name = 'winning-chance-%s-%d' % (
+        hashlib.md5(user_name.encode('utf-8')).hexdigest(), bucket)
+    try:
+        ## run at the end of the bucket to pick up every game of it
+        taskqueue.add(url=CACHE_URL, params={'user_name': user_name},
+                      name=name,
+                      countdown=(bucket + 1) * DEBOUNCE_SECONDS - now)
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        pass
+
+
+def cache_winning_chance(user_name):
+    """Computes the chance of a user from its aggregates and the prior,
+    and caches it"""
+    total, games = leaderboard.get_total(user_name)
+    if not games:
+        return
+    chance = ((total + 2 * PRIOR_GAMES * prior_chance()) /
+              (2.0 * (games + PRIOR_GAMES)))
+    memcache.set(MEMCACHE_WINNING_CHANCE + user_name, (chance, games))
+
+
+def get_winning_chance(user_name):
+    """Returns (chance, games) from the cache, or (prior chance, 0) if
+    the user has no cached chance"""
+    cached = memcache.get(MEMCACHE_WINNING_CHANCE + user_name)
+    if cached is None:
+        return prior_chance(), 0
+    return cached
@@ -0,0 +1,209 @@
+"""directory.py - Looks users up by name.
+
+New users are stored with their name as the entity id, and users created
+before that have a UserName entity mapping the name to their key, written
+by backfill.py, so a lookup is a key get. Until the backfill has recorded
+that it is done, a name found by neither key is also queried, and a hit
+writes its mapping. Users are cached in a bounded in-process LRU backed
+by memcache."""
+import collections
+import threading
+import time
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+import backfill
+import models
+
+LOCAL_CACHE_SIZE = 1000
+## other instances may update a user, keep local copies short lived
+LOCAL_CACHE_SECONDS = 60
+MEMCACHE_SECONDS = 60 * 60
+MEMCACHE_PREFIX = 'user:'
+
+
+class LRUCache(object):
+    """A thread safe dict bounded in size, whose entries expire"""
+    def __init__(self, size, seconds):
+        self.size = size
+        self.seconds = seconds
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            value, expires = entry
+            if expires < time.time():
+                return None
+            self._entries[key] = entry
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (value, time.time() + self.seconds)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_local = LRUCache(LOCAL_CACHE_SIZE, LOCAL_CACHE_SECONDS)
+_computer = None
+_computer_lock = threading.Lock()
+## set once the backfill of UserName mappings is known to be done
+_names_mapped = False
+
+
+@ndb.tasklet
+def _load_async(name):
+    """Reads a user from the datastore by key, through its UserName for a
+    user created before names were keys (mapped by backfill.py). Falls
+    back to a query by name until the backfill is done."""
+    global _names_mapped
+    keys = [ndb.Key(models.User, name), ndb.Key(models.UserName, name)]
+    if not _names_mapped:
+        keys.append(backfill.USER_NAMES_DONE)
+    entities = yield ndb.get_multi_async(keys)
+    user, mapping = entities[:2]
+    if user is None and mapping is not None:
+        user = yield mapping.user.get_async()
+    if _names_mapped or user is not None:
+        raise ndb.Return(user)
+    if entities[2] is not None:
+        _names_mapped = True
+        raise ndb.Return(None)
+    user = yield models.User.query(models.User.name == name).get_async()
+    if user is not None:
+        yield models.UserName.get_or_insert_async(name, user=user.key)
+    raise ndb.Return(user)
+
+
+def _load(name):
+    return _load_async(name).get_result()
+
+
+@ndb.tasklet
+def _get_user_async(name):
+    user = _local.get(name)
+    if user is not None:
+        raise ndb.Return(user)
+    context = ndb.get_context()
+    user = yield context.memcache_get(MEMCACHE_PREFIX + name)
+    if user is None:
+        user = yield _load_async(name)
+        if user is None:
+            raise ndb.Return(None)
+        yield context.memcache_set(MEMCACHE_PREFIX + name, user,
+                                   time=MEMCACHE_SECONDS)
+    _local.set(name, user)
+    raise ndb.Return(user)
+
+
+def _get_user(name):
+    return _get_user_async(name).get_result()
+
+
+@ndb.tasklet
+def get_user_async(name):
+    """Returns a future of the User with the given name or None"""
+    user = yield _get_user_async(name)
+    if user is None and name == models.COMPUTER_NAME:
+        ## not created yet on a new datastore
+        user = get_computer()
+    raise ndb.Return(user)
+
+
+def get_user(name):
+    """Returns the User with the given name or None"""
+    return get_user_async(name).get_result()
+
+
+def get_users(names):
+    """Returns a dict of name to User of the names that exist, reading
+    the ones not cached in a single batch"""
+    users = {}
+    missing = []
+    for name in set(names):
+        user = _local.get(name)
+        if user is None:
+            missing.append(name)
+        else:
+            users[name] = user
+    if missing:
+        cached = memcache.get_multi(missing, key_prefix=MEMCACHE_PREFIX)
+        found = dict(cached)
+        missing = [name for name in missing if name not in cached]
+        loaded = ndb.get_multi([ndb.Key(models.User, name) for name in missing])
+        for name, user in zip(missing, loaded):
+            if user is None:
+                user = _load(name)
+            if user is not None:
+                found[name] = user
+        loaded = dict((name, user) for name, user in found.iteritems()
+                      if name not in cached)
+        if loaded:
+            memcache.set_multi(loaded, key_prefix=MEMCACHE_PREFIX,
+                               time=MEMCACHE_SECONDS)
+        for name, user in found.iteritems():
+            _local.set(name, user)
+        users.update(found)
+    return users
+
+
+def create_user(name, email=None):
+    """Creates a user keyed by its name.
+    Returns:
+        The new User, or None if the name is taken.
+    """
+    if not _names_mapped and _load(name) is not None:
+        ## a user created before names were keys, not mapped yet
+        return None
+
+    @ndb.transactional(xg=True)
+    def _create():
+        if any(ndb.get_multi([ndb.Key(models.User, name),
+                              ndb.Key(models.UserName, name)])):
+            return None
+        user = models.User(id=name, name=name, email=email)
+        user.put()
+        return user
+
+    user = _create()
+    if user is not None:
+        invalidate(name)
+    return user
+
+
+def get_computer():
+    """Returns the computer player, created by the first instance that
+    needs it and kept for the life of the process. Only its key is
+    meant to be used, its rating is not kept up to date. Until the
+    backfill of names is done, _get_user finds a computer stored before
+    names were keys, so it is not created twice."""
+    global _computer
+    if _computer is None:
+        with _computer_lock:
+            if _computer is None:
+                computer = _get_user(models.COMPUTER_NAME)
+                if computer is None:
+                    computer = models.User.get_or_insert(
+                        models.COMPUTER_NAME, name=models.COMPUTER_NAME)
+                _computer = computer
+    return _computer
+
+
+def invalidate(name):
+    """Drops a user from the caches, call after the user is written"""
+    _local.delete(name)
+    memcache.delete(MEMCACHE_PREFIX + name)
@@ -0,0 +1,225 @@
+"""export.py - Streaming export of Scores and Games for offline analytics.
+
+An export is a generator pipeline: pages of a kind read with cursors,
+the user names of each page resolved with one batch get, rows, and
+gzipped NDJSON or CSV chunks of CHUNK_PAGES pages. Only one chunk is in
+memory at a time. After each chunk is written, the cursor it ends at is
+checkpointed in the ExportJob, so an export interrupted anywhere resumes
+from its last chunk. Jobs run as a chain of tasks writing ExportChunk
+entities, or locally with export_local.py writing files."""
+import csv
+import gzip
+import io
+import json
+import os
+import time
+
+from google.appengine.ext import ndb
+
+import taskchain
+from directory import LRUCache
+from models import ExportChunk, ExportJob, Game, Score
+from utils import query_page
+
+STEP_URL = '/tasks/export'
+PAGE_SIZE = 500
+CHUNK_PAGES = 10
+## a task stops after the first chunk written past this time
+TIME_BUDGET_SECONDS = 60
+NAME_CACHE_SIZE = 10000
+NAME_CACHE_SECONDS = 60 * 60
+FORMATS = ('ndjson', 'csv')
+
+
+def _score_row(score, names):
+    return {
+        'key': score.key.urlsafe(),
+        'user': names.get(score.user),
+        'opponent': names.get(score.opponent),
+        'date': str(score.date),
+        'result': score.result.name,
+        'board_state': score.board_state,
+        'user_tic': score.user_tic,
+    }
+
+
+def _game_row(game, names):
+    return {
+        'key': game.key.urlsafe(),
+        'user': names.get(game.user),
+        'opponent': names.get(game.opponent),
+        'user_tic': game.user_tic,
+        'opponent_tic': game.opponent_tic,
+        'rows': game.rows,
+        'cols': game.cols,
+        'k': game.k,
+        'board_state': game.render_board(),
+        'game_over': game.game_over,
+        'is_canceled': game.is_canceled,
+        'moves': ' '.join(str(position) for _, position in game.moves()),
+    }
+
+
+## model, the properties referencing users, row of an entity and its fields
+KINDS = {
+    'score': (Score, ('user', 'opponent'), _score_row,
+              ('key', 'user', 'opponent', 'date', 'result', 'board_state',
+               'user_tic')),
+    'game': (Game, ('user', 'opponent'), _game_row,
+             ('key', 'user', 'opponent', 'user_tic', 'opponent_tic', 'rows',
+              'cols', 'k', 'board_state', 'game_over', 'is_canceled',
+              'moves')),
+}
+
+
+def pages(query, cursor=None):
+    """Yields (entities, urlsafe cursor after them or None) per page"""
+    while True:
+        entities, cursor = query_page(query, PAGE_SIZE, cursor)
+        yield entities, cursor
+        if cursor is None:
+            return
+
+
+def named(entity_pages, properties):
+    """Adds to each page a dict of the user keys its properties reference
+    to the user's name, read with one batch get of the users not seen on
+    recent pages"""
+    names = LRUCache(NAME_CACHE_SIZE, NAME_CACHE_SECONDS)
+    for entities, cursor in entity_pages:
+        keys = set(getattr(entity, prop) for entity in entities
+                   for prop in properties)
+        keys.discard(None)
+        page_names = {}
+        missing = []
+        for key in keys:
+            name = names.get(key)
+            if name is None:
+                missing.append(key)
+            else:
+                page_names[key] = name
+        for key, user in zip(missing, ndb.get_multi(missing)):
+            page_names[key] = user.name if user is not None else ''
+            names.set(key, page_names[key])
+        yield entities, page_names, cursor
+
+
+def rows(named_pages, to_row):
+    """Yields (rows, cursor) per page"""
+    for entities, names, cursor in named_pages:
+        yield [to_row(entity, names) for entity in entities], cursor
+
+
+def chunks(row_pages):
+    """Yields (rows, cursor) of CHUNK_PAGES pages at a time"""
+    chunk = []
+    count = 0
+    cursor = None
+    for page_rows, cursor in row_pages:
+        chunk.extend(page_rows)
+        count += 1
+        if count == CHUNK_PAGES and cursor is not None:
+            yield chunk, cursor
+            chunk = []
+            count = 0
+    if count:
+        yield chunk, cursor
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+    return value
+
+
+def encode(chunk, fields, fmt):
+    """Returns the gzipped NDJSON or CSV, with a header, of a chunk"""
+    data = io.BytesIO()
+    with gzip.GzipFile(fileobj=data, mode='wb') as out:
+        if fmt == 'csv':
+            writer = csv.writer(out)
+            writer.writerow(fields)
+            for row in chunk:
+                writer.writerow([_csv_value(row[field]) for field in fields])
+        else:
+            for row in chunk:
+                out.write(json.dumps(row, sort_keys=True))
+                out.write('\n')
+    return data.getvalue()
+
+
+class EntitySink(object):
+    """Stores the chunks of a job as ExportChunk entities under it, with
+    their number as id"""
+    def write(self, job, number, data, count):
+        ExportChunk(parent=job.key, id=number, data=data, rows=count).put()
+
+
+class FileSink(object):
+    """Writes the chunks of a job as files in a directory, named after
+    their number"""
+    def __init__(self, directory):
+        self.directory = directory
+
+    def write(self, job, number, data, count):
+        name = '%s-%s-%05d.%s.gz' % (job.kind, job.key.id(), number, job.format)
+        path = os.path.join(self.directory, name)
+        with open(path + '.tmp', 'wb') as out:
+            out.write(data)
+        os.rename(path + '.tmp', path)
+
+
+def create(kind, fmt):
+    """Creates the ExportJob of a new export. Returns its id."""
+    if kind not in KINDS:
+        raise ValueError('Unknown kind %s' % kind)
+    if fmt not in FORMATS:
+        raise ValueError('Unknown format %s' % fmt)
+    run = '%s-%s' % (kind, taskchain.new_run())
+    ExportJob(id=run, kind=kind, format=fmt).put()
+    return run
+
+
+def run_job(run, sink, seconds=None):
+    """Exports the chunks of a job from its checkpoint, until the end or
+    until seconds have passed. Returns the ExportJob."""
+    began = time.time()
+    job = ExportJob.get_by_id(run)
+    if job.done:
+        return job
+    model, properties, to_row, fields = KINDS[job.kind]
+    pipeline = chunks(rows(named(pages(model.query(), job.cursor),
+                                 properties), to_row))
+    for chunk, cursor in pipeline:
+        ## chunks are numbered from 1 in every sink
+        sink.write(job, job.chunks + 1, encode(chunk, fields, job.format),
+                   len(chunk))
+        job.chunks += 1
+        job.rows += len(chunk)
+        job.cursor = cursor
+        job.done = cursor is None
+        job.put()
+        if seconds is not None and time.time() - began > seconds:
+            break
+    else:
+        ## the whole kind was exported, also when it was empty
+        job.done = True
+        job.put()
+    return job
+
+
+def start(kind, fmt):
+    """Starts an export as a chain of tasks. Returns the id of the job."""
+    run = create(kind, fmt)
+    taskchain.enqueue(STEP_URL, 'export', run, 0)
+    return run
+
+
+def export_step(run, step):
+    """Exports chunks of a job for a task's time budget, then hands the
+    rest of the job to the next task"""
+    job = run_job(run, EntitySink(), TIME_BUDGET_SECONDS)
+    if not job.done:
+        taskchain.enqueue(STEP_URL, 'export', run, step + 1)
@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+"""export_local.py - Exports Scores or Games to local files.
+
+Runs the export pipeline of export.py against a local datastore stub, e.g.
+the datastore file of dev_appserver, and writes its gzipped chunks to a
+directory. The checkpoint is kept in the stub, so running it again with
+--run resumes an interrupted export.
+
+    python export_local.py --sdk ~/google-cloud-sdk/platform/google_appengine \\
+        --datastore_file /tmp/datastore.db --kind score --format csv --output out
+"""
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+def setup_testbed(datastore_file, app_id):
+    from google.appengine.ext import testbed
+    bed = testbed.Testbed()
+    bed.setup_env(app_id=app_id, overwrite=True)
+    bed.activate()
+    bed.init_datastore_v3_stub(datastore_file=datastore_file,
+                               save_changes=True, use_sqlite=True)
+    bed.init_memcache_stub()
+    bed.init_taskqueue_stub(root_path=ROOT)
+    return bed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sdk', default=os.environ.get('APPENGINE_SDK'),
+                        help='path of the App Engine SDK (google_appengine)')
+    parser.add_argument('--datastore_file', required=True,
+                        help='sqlite datastore file of dev_appserver')
+    parser.add_argument('--app_id', default='dev~fullstack-design-a-game')
+    parser.add_argument('--kind', choices=('score', 'game'), default='score')
+    parser.add_argument('--format', choices=('ndjson', 'csv'), default='ndjson')
+    parser.add_argument('--run', help='resume this export instead of starting one')
+    parser.add_argument('--output', default='.', help='directory of the chunks')
+    args = parser.parse_args()
+
+    if args.sdk:
+        sys.path.insert(0, args.sdk)
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+    sys.path.insert(0, ROOT)
+
+    bed = setup_testbed(args.datastore_file, args.app_id)
+    try:
+        import export
+        run = args.run or export.create(args.kind, args.format)
+        job = export.run_job(run, export.FileSink(args.output))
+        print 'export %s: %d rows in %d chunks' % (run, job.rows, job.chunks)
+    finally:
+        bed.deactivate()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""gamecache.py - Versioned read-through cache of rendered games.
+
+The GameForm of a game is cached in memcache under its key and version,
+and a small pointer holds the latest version of each game. Clients
+polling a game send the version they know and are answered from the
+pointer alone while it has not changed."""
+from google.appengine.api import memcache
+from protorpc import protojson
+
+import writebehind
+from models import Game, GameForm
+from utils import get_by_urlsafe, key_from_urlsafe
+
+MEMCACHE_VERSION = 'game_version:'
+MEMCACHE_FORM = 'game_form:%s:%d'
+CAS_RETRIES = 5
+
+
+def _advance(versions):
+    """Moves the version pointers of games forward, never back.
+    Args:
+        versions: dict of urlsafe game key to its new version.
+    Returns:
+        The pointer keys that could not be moved.
+    """
+    client = memcache.Client()
+    pending = dict((MEMCACHE_VERSION + urlsafe, version)
+                   for urlsafe, version in versions.iteritems())
+    for _ in range(CAS_RETRIES):
+        if not pending:
+            break
+        cached = client.get_multi(pending.keys(), for_cas=True)
+        missing = dict((key, version) for key, version in pending.iteritems()
+                       if key not in cached)
+        older = dict((key, version) for key, version in pending.iteritems()
+                     if key in cached and cached[key] < version)
+        failed = []
+        if missing:
+            failed.extend(client.add_multi(missing))
+        if older:
+            failed.extend(client.cas_multi(older))
+        pending = dict((key, pending[key]) for key in failed)
+    return pending.keys()
+
+
+def store_multi(forms):
+    """Caches the forms of games at their version, without their message,
+    in a few memcache calls. A pointer that could not be moved to the new
+    version is dropped, so polls never answer unchanged from a version
+    older than the game."""
+    encoded = {}
+    for form in forms:
+        message = form.message
+        form.message = ''
+        encoded[MEMCACHE_FORM % (form.urlsafe_key, form.version)] = (
+            protojson.encode_message(form))
+        form.message = message
+    if not encoded:
+        return
+    not_stored = set(memcache.set_multi(encoded))
+    versions = dict((form.urlsafe_key, form.version) for form in forms
+                    if MEMCACHE_FORM % (form.urlsafe_key, form.version)
+                    not in not_stored)
+    stale = _advance(versions)
+    stale.extend(MEMCACHE_VERSION + form.urlsafe_key for form in forms
+                 if form.urlsafe_key not in versions)
+    if stale:
+        memcache.delete_multi(stale)
+
+
+def store(form):
+    """Caches the form of a game at form.version, see store_multi"""
+    store_multi([form])
+
+
+def get_version(urlsafe):
+    """Returns the latest cached version of a game or None"""
+    return memcache.get(MEMCACHE_VERSION + urlsafe)
+
+
+def get_form(urlsafe, version=None):
+    """Returns the cached form of a game at its latest version or None"""
+    if version is None:
+        version = get_version(urlsafe)
+        if version is None:
+            return None
+    encoded = memcache.get(MEMCACHE_FORM % (urlsafe, version))
+    if encoded is None:
+        return None
+    return protojson.decode_message(GameForm, encoded)
+
+
+def get(urlsafe):
+    """Returns the form of a game from the cache, or read from the
+    datastore and cached. Returns None if there is no such game."""
+    form = get_form(urlsafe)
+    if form is None:
+        if writebehind.ENABLED:
+            game = writebehind.get_game(key_from_urlsafe(urlsafe))
+        else:
+            game = get_by_urlsafe(urlsafe, Game)
+        if not game:
+            return None
+        form = game.to_form('')
+        store(form)
+    return form
@@ -0,0 +1,114 @@
+"""judge.py - Constant-time judging of tic-tac-toe boards.
+
+A 3X3 board is encoded as a base-3 integer: cell i contributes
+digit * 3**i, where digit 0 is an empty cell, 1 is a mark of the game's
+user and 2 is a mark of the opponent. The outcome of every one of the 3^9
+possible boards is computed once per instance and looked up afterwards."""
+import threading
+
+SIZE = 9
+STATES = 3 ** SIZE
+POW3 = tuple(3 ** i for i in range(SIZE))
+
+EMPTY = 0
+USER = 1
+OPPONENT = 2
+
+### outcome of a board
+ONGOING = 0
+USER_WINS = 1
+OPPONENT_WINS = 2
+TIE = 3
+
+WIN_LINES = ((0, 1, 2), (3, 4, 5), (6, 7, 8),
+             (0, 3, 6), (1, 4, 7), (2, 5, 8),
+             (0, 4, 8), (2, 4, 6))
+
+EMPTY_BOARD = 0
+
+_outcomes = None
+_lock = threading.Lock()
+
+
+def digits(code):
+    """Returns the 9 cell digits of an encoded board"""
+    cells = []
+    for _ in range(SIZE):
+        cells.append(code % 3)
+        code //= 3
+    return cells
+
+
+def _judge_cells(cells):
+    """Judges a board given as a list of cell digits, the slow way"""
+    user_line = opponent_line = False
+    for a, b, c in WIN_LINES:
+        if cells[a] != EMPTY and cells[a] == cells[b] == cells[c]:
+            if cells[a] == USER:
+                user_line = True
+            else:
+                opponent_line = True
+    if user_line and opponent_line:
+        ## both players have a line, it can only happen on a corrupted
+        ## board, count it as a tie as the old magic square check did
+        return TIE
+    if user_line:
+        return USER_WINS
+    if opponent_line:
+        return OPPONENT_WINS
+    if EMPTY not in cells:
+        return TIE
+    return ONGOING
+
+
+def outcomes():
+    """Returns the table of outcomes of all boards, built on first use"""
+    global _outcomes
+    if _outcomes is None:
+        with _lock:
+            if _outcomes is None:
+                table = bytearray(STATES)
+                for code in range(STATES):
+                    table[code] = _judge_cells(digits(code))
+                _outcomes = table
+    return _outcomes
+
+
+def outcome(code):
+    """Returns ONGOING, USER_WINS, OPPONENT_WINS or TIE for a board"""
+    return outcomes()[code]
+
+
+def cell(code, position):
+    """Returns the digit stored in a cell of an encoded board"""
+    return (code // POW3[position]) % 3
+
+
+def is_free(code, position):
+    return 0 <= position < SIZE and cell(code, position) == EMPTY
+
+
+def place(code, position, mark):
+    """Returns the board with mark placed on a free cell"""
+    return code + mark * POW3[position]
+
+
+def free_positions(code):
+    return [i for i, digit in enumerate(digits(code)) if digit == EMPTY]
+
+
+def encode(board_state, user_tic, opponent_tic):
+    """Encodes a 9 character board string, e.g. '-O--XO--X'"""
+    code = 0
+    for i, char in enumerate(board_state):
+        if char == user_tic:
+            code += USER * POW3[i]
+        elif char == opponent_tic:
+            code += OPPONENT * POW3[i]
+    return code
+
+
+def render(code, user_tic, opponent_tic):
+    """Renders an encoded board into its 9 character string"""
+    chars = ('-', user_tic, opponent_tic)
+    return "".join(chars[digit] for digit in digits(code))
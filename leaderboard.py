@@ -0,0 +1,160 @@
+"""leaderboard.py - Total scores kept up to date as games end.
+
+Each user's total score is a sharded counter (models.TotalScoreShard), so
+the players of many concurrent games do not contend on one entity. The
+top LEADERBOARD_SIZE totals are kept sorted in memcache and updated with
+compare-and-set. They are persisted to a single Leaderboard entity, so
+they survive eviction, by a task debounced to one per PERSIST_SECONDS
+rather than on every change, as every change would contend on that one
+entity. An eviction before the task runs loses the changes since the
+last persist until the players' totals are published again; rebuild
+recovers every total."""
+import random
+import time
+
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+import models
+
+NUM_SHARDS = 10
+LEADERBOARD_SIZE = 100
+LEADERBOARD_ID = 'total'
+MEMCACHE_LEADERBOARD = 'LEADERBOARD_TOTAL'
+CAS_RETRIES = 10
+PERSIST_SECONDS = 10
+PERSIST_URL = '/tasks/persist_leaderboard'
+
+
+class ContentionError(Exception):
+    """The leaderboard kept changing while a total was put on it"""
+
+
+def shard_keys(user_name):
+    return [ndb.Key(models.TotalScoreShard, '%s:%d' % (user_name, i))
+            for i in range(NUM_SHARDS)]
+
+
+@ndb.transactional
+def _increment_shard(key, user_name, points):
+    shard = key.get()
+    if shard is None:
+        shard = models.TotalScoreShard(key=key, user_name=user_name)
+    shard.total += points
+    shard.games += 1
+    shard.put()
+
+
+def get_total(user_name):
+    """Returns (total score, games scored) of a user"""
+    total = games = 0
+    for shard in ndb.get_multi(shard_keys(user_name)):
+        if shard is not None:
+            total += shard.total
+            games += shard.games
+    return total, games
+
+
+def add_score(user_name, points):
+    """Adds the points a user earned in a game to one shard of its total
+    score. Joins the current transaction if there is one."""
+    _increment_shard(random.choice(shard_keys(user_name)), user_name, points)
+
+
+def publish(user_name):
+    """Puts the current total score of a user on the leaderboard.
+    Raises:
+        ContentionError: If the leaderboard kept changing, publish again.
+    """
+    total, _ = get_total(user_name)
+    _update_leaderboard(user_name, total)
+
+
+def merge(entries, user_name, total):
+    """Returns the sorted leaderboard with user_name's total updated"""
+    merged = [entry for entry in entries if entry[0] != user_name]
+    if len(merged) < LEADERBOARD_SIZE or total > merged[-1][1]:
+        merged.append([user_name, total])
+        merged.sort(key=lambda entry: (-entry[1], entry[0]))
+    return merged[:LEADERBOARD_SIZE]
+
+
+def _load_leaderboard():
+    board = models.Leaderboard.get_by_id(LEADERBOARD_ID)
+    if board is None:
+        return []
+    return board.entries
+
+
+def _update_leaderboard(user_name, total):
+    client = memcache.Client()
+    for _ in range(CAS_RETRIES):
+        entries = client.gets(MEMCACHE_LEADERBOARD)
+        if entries is None:
+            ## evicted, reload it and try again to get a cas id
+            client.add(MEMCACHE_LEADERBOARD, _load_leaderboard())
+            continue
+        merged = merge(entries, user_name, total)
+        if merged == entries:
+            return
+        if client.cas(MEMCACHE_LEADERBOARD, merged):
+            _schedule_persist()
+            return
+    raise ContentionError('Leaderboard not updated for %s' % user_name)
+
+
+def _schedule_persist():
+    """Enqueues a persist of the leaderboard, unless one is already
+    pending for the current time bucket"""
+    now = time.time()
+    bucket = int(now // PERSIST_SECONDS)
+    try:
+        ## run at the end of the bucket to pick up every change of it
+        taskqueue.add(url=PERSIST_URL, name='leaderboard-persist-%d' % bucket,
+                      countdown=(bucket + 1) * PERSIST_SECONDS - now)
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        pass
+
+
+def persist():
+    """Writes the leaderboard in memcache to its Leaderboard entity"""
+    entries = memcache.get(MEMCACHE_LEADERBOARD)
+    if entries is not None:
+        models.Leaderboard(id=LEADERBOARD_ID, entries=entries).put()
+
+
+def get_top(max_number):
+    """Returns up to max_number [user_name, total_score] entries"""
+    entries = memcache.get(MEMCACHE_LEADERBOARD)
+    if entries is None:
+        entries = _load_leaderboard()
+        memcache.add(MEMCACHE_LEADERBOARD, entries)
+    return entries[:max(max_number, 0)]
+
+
+def rebuild():
+    """Recomputes every total score and the leaderboard from the Score
+    entities. Meant to be run once for scores recorded before totals were
+    maintained; games ending while it runs may be counted twice."""
+    totals = {}
+    games = {}
+    users = {}
+    for score in models.Score.query():
+        if score.user not in users:
+            users[score.user] = score.user.get().name
+        name = users[score.user]
+        totals[name] = totals.get(name, 0) + score.user_score_to_int()
+        games[name] = games.get(name, 0) + 1
+
+    entries = []
+    for name, total in totals.iteritems():
+        shards = [models.TotalScoreShard(key=key, user_name=name)
+                  for key in shard_keys(name)]
+        shards[0].total = total
+        shards[0].games = games[name]
+        ndb.put_multi(shards)
+        entries = merge(entries, name, total)
+
+    models.Leaderboard(id=LEADERBOARD_ID, entries=entries).put()
+    memcache.set(MEMCACHE_LEADERBOARD, entries)
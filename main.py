@@ -2,48 +2,215 @@
 
 """main.py - This file contains handlers that are called by taskqueue and/or
 cronjobs."""
-import logging
+import json
 
 import webapp2
-from google.appengine.api import mail, app_identity
-from api import TicTacToeApi
+from google.appengine.ext import ndb
+import backfill
+import chances
+import directory
+import export
+import judge
+import leaderboard
+import metrics
+import moves
+import reminders
+import solver
+import writebehind
 
-from models import User, Game
-from utils import get_endpoints_current_user
+from models import ExportChunk, ExportJob
+
+
+class Warmup(webapp2.RequestHandler):
+    @metrics.instrumented('warmup')
+    def get(self):
+        """Prepare a new instance before it serves: the judge table, the
+        solved game tree, the computer player and the API module."""
+        judge.outcomes()
+        solver.warm()
+        directory.get_computer()
+        ## the endpoints app runs in the same instance
+        import api
+        self.response.set_status(204)
 
 
 class SendReminderEmail(webapp2.RequestHandler):
+    @metrics.instrumented('send_reminder')
     def get(self):
         """Send a reminder email to each User with an email about games.
-        Called every hour using a cron job"""
-        app_id = app_identity.get_application_id()
-        active_games = Game.query().filter(Game.game_over != True)
-        
-        if active_games:
-            for game in active_games:
-                if not game.is_canceled:
-                    user = game.user.get()
-                    if user.email is not None:
-                    
-                        subject = 'This is a reminder!'
-                        body = 'Hello {}, You have an unfinished Tic-Tac-Toe! urlsafe_game_key is {}'.format(user.name, game.key.urlsafe())
-                        # This will send test emails, the arguments to send_mail are:
-                        # from, to, subject, body
-                        mail.send_mail('noreply@{}.appspotmail.com'.format(app_id),
-                                       user.email,
-                                       subject,
-                                       body)
+        Called every 6 hours using a cron job, the emails are sent by
+        SendReminderBatch tasks"""
+        reminders.start()
+
+
+class FlushGame(webapp2.RequestHandler):
+    @metrics.instrumented('flush_game')
+    def post(self):
+        """Write a game buffered in memcache to the datastore, enqueued
+        after its first unflushed change, see writebehind.py"""
+        game_key = ndb.Key(urlsafe=self.request.get('urlsafe_game_key'))
+        ## a non 2xx status makes the task retry
+        self.response.set_status(204 if writebehind.flush_game(game_key) else 503)
+
+
+class SendReminderBatch(webapp2.RequestHandler):
+    @metrics.instrumented('send_reminders')
+    def post(self):
+        """Send the reminder digests of one slice of the active games."""
+        reminders.send_batch(self.request.get('run'),
+                             int(self.request.get('page')),
+                             self.request.get('cursor') or None,
+                             self.request.get('skip_user') or None,
+                             int(self.request.get('shard') or 0),
+                             self.request.get('first_user') or None,
+                             self.request.get('end_user') or None)
+        self.response.set_status(204)
 
 
 class UpdateWinningChance(webapp2.RequestHandler):
+    @metrics.instrumented('cache_winning_chance')
     def post(self):
-        """Update game listing announcement in memcache."""
+        """Update the winning chance of a user in memcache."""
         user_name = self.request.get("user_name")
-        TicTacToeApi._cache_winning_chance(user_name)
+        chances.cache_winning_chance(user_name)
+        self.response.set_status(204)
+
+
+class TallyGame(webapp2.RequestHandler):
+    @metrics.instrumented('game_ended')
+    def post(self):
+        """Update ratings and total scores once a game has ended."""
+        moves.tally_game(ndb.Key(urlsafe=self.request.get('urlsafe_game_key')))
+        self.response.set_status(204)
+
+
+class RebuildTotalScores(webapp2.RequestHandler):
+    @metrics.instrumented('rebuild_total_scores')
+    def post(self):
+        """Recompute total scores and the leaderboard from all Scores"""
+        leaderboard.rebuild()
+        self.response.set_status(204)
+
+
+class PersistLeaderboard(webapp2.RequestHandler):
+    @metrics.instrumented('persist_leaderboard')
+    def post(self):
+        """Write the leaderboard kept in memcache to the datastore"""
+        leaderboard.persist()
         self.response.set_status(204)
 
 
+class AuditScores(webapp2.RequestHandler):
+    @metrics.instrumented('audit_scores')
+    def post(self):
+        """Re-validate one batch of Score results, or start an audit of
+        all of them when no run is given."""
+        ## numpy is only loaded by the instances running an audit
+        import audit
+        run = self.request.get('run')
+        if not run:
+            self.response.write(audit.start())
+            return
+        audit.audit_batch(run, int(self.request.get('page')),
+                          self.request.get('cursor') or None)
+        self.response.set_status(204)
+
+
+class BackfillGames(webapp2.RequestHandler):
+    @metrics.instrumented('backfill_games')
+    def post(self):
+        """Rewrite one batch of games to index their participants and
+        status, or start a run when no run is given."""
+        run = self.request.get('run')
+        if not run:
+            self.response.write(backfill.start())
+            return
+        backfill.backfill_batch(run, int(self.request.get('page')),
+                                self.request.get('cursor') or None)
+        self.response.set_status(204)
+
+
+class BackfillUserNames(webapp2.RequestHandler):
+    @metrics.instrumented('backfill_user_names')
+    def post(self):
+        """Map the names of one batch of users created before names were
+        keys, or start a run when no run is given."""
+        run = self.request.get('run')
+        if not run:
+            self.response.write(backfill.start_user_names())
+            return
+        backfill.user_names_batch(run, int(self.request.get('page')),
+                                  self.request.get('cursor') or None)
+        self.response.set_status(204)
+
+
+class ExportData(webapp2.RequestHandler):
+    @metrics.instrumented('export')
+    def post(self):
+        """Export chunks of Scores or Games, or start an export of the
+        kind and format given when no run is given."""
+        run = self.request.get('run')
+        if not run:
+            try:
+                run = export.start(self.request.get('kind'),
+                                   self.request.get('format') or 'ndjson')
+            except ValueError as error:
+                self.abort(400, str(error))
+            self.response.write(run)
+            return
+        export.export_step(run, int(self.request.get('page')))
+        self.response.set_status(204)
+
+
+class DownloadExport(webapp2.RequestHandler):
+    @metrics.instrumented('download_export')
+    def get(self):
+        """Show the progress of an export as JSON, or download one of its
+        gzipped chunks, numbered from 1."""
+        job = ExportJob.get_by_id(self.request.get('run'))
+        if job is None:
+            self.abort(404)
+        number = self.request.get('chunk')
+        if not number:
+            self.response.headers['Content-Type'] = 'application/json'
+            self.response.write(json.dumps({
+                'kind': job.kind, 'format': job.format, 'chunks': job.chunks,
+                'rows': job.rows, 'done': job.done}))
+            return
+        chunk = ExportChunk.get_by_id(int(number), parent=job.key)
+        if chunk is None:
+            self.abort(404)
+        self.response.headers['Content-Type'] = 'application/gzip'
+        self.response.headers['Content-Disposition'] = (
+            'attachment; filename=%s-%05d.%s.gz' % (job.key.id(), int(number),
+                                                   job.format))
+        self.response.write(chunk.data)
+
+
+class ShowStats(webapp2.RequestHandler):
+    @metrics.instrumented('show_stats')
+    def get(self):
+        """Show the latency and RPC counters of every handler as JSON,
+        summed over the last `windows` minutes."""
+        windows = int(self.request.get('windows') or 5)
+        self.response.headers['Content-Type'] = 'application/json'
+        self.response.write(json.dumps(metrics.get_stats(windows), indent=2,
+                                       sort_keys=True))
+
+
 app = webapp2.WSGIApplication([
+    ('/_ah/warmup', Warmup),
     ('/crons/send_reminder', SendReminderEmail),
+    ('/tasks/send_reminders', SendReminderBatch),
     ('/tasks/cache_winning_chance', UpdateWinningChance),
+    ('/tasks/rebuild_total_scores', RebuildTotalScores),
+    ('/tasks/persist_leaderboard', PersistLeaderboard),
+    ('/tasks/game_ended', TallyGame),
+    ('/tasks/flush_game', FlushGame),
+    ('/tasks/audit_scores', AuditScores),
+    ('/tasks/backfill_games', BackfillGames),
+    ('/tasks/backfill_user_names', BackfillUserNames),
+    ('/tasks/export', ExportData),
+    ('/admin/export', DownloadExport),
+    ('/admin/stats', ShowStats),
 ], debug=True)
@@ -0,0 +1,105 @@
+"""matchmaking.py - Pairs players looking for a game without an opponent.
+
+Players wait in memcache slots of MATCH_BUCKET_WIDTH wide rating buckets,
+one waiting player per slot. A player looking for a game reads its own
+slot and both neighbouring ones in one call and takes the first waiting
+player with compare-and-set, or waits in its own slot. Either way it is
+a constant number of memcache calls and no datastore queries. The waiting
+player polls its ticket, which holds the game once it is matched. A
+waiting player lost to memcache eviction simply sees its ticket expire
+and looks again."""
+import time
+import uuid
+
+from google.appengine.api import memcache
+
+import directory
+from models import Game
+
+MATCH_BUCKET_WIDTH = 100
+WAIT_SECONDS = 60
+## a matched ticket is kept a while for the waiting player to poll it
+MATCHED_SECONDS = 10 * 60
+CAS_RETRIES = 10
+MEMCACHE_SLOT = 'match:slot:'
+MEMCACHE_TICKET = 'match:ticket:'
+
+WAITING = 'WAITING'
+MATCHED = 'MATCHED'
+EXPIRED = 'EXPIRED'
+
+
+class MatchmakingBusyError(Exception):
+    """The slots kept changing while looking for a match"""
+
+
+def _slots(user):
+    floor = (int(user.rating_or_initial() // MATCH_BUCKET_WIDTH) *
+             MATCH_BUCKET_WIDTH)
+    return [MEMCACHE_SLOT + str(floor + offset)
+            for offset in (0, -MATCH_BUCKET_WIDTH, MATCH_BUCKET_WIDTH)]
+
+
+def _start_game(waiting, user):
+    """Creates the game of a waiting player and user, the waiting player
+    moves first. Returns None if the waiting player no longer exists."""
+    waiting_user = directory.get_user(waiting['user_name'])
+    if waiting_user is None:
+        return None
+    game = Game.new_game(user=waiting_user.key, user_tic='O',
+                         opponent=user.key, opponent_tic='X',
+                         user_of_next_move=waiting_user.key)
+    memcache.set(MEMCACHE_TICKET + waiting['ticket'],
+                 {'status': MATCHED, 'game': game.key.urlsafe()},
+                 time=MATCHED_SECONDS)
+    return game
+
+
+def find_match(user):
+    """Matches user with a waiting player of a close rating, or makes it
+    wait for one.
+    Returns:
+        (ticket, status, game): the new Game and MATCHED if a waiting
+        player was found, else the ticket to poll and WAITING.
+    Raises:
+        MatchmakingBusyError: If the slots kept changing.
+    """
+    client = memcache.Client()
+    slots = _slots(user)
+    ticket = None
+    for _ in range(CAS_RETRIES):
+        now = time.time()
+        waiting = client.get_multi(slots, for_cas=True)
+        for slot in slots:
+            entry = waiting.get(slot)
+            if not entry or entry['expires'] < now:
+                continue
+            if entry['user_name'] == user.name:
+                return entry['ticket'], WAITING, None
+            if client.cas(slot, {}):
+                game = _start_game(entry, user)
+                if game is not None:
+                    return None, MATCHED, game
+
+        if ticket is None:
+            ticket = uuid.uuid4().hex
+            memcache.set(MEMCACHE_TICKET + ticket, {'status': WAITING},
+                         time=WAIT_SECONDS)
+        entry = {'ticket': ticket, 'user_name': user.name,
+                 'expires': now + WAIT_SECONDS}
+        if slots[0] in waiting:
+            ## empty or expired, it would have been taken above otherwise
+            stored = client.cas(slots[0], entry, time=WAIT_SECONDS)
+        else:
+            stored = client.add(slots[0], entry, time=WAIT_SECONDS)
+        if stored:
+            return ticket, WAITING, None
+    raise MatchmakingBusyError()
+
+
+def poll(ticket):
+    """Returns (status, urlsafe key of the game or None) of a ticket"""
+    state = memcache.get(MEMCACHE_TICKET + ticket)
+    if state is None:
+        return EXPIRED, None
+    return state['status'], state.get('game')
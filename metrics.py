@@ -0,0 +1,192 @@
+"""metrics.py - Latency and API RPC instrumentation of the request handlers.
+
+Handlers decorated with @instrumented(name) record their wall time, the API
+RPCs they made by kind and the datastore entities they read and wrote.
+The counts are added to memcache counters in WINDOW_SECONDS windows with
+a single offset_multi per request. A TRACE_SAMPLE_RATE share of the
+requests also keeps a detailed trace of its RPCs."""
+import functools
+import logging
+import os
+import random
+import threading
+import time
+
+from google.appengine.api import apiproxy_stub_map
+from google.appengine.api import memcache
+
+WINDOW_SECONDS = 60
+MEMCACHE_PREFIX = 'stats:'
+## the share of requests whose RPCs are traced, set in app.yaml
+TRACE_SAMPLE_RATE = float(os.environ.get('METRICS_TRACE_SAMPLE_RATE', 0))
+## upper bounds in ms of the latency histogram buckets, the last is open
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+RPC_KINDS = ('datastore_get', 'datastore_query', 'datastore_put',
+             'datastore_delete', 'datastore_commit', 'datastore_other',
+             'memcache', 'taskqueue', 'mail', 'other')
+_DATASTORE_KINDS = {
+    'Get': 'datastore_get',
+    'RunQuery': 'datastore_query',
+    'Next': 'datastore_query',
+    'Put': 'datastore_put',
+    'Delete': 'datastore_delete',
+    'Commit': 'datastore_commit',
+}
+## calls allowed and rejected by the rate limiter, see ratelimit.py
+COUNTS = ('rate_allowed', 'rate_limited')
+FIELDS = (('calls', 'errors', 'total_ms', 'entities_read', 'entities_written') +
+          COUNTS +
+          tuple('rpc_' + kind for kind in RPC_KINDS) +
+          tuple('latency_%d' % i for i in range(len(LATENCY_BUCKETS_MS) + 1)))
+
+## names of the instrumented handlers
+handlers = []
+
+_current = threading.local()
+
+
+def _rpc_kind(service, call):
+    if service == 'datastore_v3':
+        return _DATASTORE_KINDS.get(call, 'datastore_other')
+    if service in ('memcache', 'taskqueue', 'mail'):
+        return service
+    return 'other'
+
+
+def _count_entities(service, call, request, response):
+    """Returns (entities read, entities written) by a datastore RPC"""
+    if service != 'datastore_v3':
+        return 0, 0
+    try:
+        if call == 'Get':
+            return response.entity_size(), 0
+        if call in ('RunQuery', 'Next'):
+            return response.result_size(), 0
+        if call == 'Put':
+            return 0, request.entity_size()
+    except AttributeError:
+        pass
+    return 0, 0
+
+
+def _after_call(service, call, request, response):
+    record = getattr(_current, 'record', None)
+    if record is None:
+        return
+    kind = _rpc_kind(service, call)
+    record['rpc_' + kind] += 1
+    read, written = _count_entities(service, call, request, response)
+    record['entities_read'] += read
+    record['entities_written'] += written
+    if record['trace'] is not None:
+        record['trace'].append('%.1fms %s.%s' % (
+            1000 * (time.time() - record['started']), service, call))
+
+
+apiproxy_stub_map.apiproxy.GetPostCallHooks().Append('metrics', _after_call)
+
+
+def count(field, amount=1):
+    """Adds amount to a field of COUNTS of the handler being recorded"""
+    record = getattr(_current, 'record', None)
+    if record is not None:
+        record[field] += amount
+
+
+def _latency_field(ms):
+    for i, bound in enumerate(LATENCY_BUCKETS_MS):
+        if ms <= bound:
+            return 'latency_%d' % i
+    return 'latency_%d' % len(LATENCY_BUCKETS_MS)
+
+
+def window_prefix(name, window):
+    return '%s%d:%s:' % (MEMCACHE_PREFIX, window, name)
+
+
+def _flush(name, record, ms, failed):
+    deltas = dict((field, record[field]) for field in FIELDS
+                  if field.startswith('rpc_') or field.startswith('entities_') or
+                  field in COUNTS)
+    deltas = dict((field, value) for field, value in deltas.items() if value)
+    deltas['calls'] = 1
+    deltas['total_ms'] = int(ms)
+    deltas[_latency_field(ms)] = 1
+    if failed:
+        deltas['errors'] = 1
+    window = int(time.time() // WINDOW_SECONDS)
+    memcache.offset_multi(deltas, key_prefix=window_prefix(name, window),
+                          initial_value=0)
+    if record['trace'] is not None:
+        trace = {'ms': ms, 'failed': failed, 'rpcs': record['trace']}
+        logging.info('Trace of %s: %s', name, trace)
+        memcache.set(MEMCACHE_PREFIX + 'trace:' + name, trace)
+
+
+def instrumented(name):
+    """Returns a decorator recording the latency and RPCs of a handler
+    under name"""
+    handlers.append(name)
+
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if getattr(_current, 'record', None) is not None:
+                ## already recorded by an outer handler
+                return func(*args, **kwargs)
+            record = dict((field, 0) for field in FIELDS)
+            record['started'] = time.time()
+            if random.random() < TRACE_SAMPLE_RATE:
+                record['trace'] = []
+            else:
+                record['trace'] = None
+            _current.record = record
+            failed = True
+            try:
+                result = func(*args, **kwargs)
+                failed = False
+                return result
+            finally:
+                _current.record = None
+                ms = 1000 * (time.time() - record['started'])
+                try:
+                    _flush(name, record, ms, failed)
+                except Exception:
+                    logging.exception('Could not record metrics of %s', name)
+        return wrapper
+    return decorator
+
+
+def get_stats(windows=5):
+    """Returns the counters of every handler summed over the last windows
+    windows, and its last sampled trace"""
+    current = int(time.time() // WINDOW_SECONDS)
+    stats = {}
+    for name in sorted(set(handlers)):
+        keys = [window_prefix(name, window) + field
+                for window in range(current - windows + 1, current + 1)
+                for field in FIELDS]
+        values = memcache.get_multi(keys)
+        totals = dict((field, 0) for field in FIELDS)
+        for key, value in values.items():
+            totals[key.rsplit(':', 1)[1]] += int(value)
+        if not totals['calls']:
+            continue
+        stats[name] = {
+            'calls': totals['calls'],
+            'errors': totals['errors'],
+            'mean_ms': totals['total_ms'] / float(totals['calls']),
+            'latency_ms': dict(
+                ('le_%s' % bound, totals['latency_%d' % i])
+                for i, bound in enumerate(LATENCY_BUCKETS_MS + ('inf',))),
+            'rpcs_per_call': dict(
+                (kind, totals['rpc_' + kind] / float(totals['calls']))
+                for kind in RPC_KINDS if totals['rpc_' + kind]),
+            'entities_read': totals['entities_read'],
+            'entities_written': totals['entities_written'],
+            'counts': dict((field, totals[field]) for field in COUNTS
+                           if totals[field]),
+            'trace': memcache.get(MEMCACHE_PREFIX + 'trace:' + name),
+        }
+    return stats
@@ -0,0 +1,110 @@
+"""mnk.py - m,n,k games: k marks in a row win on a board of rows x cols.
+
+Each player's marks are a bitboard, an int whose bit r * cols + c is set
+when the player has a mark on row r, column c, stored packed in bytes.
+Checking a move only walks the four lines through it, at most k - 1
+cells each way, so a move costs O(k) whatever the size of the board.
+Tic-tac-toe itself (3, 3, 3) is played with judge.py and solver.py."""
+import binascii
+
+MIN_SIDE = 3
+MAX_SIDE = 19
+## row and column steps of the horizontal, vertical and both diagonal lines
+DIRECTIONS = ((0, 1), (1, 0), (1, 1), (1, -1))
+
+
+def validate(rows, cols, k):
+    """Raises ValueError unless rows x cols is a board where k in a row
+    can be made"""
+    if not (MIN_SIDE <= rows <= MAX_SIDE and MIN_SIDE <= cols <= MAX_SIDE):
+        raise ValueError('Boards are %d to %d cells wide' % (MIN_SIDE, MAX_SIDE))
+    if not MIN_SIDE <= k <= max(rows, cols):
+        raise ValueError('k must be from %d to the board width' % MIN_SIDE)
+
+
+def _size(cells):
+    return (cells + 7) // 8
+
+
+def pack(user_bits, opponent_bits, cells):
+    """Packs the bitboards of both players into a string of bytes"""
+    width = 2 * _size(cells)
+    return binascii.unhexlify('%0*x%0*x' % (width, user_bits, width, opponent_bits))
+
+
+def unpack(packed, cells):
+    """Returns the (user, opponent) bitboards of a packed board"""
+    if not packed:
+        return 0, 0
+    size = _size(cells)
+    return (int(binascii.hexlify(packed[:size]), 16),
+            int(binascii.hexlify(packed[size:]), 16))
+
+
+def is_set(bits, position):
+    return bits >> position & 1
+
+
+def run_length(bits, rows, cols, position, direction):
+    """Returns the number of marks in a row through position along
+    direction, position included"""
+    row, col = divmod(position, cols)
+    length = 1
+    for sign in (1, -1):
+        dr, dc = sign * direction[0], sign * direction[1]
+        r, c = row + dr, col + dc
+        while 0 <= r < rows and 0 <= c < cols and is_set(bits, r * cols + c):
+            length += 1
+            r, c = r + dr, c + dc
+    return length
+
+
+def wins(bits, rows, cols, k, position):
+    """Whether the mark on position completes k in a row"""
+    return any(run_length(bits, rows, cols, position, direction) >= k
+               for direction in DIRECTIONS)
+
+
+def set_positions(bits):
+    """Yields the positions of the set bits of a bitboard"""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
+
+
+def _candidates(occupied, rows, cols):
+    """Free cells next to a mark"""
+    candidates = set()
+    for position in set_positions(occupied):
+        row, col = divmod(position, cols)
+        for dr in (-1, 0, 1):
+            for dc in (-1, 0, 1):
+                r, c = row + dr, col + dc
+                if 0 <= r < rows and 0 <= c < cols:
+                    candidates.add(r * cols + c)
+    return [position for position in candidates
+            if not is_set(occupied, position)]
+
+
+def heuristic_move(own, other, rows, cols, k):
+    """Returns a position for the player with bitboard own to play: a
+    winning move, else a block of the other player's winning move, else
+    the free cell next to a mark with the longest lines through it for
+    either player. The center opens an empty board."""
+    occupied = own | other
+    if not occupied:
+        return (rows // 2) * cols + cols // 2
+    candidates = sorted(_candidates(occupied, rows, cols))
+    if not candidates:
+        return None
+    for bits in (own, other):
+        for position in candidates:
+            if wins(bits | 1 << position, rows, cols, k, position):
+                return position
+
+    def value(position):
+        return sum(run_length(own | 1 << position, rows, cols, position, direction) ** 2 +
+                   run_length(other | 1 << position, rows, cols, position, direction) ** 2
+                   for direction in DIRECTIONS)
+    return max(candidates, key=value)
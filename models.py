@@ -1,13 +1,16 @@
 """models.py - This file contains the class definitions for the Datastore
 entities and Endpoints used by the Game. It inlcudes User, Game, Score. And it also
 include message model GameForm, NewGameForm, MessageForm, ScoreForm, ScoreForms. """
-import re
 from datetime import date
 from protorpc import messages
 from google.appengine.ext import ndb
 from google.appengine.ext.ndb import msgprop
 
-from utils import get_endpoints_current_user
+import judge
+import mnk
+import movelog
+import ratings
+from utils import get_endpoints_current_user, get_referenced
 
 class Result(messages.Enum):
     LOSE = 0
@@ -15,16 +18,38 @@ class Result(messages.Enum):
     WIN = 2
 
 
+class GameStatus(messages.Enum):
+    ACTIVE = 0
+    OVER = 1
+    CANCELED = 2
+
+
 class User(ndb.Model):
-    """User profile"""
+    """User profile, new users use their name as id"""
     name = ndb.StringProperty(required=True)
     email =ndb.StringProperty()
+    ## Elo rating, None until the user has finished a game. see ratings.py
+    rating = ndb.FloatProperty()
+    rated_games = ndb.IntegerProperty(indexed=False)
+
+    def rating_or_initial(self):
+        if self.rating is None:
+            return ratings.INITIAL_RATING
+        return self.rating
+
+
+class UserName(ndb.Model):
+    """Maps the name (id) of a user created before names were ids to its key"""
+    user = ndb.KeyProperty(required=True, kind='User', indexed=False)
+
+
+class BackfillDone(ndb.Model):
+    """Records that the backfill named by its id has run to the end"""
+    finished = ndb.DateTimeProperty(auto_now_add=True, indexed=False)
 
-### CREATE USER - COMPUTER 
 ### COMPUTER WILL BE DEFAULT USER IN THE GAME
-if not User.query(User.name == "computer").get():
-    computer = User(name="computer")
-    computer.put()
+### it is created on first use, see directory.get_computer
+COMPUTER_NAME = "computer"
 
 class Game(ndb.Model):
     """Game object"""
@@ -36,12 +61,41 @@ class Game(ndb.Model):
     
     ## game
     game_over = ndb.BooleanProperty(required=True, default=False)
-    board_state = ndb.StringProperty(required=True)
+    ## the 9 characters of a tic-tac-toe board, see render_board
+    board_state = ndb.StringProperty()
+    ## board_state encoded as a base-3 integer, see judge.py
+    board_code = ndb.IntegerProperty(indexed=False)
+    ## the board has rows x cols cells and k marks in a row win, 3, 3, 3
+    ## for tic-tac-toe. Other boards only keep the marks of both players
+    ## as bitboards, see mnk.py
+    rows = ndb.IntegerProperty(required=True, default=3, indexed=False)
+    cols = ndb.IntegerProperty(required=True, default=3, indexed=False)
+    k = ndb.IntegerProperty(required=True, default=3, indexed=False)
+    bitboards = ndb.BlobProperty()
+    ## the judge outcome once the game is over
+    outcome = ndb.IntegerProperty(indexed=False)
     user_of_next_move = ndb.KeyProperty(required=True, kind='User')
     is_canceled = ndb.BooleanProperty(required=False, default=False)
 
-    ## history will be saved as string with move (user_of_move, position_of_move)
+    ## history used to be saved as string with move (user_of_move, position_of_move)
+    ## games stored before move_log existed keep it until their next move
     history = ndb.StringProperty(required=True, default="")
+    ## positions played packed one per nibble, see movelog.py
+    move_log = ndb.BlobProperty(default='')
+    move_count = ndb.IntegerProperty(required=True, default=0, indexed=False)
+
+    ## incremented on every move and cancel, concurrent writes check it to
+    ## not overwrite each other
+    version = ndb.IntegerProperty(required=True, default=0, indexed=False)
+    ## whether the ratings and total scores have been updated for the ended game
+    tallied = ndb.BooleanProperty(required=True, default=False, indexed=False)
+
+    ## both players and the GameStatus name, so the active games of a user
+    ## are one equality query. Games written before them are backfilled
+    ## by backfill.py
+    participants = ndb.ComputedProperty(
+        lambda self: [self.user, self.opponent], repeated=True)
+    status = ndb.ComputedProperty(lambda self: self.current_status().name)
     
     ### tic tac toe game board state
     ### 3X3 = 9 characters
@@ -54,44 +108,92 @@ class Game(ndb.Model):
     
 
     @classmethod
-    def new_game(cls, user, user_tic, opponent, opponent_tic, user_of_next_move):
-        """Creates and returns a new game"""
+    def new_game(cls, user, user_tic, opponent, opponent_tic, user_of_next_move,
+                 rows=3, cols=3, k=3):
+        """Creates and returns a new game of k in a row on a rows x cols
+        board, tic-tac-toe by default"""
+        game = cls.build(user, user_tic, opponent, opponent_tic,
+                         user_of_next_move, rows, cols, k)
+        game.put()
+        return game
+
+    @classmethod
+    def build(cls, user, user_tic, opponent, opponent_tic, user_of_next_move,
+              rows=3, cols=3, k=3):
+        """Returns a new game as new_game does, without writing it"""
         ### default b user is a computer
+        if user_tic == opponent_tic:
+            raise ValueError('Players must use different tics')
+        mnk.validate(rows, cols, k)
         game = Game(user=user,
                     user_tic=user_tic,
                     opponent=opponent, 
                     opponent_tic=opponent_tic, 
                     game_over=False,
-                    board_state="---------", 
+                    rows=rows, cols=cols, k=k,
                     user_of_next_move = user_of_next_move)
-        game.put()
+        if game.is_tic_tac_toe:
+            game.board_state = judge.render(judge.EMPTY_BOARD, user_tic, opponent_tic)
+            game.board_code = judge.EMPTY_BOARD
+        else:
+            game.bitboards = mnk.pack(0, 0, game.cells)
+            game._marks = (0, 0)
         return game
 
-    def to_form(self, message):
-        """Returns a GameForm representation of the Game"""
+    USER_PROPERTIES = ('user', 'opponent', 'user_of_next_move')
+
+    def current_status(self):
+        if self.is_canceled:
+            return GameStatus.CANCELED
+        if self.game_over:
+            return GameStatus.OVER
+        return GameStatus.ACTIVE
+
+    def to_form(self, message, users=None):
+        """Returns a GameForm representation of the Game
+        Args:
+            message: The message to send along with the game
+            users: Optional dict of User key to User, as built by
+                get_referenced. The players are fetched in one batch
+                when it is omitted.
+        """
+        if users is None:
+            users = get_referenced([self], *self.USER_PROPERTIES)
         form = GameForm()
         form.urlsafe_key = self.key.urlsafe()
-        form.user_name = self.user.get().name
-        form.opponent_name = self.opponent.get().name
+        form.user_name = users[self.user].name
+        form.opponent_name = users[self.opponent].name
+        form.user_tic = self.user_tic
+        form.opponent_tic = self.opponent_tic
         
-        form.board_state = self.board_state
+        form.board_state = self.render_board()
         form.game_over = self.game_over
-        form.user_of_next_move = self.user_of_next_move.get().name
+        form.user_of_next_move = users[self.user_of_next_move].name
 
         form.is_canceled = self.is_canceled
-        
+        form.version = self.version
+        form.rows, form.cols, form.k = self.rows, self.cols, self.k
+
         form.message = message
         return form
 
+    @classmethod
+    def to_forms(cls, games, message=""):
+        """Returns a GameForms of games, fetching all their players at once"""
+        games = list(games)
+        users = get_referenced(games, *cls.USER_PROPERTIES)
+        return GameForms(items=[game.to_form(message, users) for game in games])
+
     def end_game(self, end, result):
-        """Ends the game"""
+        """Ends the game. Returns the Score of each player, which the
+        caller writes together with the game"""
         self.game_over = True
-        self.put()
         # Add the game to the score 'board'
+        board_state = self.render_board()
 
         score = Score(user=self.user, opponent=self.opponent, date=date.today(), 
-                      board_state=self.board_state, result=result)
-        score.put()
+                      board_state=board_state, result=result,
+                      user_tic=self.user_tic)
 
         ## move from either player will end the game, and generate two scores
         ## one for user, one for opponent
@@ -103,72 +205,162 @@ class Game(ndb.Model):
             opponent_result = result
 
         oppo_score = Score(user=self.opponent, opponent=self.user, date=date.today(), 
-                      board_state=self.board_state, result=opponent_result)
-        oppo_score.put()
+                      board_state=board_state, result=opponent_result,
+                      user_tic=self.opponent_tic)
+        return [score, oppo_score]
 
-    def judge_game(self):
-        ## return whether ended, who is winner, result of game
-        result = {}
-
-        ## check whether free indices
-        ## if not, a tie
-        if int(self.board_state.find("-")) == -1:
-            self.end_game(end=True, result=Result.TIE)  
-            result["end"] = True
-            result["winner"] = "BOTH"
-            result["result"] = "TIE"
-
-        positions_by_user = [match.start()
-                                for match in re.finditer(self.user_tic, self.board_state)]
-
-        positions_by_opponent = [match.start()
-                                for match in re.finditer(self.opponent_tic, self.board_state)]
-
-        ### used to determine whether someone has win by add the digits in the positions
-        ### if equals 15, yes
-        ### more information: http://mathworld.wolfram.com/MagicSquare.html
-
-        magic_square = [8, 1, 6, 3, 5, 7, 4, 9, 2]
-
-        positions_by_user_total = 0
-        for i in positions_by_user:
-            positions_by_user_total += magic_square[i]
-
-        positions_by_opponent_total = 0
-        for i in positions_by_opponent:
-            positions_by_opponent_total += magic_square[i]
-
-        # positions_by_user_total =reduce(lambda a, b: magic_square[a]+magic_square[b], positions_by_user)
-
-        
-
-        if positions_by_user_total == 15 and positions_by_opponent_total == 15:
-            result["end"] = True
-            result["winner"] = "BOTH"
-            result["result"] = "TIE"
-
-            self.end_game(end=True, result=Result.Tie)
-
-        elif positions_by_user_total == 15 and positions_by_opponent_total != 15:
-            result["end"] = True
-            result["winner"] = self.user.get().name
-            result["result"] = "WIN"
-            self.end_game(end=True, result=Result.WIN)
+    @property
+    def is_tic_tac_toe(self):
+        return (self.rows, self.cols, self.k) == (3, 3, 3)
 
-        elif positions_by_opponent_total == 15 and positions_by_user_total != 15 :
-            result["end"] = True
-            result["winner"] = self.opponent_name
-            result["result"] = "LOSE"
+    @property
+    def cells(self):
+        return self.rows * self.cols
 
+    @property
+    def board(self):
+        """The board of a tic-tac-toe game encoded as a base-3 integer"""
+        if self.board_code is None:
+            ## games stored before board_code existed
+            self.board_code = judge.encode(self.board_state, self.user_tic,
+                                           self.opponent_tic)
+        return self.board_code
+
+    def marks(self):
+        """The (user, opponent) bitboards of a game on another board,
+        unpacked once per instance"""
+        marks = getattr(self, '_marks', None)
+        if marks is None:
+            marks = self._marks = mnk.unpack(self.bitboards, self.cells)
+        return marks
+
+    def render_board(self):
+        """The board as one character per cell, '-' for a free cell"""
+        if self.is_tic_tac_toe:
+            return self.board_state
+        chars = ['-'] * self.cells
+        user_bits, opponent_bits = self.marks()
+        for bits, tic in ((user_bits, self.user_tic), (opponent_bits, self.opponent_tic)):
+            for position in mnk.set_positions(bits):
+                chars[position] = tic
+        return ''.join(chars)
+
+    def is_free(self, position):
+        if self.is_tic_tac_toe:
+            return judge.is_free(self.board, position)
+        user_bits, opponent_bits = self.marks()
+        return (0 <= position < self.cells and
+                not mnk.is_set(user_bits | opponent_bits, position))
+
+    def place_mark(self, player, position):
+        """Places the mark of player (a User key) on a free position and
+        passes the turn to the other player"""
+        if not self.is_tic_tac_toe:
+            self._place_bit(player, position)
+            return
+        if player == self.user:
+            self.board_code = judge.place(self.board, position, judge.USER)
+            self.user_of_next_move = self.opponent
+        else:
+            self.board_code = judge.place(self.board, position, judge.OPPONENT)
+            self.user_of_next_move = self.user
+        self.board_state = judge.render(self.board_code, self.user_tic,
+                                        self.opponent_tic)
+
+    def _place_bit(self, player, position):
+        user_bits, opponent_bits = self.marks()
+        if player == self.user:
+            user_bits |= 1 << position
+            self.user_of_next_move = self.opponent
+        else:
+            opponent_bits |= 1 << position
+            self.user_of_next_move = self.user
+        self._marks = (user_bits, opponent_bits)
+        self.bitboards = mnk.pack(user_bits, opponent_bits, self.cells)
+        self._last_position = position
 
-            self.end_game(end=True, result=Result.LOSE)
+    @property
+    def _wide_log(self):
+        return not movelog.fits_nibbles(self.cells)
+
+    def _played(self):
+        if self.history and not self.move_count:
+            return [position for _, position in movelog.parse_legacy(self.history)]
+        return movelog.positions(self.move_log, self.move_count, self._wide_log)
+
+    def record_move(self, position):
+        """Appends a position to the history of the game"""
+        if self.history and not self.move_count:
+            played = self._played()
+            self.move_log = movelog.pack(played)
+            self.move_count = len(played)
+            self.history = ""
+        self.move_log = movelog.append(self.move_log or '', self.move_count,
+                                       position, self._wide_log)
+        self.move_count += 1
+
+    def moves(self):
+        """Returns the [(User key, position)] of the moves played. The user
+        always moves first and players take turns."""
+        players = (self.user, self.opponent)
+        return [(players[i % 2], position)
+                for i, position in enumerate(self._played())]
 
+    def judge_game(self):
+        """Returns whether the game ended, the winner (a User key, None for
+        a tie), the result for the user and the scores to write"""
+        if self.is_tic_tac_toe:
+            outcome = judge.outcome(self.board)
         else:
-            result["end"] = False
-
+            outcome = self._judge_last_move()
+        if outcome == judge.ONGOING:
+            return {"end": False}
+        self.outcome = outcome
+
+        if outcome == judge.TIE:
+            result = {"end": True, "winner": None, "result": "TIE",
+                      "scores": self.end_game(end=True, result=Result.TIE)}
+        elif outcome == judge.USER_WINS:
+            result = {"end": True, "winner": self.user, "result": "WIN",
+                      "scores": self.end_game(end=True, result=Result.WIN)}
+        else:
+            result = {"end": True, "winner": self.opponent, "result": "LOSE",
+                      "scores": self.end_game(end=True, result=Result.LOSE)}
         return result
 
+    def _judge_last_move(self):
+        """Judges a game on another board from the lines through its last
+        move only"""
+        position = getattr(self, '_last_position', None)
+        if position is None:
+            played = self._played()
+            if not played:
+                return judge.ONGOING
+            position = played[-1]
+        user_bits, opponent_bits = self.marks()
+        if mnk.is_set(user_bits, position):
+            bits, won = user_bits, judge.USER_WINS
+        else:
+            bits, won = opponent_bits, judge.OPPONENT_WINS
+        if mnk.wins(bits, self.rows, self.cols, self.k, position):
+            return won
+        if self.move_count == self.cells:
+            return judge.TIE
+        return judge.ONGOING
 
+    @property
+    def result(self):
+        """The Result for the user of a game that is over"""
+        if self.outcome is not None:
+            outcome = self.outcome
+        else:
+            ## tic-tac-toe games that ended before outcome was stored
+            outcome = judge.outcome(self.board)
+        if outcome == judge.USER_WINS:
+            return Result.WIN
+        if outcome == judge.OPPONENT_WINS:
+            return Result.LOSE
+        return Result.TIE
 
 
 class Score(ndb.Model):
@@ -179,8 +371,15 @@ class Score(ndb.Model):
     board_state = ndb.StringProperty(required=True)
     # E
     result = msgprop.EnumProperty(Result, required=True)
+    ## the user's mark on board_state, None on scores recorded before
+    user_tic = ndb.StringProperty(indexed=False)
+
+    USER_PROPERTIES = ('user', 'opponent')
 
-    def to_form(self):
+    def to_form(self, users=None):
+        """Returns a ScoreForm, see Game.to_form for users"""
+        if users is None:
+            users = get_referenced([self], *self.USER_PROPERTIES)
         if self.result == Result.WIN:
             result = "WIN"
         elif self.result == Result.TIE:
@@ -188,10 +387,17 @@ class Score(ndb.Model):
         else:
             result = "LOSE"
         if not self.opponent:
-            return ScoreForm(user_name=self.user.get().name, result=result,
+            return ScoreForm(user_name=users[self.user].name, result=result,
                          date=str(self.date), board_state=self.board_state, opponent_name="computer")
-        return ScoreForm(user_name=self.user.get().name, result=result,
-                         date=str(self.date), board_state=self.board_state, opponent_name=self.opponent.get().name)
+        return ScoreForm(user_name=users[self.user].name, result=result,
+                         date=str(self.date), board_state=self.board_state, opponent_name=users[self.opponent].name)
+
+    @classmethod
+    def to_forms(cls, scores):
+        """Returns a ScoreForms of scores, fetching all their users at once"""
+        scores = list(scores)
+        users = get_referenced(scores, *cls.USER_PROPERTIES)
+        return ScoreForms(items=[score.to_form(users) for score in scores])
 
 
     @classmethod
@@ -250,6 +456,58 @@ class Score(ndb.Model):
     def timestamp(self):
         return self.date.strftime('%b %d, %Y %I:%M:%S %p')
 
+class TotalScoreShard(ndb.Model):
+    """One shard of a user's total score, the id is '<user name>:<shard>'.
+    Games add to a random shard so busy players spread their writes."""
+    user_name = ndb.StringProperty(required=True, indexed=False)
+    total = ndb.IntegerProperty(required=True, default=0, indexed=False)
+    games = ndb.IntegerProperty(required=True, default=0, indexed=False)
+
+
+class RatingBucket(ndb.Model):
+    """Number of users whose rating is in [floor, floor + bucket width),
+    the id is str(floor). see ratings.py"""
+    floor = ndb.IntegerProperty(required=True)
+    count = ndb.IntegerProperty(required=True, default=0, indexed=False)
+
+
+class ScoreAudit(ndb.Model):
+    """Counts of a re-validation of every Score result, the id is the run.
+    see audit.py"""
+    pages = ndb.IntegerProperty(default=0, indexed=False)
+    checked = ndb.IntegerProperty(default=0, indexed=False)
+    mismatched = ndb.IntegerProperty(default=0, indexed=False)
+    ## scores checked without the user's mark
+    legacy = ndb.IntegerProperty(default=0, indexed=False)
+    ## some of the mismatched scores
+    samples = ndb.KeyProperty(kind='Score', repeated=True, indexed=False)
+    done = ndb.BooleanProperty(default=False, indexed=False)
+
+
+class ExportJob(ndb.Model):
+    """An export of a kind, checkpointed after each chunk. see export.py"""
+    kind = ndb.StringProperty(required=True)
+    format = ndb.StringProperty(required=True, indexed=False)
+    ## urlsafe cursor where the next chunk starts
+    cursor = ndb.StringProperty(indexed=False)
+    chunks = ndb.IntegerProperty(default=0, indexed=False)
+    rows = ndb.IntegerProperty(default=0, indexed=False)
+    done = ndb.BooleanProperty(default=False, indexed=False)
+    started = ndb.DateTimeProperty(auto_now_add=True)
+
+
+class ExportChunk(ndb.Model):
+    """A gzipped chunk of an export, child of its ExportJob. The id is the
+    chunk's number from 1."""
+    data = ndb.BlobProperty(required=True)
+    rows = ndb.IntegerProperty(required=True, indexed=False)
+
+
+class Leaderboard(ndb.Model):
+    """The top total scores as a sorted list of [user_name, total_score]"""
+    entries = ndb.JsonProperty(default=[])
+
+
 class GameForm(messages.Message):
     """GameForm for outbound game board_state information"""
     urlsafe_key = messages.StringField(1, required=True)
@@ -266,9 +524,29 @@ class GameForm(messages.Message):
     opponent_tic = messages.StringField(9, required=True, default="X")
 
     is_canceled = messages.BooleanField(10, required=True)
+    version = messages.IntegerField(11, default=0)
+    rows = messages.IntegerField(12, default=3)
+    cols = messages.IntegerField(13, default=3)
+    k = messages.IntegerField(14, default=3)
+
 
 
 
+class GamePollForm(messages.Message):
+    """Answer to a poll of a game, game is only set when changed"""
+    changed = messages.BooleanField(1, required=True)
+    version = messages.IntegerField(2, required=True)
+    game = messages.MessageField(GameForm, 3)
+
+
+class MatchForm(messages.Message):
+    """State of a matchmaking ticket, status is WAITING, MATCHED or
+    EXPIRED. urlsafe_game_key is set once MATCHED"""
+    status = messages.StringField(1, required=True)
+    ticket = messages.StringField(2)
+    urlsafe_game_key = messages.StringField(3)
+    message = messages.StringField(4)
+
 
 class NewGameForm(messages.Message):
     """Used to create a new game"""
@@ -276,18 +554,50 @@ class NewGameForm(messages.Message):
     user_tic = messages.StringField(2, required=True, default="O")
     opponent_name = messages.StringField(3, required=True, default="computer")
     opponent_tic = messages.StringField(4, required=True, default="X")
+    ## k in a row wins on a rows x cols board, tic-tac-toe by default
+    rows = messages.IntegerField(5, default=3)
+    cols = messages.IntegerField(6, default=3)
+    k = messages.IntegerField(7, default=3)
 
 
 class MakeMoveForm(messages.Message):
     """
     Used to make a move in an existing game. 
     position is an integer from 0 - 8 (inclusive)
-    it will be transformed into the position on the 3X3 grid
+    it will be transformed into the position on the 3X3 grid,
+    on a rows x cols board from 0 to rows * cols - 1, row by row
     """
     user_of_move =  messages.StringField(1, required=True)
     position = messages.IntegerField(2, required=True)
     
 
+class BatchMoveForm(messages.Message):
+    """A move of a batch, position is an integer from 0 - 8 (inclusive)"""
+    urlsafe_game_key = messages.StringField(1, required=True)
+    user_of_move = messages.StringField(2, required=True)
+    position = messages.IntegerField(3, required=True)
+
+
+class BatchMoveForms(messages.Message):
+    """Inbound batch of moves, played in order"""
+    items = messages.MessageField(BatchMoveForm, 1, repeated=True)
+
+
+class MoveResultForm(messages.Message):
+    """Outcome of a move of a batch. game is set when the move was played
+    or the position was taken, error and status (the HTTP status make_move
+    would have answered) when it failed"""
+    urlsafe_game_key = messages.StringField(1, required=True)
+    game = messages.MessageField(GameForm, 2)
+    error = messages.StringField(3)
+    status = messages.IntegerField(4, default=200)
+
+
+class MoveResultForms(messages.Message):
+    """One MoveResultForm per move of a batch, in order"""
+    items = messages.MessageField(MoveResultForm, 1, repeated=True)
+
+
 class ScoreForm(messages.Message):
     """ScoreForm for outbound Score information"""
     user_name = messages.StringField(1, required=True)
@@ -298,11 +608,27 @@ class ScoreForm(messages.Message):
 
 
 class ScoreForms(messages.Message):
-    """Return multiple ScoreForms"""
+    """Return multiple ScoreForms, next_cursor fetches the next page"""
     items = messages.MessageField(ScoreForm, 1, repeated=True)
+    next_cursor = messages.StringField(2)
+    more = messages.BooleanField(3, default=False)
 
 class GameForms(messages.Message):
+    """Return multiple GameForms, next_cursor fetches the next page"""
     items = messages.MessageField(GameForm, 1, repeated=True)
+    next_cursor = messages.StringField(2)
+    more = messages.BooleanField(3, default=False)
+
+class UserForm(messages.Message):
+    """UserForm for outbound User information"""
+    user_name = messages.StringField(1, required=True)
+    email = messages.StringField(2)
+
+class UserForms(messages.Message):
+    """Return multiple UserForms, next_cursor fetches the next page"""
+    items = messages.MessageField(UserForm, 1, repeated=True)
+    next_cursor = messages.StringField(2)
+    more = messages.BooleanField(3, default=False)
 
 class StringMessage(messages.Message):
     """StringMessage-- outbound (single) string message"""
@@ -313,6 +639,23 @@ class BoardMessage(messages.Message):
     """Board board_state"""
     board_state = messages.StringField(1, required=True)
 
+class MoveForm(messages.Message):
+    """A move of a game, number starts at 1"""
+    number = messages.IntegerField(1, required=True)
+    user_name = messages.StringField(2, required=True)
+    position = messages.IntegerField(3, required=True)
+
+class MoveForms(messages.Message):
+    """The moves of a game, in order"""
+    items = messages.MessageField(MoveForm, 1, repeated=True)
+
+class WinningChanceForm(messages.Message):
+    """The winning chance of a user, estimated from games games. It is
+    the default chance when games is 0"""
+    user_name = messages.StringField(1, required=True)
+    chance = messages.FloatField(2, required=True)
+    games = messages.IntegerField(3, required=True)
+
 class UserTotalScoreForm(messages.Message):
     """It will list username, the total scores of all the played games"""
     user_name = messages.StringField(1, required=True)
@@ -322,6 +665,17 @@ class UserTotalScoreForms(messages.Message):
     """Many UserTotalScoreForm"""
     items=messages.MessageField(UserTotalScoreForm, 1, repeated=True)
 
+class UserRankingForm(messages.Message):
+    """The rating of a user and its rank among rated users"""
+    user_name = messages.StringField(1, required=True)
+    rating = messages.FloatField(2, required=True)
+    rank = messages.IntegerField(3, required=True)
+    games = messages.IntegerField(4, required=True)
+
+class UserRankingForms(messages.Message):
+    """Many UserRankingForm"""
+    items=messages.MessageField(UserRankingForm, 1, repeated=True)
+
 
 
 
@@ -0,0 +1,74 @@
+"""movelog.py - Packed move history of a game.
+
+Each move is stored as one nibble holding the position played, two moves
+per byte with the earlier move in the high nibble. The player of a move
+is implied by turn order, so no name is stored. An odd number of moves
+leaves PAD in the low nibble of the last byte.
+
+Boards with more cells than fit in a nibble store each position as a
+varint instead: 7 bits per byte, low bits first, the high bit set on
+every byte but the last."""
+import re
+
+PAD = 0xF
+MAX_POSITION = 0xE
+
+_LEGACY_MOVE = re.compile(r'\(([^,()]*),(\d+)\),')
+
+
+def fits_nibbles(cells):
+    """Whether the positions of a board of cells fit in a nibble"""
+    return cells <= MAX_POSITION + 1
+
+
+def _varint(position):
+    encoded = ''
+    while position > 0x7F:
+        encoded += chr(position & 0x7F | 0x80)
+        position >>= 7
+    return encoded + chr(position)
+
+
+def append(packed, count, position, wide=False):
+    """Returns the packed history with position appended, count being the
+    number of moves already in it. wide histories hold varints."""
+    if wide:
+        return packed + _varint(position)
+    if not 0 <= position <= MAX_POSITION:
+        raise ValueError('position %s does not fit in a nibble' % position)
+    if count % 2 == 0:
+        return packed + chr(position << 4 | PAD)
+    return packed[:-1] + chr(ord(packed[-1]) & 0xF0 | position)
+
+
+def positions(packed, count, wide=False):
+    """Returns the list of positions played, in order"""
+    played = []
+    if wide:
+        position = shift = 0
+        for byte in bytearray(packed):
+            position |= (byte & 0x7F) << shift
+            shift += 7
+            if not byte & 0x80:
+                played.append(position)
+                position = shift = 0
+        return played[:count]
+    for byte in bytearray(packed):
+        played.append(byte >> 4)
+        played.append(byte & 0xF)
+    return played[:count]
+
+
+def pack(played, wide=False):
+    """Packs a list of positions"""
+    packed = ''
+    for count, position in enumerate(played):
+        packed = append(packed, count, position, wide)
+    return packed
+
+
+def parse_legacy(history):
+    """Returns the [(user_name, position)] of a history stored as
+    '(user_name,position),' strings"""
+    return [(name, int(position))
+            for name, position in _LEGACY_MOVE.findall(history)]
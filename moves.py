@@ -0,0 +1,330 @@
+"""moves.py - Plays moves in tic-tac-toe games.
+
+A move reads the game and the player concurrently through the async
+methods of a repository.Repository, then the players of the game while
+the player may still load. The move is applied in memory, and the game is
+written with its scores in a single put inside a transaction that checks
+the game's version, so concurrent moves on the same game retry instead of
+overwriting each other. Ratings and total scores are updated by a task
+enqueued with the write."""
+import endpoints
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+import chances
+import directory
+import judge
+import leaderboard
+import mnk
+import ratings
+import solver
+from models import COMPUTER_NAME, Score
+from utils import key_from_urlsafe
+
+MAX_ATTEMPTS = 3
+MAX_BATCH_MOVES = 100
+GAME_ENDED_URL = '/tasks/game_ended'
+
+
+class StaleGameError(Exception):
+    """The game was written by someone else since it was read"""
+
+
+def computer_reply(game, computer_key=None):
+    """Plays the computer's move, looked up from the solved game tree of
+    tic-tac-toe. Returns the position played.
+    Args:
+        computer_key: Key of the computer player, directory.get_computer's
+            by default
+    """
+    if computer_key is None:
+        computer_key = directory.get_computer().key
+    if not game.is_tic_tac_toe:
+        ## other boards are too large to solve, play a heuristic move
+        user_bits, opponent_bits = game.marks()
+        if game.user == computer_key:
+            own, other = user_bits, opponent_bits
+        else:
+            own, other = opponent_bits, user_bits
+        position = mnk.heuristic_move(own, other, game.rows, game.cols, game.k)
+    else:
+        if game.user == computer_key:
+            mark = judge.USER
+        else:
+            mark = judge.OPPONENT
+        position = solver.best_move(game.board, mark)
+    game.place_mark(computer_key, position)
+    game.record_move(position)
+    return position
+
+
+def check_move(game, user_of_move, user_name, position, players=None):
+    """Checks that user_of_move may play position in game. players maps
+    the keys of the players to their User when they are already read.
+    Returns:
+        None if the move is legal, else a message explaining why the
+        position cannot be taken.
+    Raises:
+        endpoints.ForbiddenException: If the game is over or canceled, it
+            is not the user's turn or the position is off the grid.
+        endpoints.NotFoundException: If the user does not exist or does
+            not play this game.
+    """
+    if game.game_over:
+        raise endpoints.ForbiddenException('Illegal action: Game is already over.')
+    if game.is_canceled:
+        raise endpoints.ForbiddenException('Illegal action: Game is already canceled.')
+
+    if not user_of_move:
+        raise endpoints.NotFoundException(
+                'User %s does not exist!' % user_name)
+
+    if user_of_move.key != game.user and user_of_move.key != game.opponent:
+        raise endpoints.NotFoundException(
+                'A User with that name %s are not players of current game' % user_name)
+
+    if game.user_of_next_move != user_of_move.key:
+        if players and game.user_of_next_move in players:
+            next_user = players[game.user_of_next_move]
+        else:
+            next_user = game.user_of_next_move.get()
+        raise endpoints.ForbiddenException('User %s is not the game of the current move, %s please!' % (user_name, next_user.name))
+
+    if not 0 <= position < game.cells:
+        raise endpoints.ForbiddenException("position %s is out of the grid! Choose another position" % position)
+
+    if not game.is_free(position):
+        return "position  %s  has already been taken! Choose another position" % position
+    return None
+
+
+def apply_move(game, user_of_move, position, computer_key=None):
+    """Plays a checked move and the computer's reply on the game in memory.
+    computer_key is as in computer_reply.
+    Returns:
+        The judge_game result, with the position the computer played as
+        "reply" (None if it did not play).
+    """
+    game.place_mark(user_of_move.key, position)
+
+    ## after each move, record history
+    game.record_move(position)
+
+    ### after every successful move, check the board board_state
+    ### check whether some one has won, or a tie
+    game_result = game.judge_game()
+
+    ### the computer replies in the same request with a perfect move
+    if computer_key is None:
+        computer_key = directory.get_computer().key
+    reply = None
+    if not game_result["end"] and game.user_of_next_move == computer_key:
+        reply = computer_reply(game, computer_key)
+        game_result = game.judge_game()
+    game_result["reply"] = reply
+    return game_result
+
+
+def result_message(game, game_result, players):
+    """The message sent along with the game after a move"""
+    if game_result["end"]:
+        if game_result["result"] == "TIE":
+            return "Game Over, it is a tie!"
+        return "Game Over, %s has won" % players[game_result["winner"]].name
+
+    next_name = players[game.user_of_next_move].name
+    if game_result["reply"] is not None:
+        return "%s played %s. Next move: %s" % (
+            COMPUTER_NAME, game_result["reply"], next_name)
+    return "Next move: %s" % next_name
+
+
+@ndb.transactional_tasklet(xg=True)
+def commit_async(game, version, entities=()):
+    """Writes game, at the given version when it was read, together with
+    entities in one put. Enqueues the tally of a game that ended.
+    Raises:
+        StaleGameError: If the game was written since it was read.
+    """
+    current = yield game.key.get_async()
+    if current.version != version:
+        raise StaleGameError()
+    game.version = version + 1
+    yield ndb.put_multi_async([game] + list(entities))
+    if game.game_over:
+        taskqueue.add(url=GAME_ENDED_URL,
+                      params={'urlsafe_game_key': game.key.urlsafe()},
+                      transactional=True)
+
+
+def play_move(repository, game_key, user_name, position):
+    """Plays a move against any repository.Repository: NdbRepository for
+    the API, or in memory for simulations and replays. The computer
+    replies in the same call.
+    Returns:
+        (game, message, players) where players maps the keys of both
+        players to their User.
+    Raises:
+        endpoints.NotFoundException: If the game does not exist, see also
+            check_move.
+        StaleGameError: If the game was written since it was read.
+    """
+    game_future = repository.get_game_async(game_key)
+    user_future = repository.get_user_async(user_name)
+    game = game_future.get_result()
+    if game is None:
+        raise endpoints.NotFoundException('Game not found!')
+    players_future = repository.get_users_async([game.user, game.opponent])
+    user_of_move = user_future.get_result()
+    players = players_future.get_result()
+    taken = check_move(game, user_of_move, user_name, position, players)
+    if taken:
+        return game, taken, players
+
+    version = game.version
+    game_result = apply_move(game, user_of_move, position,
+                             repository.computer_key())
+    repository.commit(game, version, game_result.get("scores", ()))
+    return game, result_message(game, game_result, players), players
+
+
+def make_move(repository, game_key, user_name, position):
+    """Plays a move with play_move, retrying from a fresh read when a
+    concurrent move on the same game wins the race.
+    Returns:
+        (game, message, players) as play_move.
+    Raises:
+        endpoints.ConflictException: If the game kept changing, see also
+            play_move.
+    """
+    for _ in range(MAX_ATTEMPTS):
+        try:
+            return play_move(repository, game_key, user_name, position)
+        except StaleGameError:
+            continue
+    raise endpoints.ConflictException(
+            'The game changed while moving, please try again')
+
+
+def make_moves(repository, items):
+    """Plays a batch of moves with the rules of play_move. The games and
+    users are read in concurrent batches, then the players of the games.
+    The moves of each game are applied in order and every game is
+    committed once with repository.commit_multi. A game that changed
+    meanwhile is not retried, its moves fail.
+    Args:
+        items: list of (urlsafe_game_key, user_name, position).
+    Returns:
+        (results, players) where results has a (game, message, error) per
+        item, error being the endpoints exception the move raised or None,
+        and players maps the keys of the players to their User.
+    """
+    results = [None] * len(items)
+    keys = {}
+    for i, (urlsafe, _, _) in enumerate(items):
+        try:
+            keys[i] = key_from_urlsafe(urlsafe)
+        except endpoints.BadRequestException as error:
+            results[i] = (None, None, error)
+
+    ## the users are read while the games load
+    games_future = repository.get_games_async(keys.values())
+    users = repository.get_users_by_name(
+        user_name for _, user_name, _ in items)
+    games = games_future.get_result()
+    player_keys = set()
+    for game in games.itervalues():
+        player_keys.update([game.user, game.opponent])
+    players = repository.get_users(list(player_keys))
+    computer_key = repository.computer_key()
+
+    versions = {}
+    scores = {}
+    for i in sorted(keys):
+        game = games.get(keys[i])
+        if game is None:
+            results[i] = (None, None, endpoints.NotFoundException('Game not found!'))
+            continue
+        _, user_name, position = items[i]
+        try:
+            taken = check_move(game, users.get(user_name), user_name, position,
+                               players)
+        except endpoints.ServiceException as error:
+            results[i] = (game, None, error)
+            continue
+        if taken:
+            results[i] = (game, taken, None)
+            continue
+        versions.setdefault(game.key, game.version)
+        game_result = apply_move(game, users[user_name], position, computer_key)
+        scores.setdefault(game.key, []).extend(game_result.get("scores", ()))
+        results[i] = (game, result_message(game, game_result, players), None)
+
+    stale = repository.commit_multi(
+        [(games[key], version, scores[key])
+         for key, version in versions.iteritems()])
+    if stale:
+        error = endpoints.ConflictException(
+                'The game changed while moving, please try again')
+        for i in keys:
+            if keys[i] in stale:
+                results[i] = (None, None, error)
+    return results, players
+
+
+def cancel_game(repository, game_key):
+    """Cancels a game in progress, retrying from a fresh read when a
+    concurrent move wins the race.
+    Returns:
+        (game, message)
+    Raises:
+        endpoints.NotFoundException: If the game does not exist.
+        endpoints.ConflictException: If the game kept changing.
+    """
+    for _ in range(MAX_ATTEMPTS):
+        game = repository.get_game(game_key)
+        if game is None:
+            raise endpoints.NotFoundException('Game not found!')
+        if game.is_canceled:
+            return game, "You have already canceled the game!"
+        if game.game_over:
+            return game, "Game is already over!"
+        version = game.version
+        game.is_canceled = True
+        try:
+            repository.commit(game, version)
+        except StaleGameError:
+            continue
+        return game, "You just canceled the game!"
+    raise endpoints.ConflictException(
+            'The game changed while canceling, please try again')
+
+
+@ndb.transactional(xg=True)
+def _tally(game_key):
+    game = game_key.get()
+    if game is None or not game.game_over:
+        return None
+    if game.tallied:
+        ## a retry of the task, the updates of tally_game may not have run
+        return ndb.get_multi([game.user, game.opponent])
+    result = game.result
+    players = ratings.record_game(game.user, game.opponent, result)
+    score = Score(result=result)
+    leaderboard.add_score(players[0].name, score.user_score_to_int())
+    leaderboard.add_score(players[1].name, score.opponent_score_to_int())
+    game.tallied = True
+    game.put()
+    return players
+
+
+def tally_game(game_key):
+    """Updates the ratings and total scores of the players of an ended
+    game, exactly once. The caches, leaderboard and winning chances of
+    the players are updated after that on every run, as a retried task
+    must finish them if they failed."""
+    players = _tally(game_key)
+    for player in players or ():
+        directory.invalidate(player.name)
+        leaderboard.publish(player.name)
+        chances.schedule(player.name)
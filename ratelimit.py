@@ -0,0 +1,96 @@
+"""ratelimit.py - Token buckets of the hot endpoints, in memcache.
+
+Buckets belong to client addresses, as the user names clients send are
+not authenticated. A bucket holds the tokens left and the time it was
+last taken from, and refills by the time elapsed since then times the
+rate, up to its capacity. A call takes its tokens, one per move of a
+batch, with compare-and-set, so every instance shares the bucket: an
+allowed call costs two memcache RPCs, a rejected one a single read and
+no token. A missing bucket is full, so a bucket expires when it would
+have refilled anyway. Rejections happen before any datastore RPC.
+
+Limits are capacity/tokens per second per endpoint, overridden in app.yaml
+as RATE_LIMITS: 'make_move=20/5,get_game=60/20,poll_game=60/20'."""
+import os
+import time
+
+import endpoints
+from google.appengine.api import memcache
+
+import metrics
+
+MEMCACHE_PREFIX = 'ratelimit:'
+CAS_RETRIES = 10
+## endpoint: (capacity, tokens per second)
+DEFAULT_LIMITS = {
+    'make_move': (20, 5),
+    'get_game': (60, 20),
+    'poll_game': (60, 20),
+}
+
+
+class RateLimitedException(endpoints.ForbiddenException):
+    """Too many calls of an endpoint by a client"""
+
+
+def _parse_limits(setting):
+    limits = dict(DEFAULT_LIMITS)
+    for item in filter(None, setting.split(',')):
+        endpoint, limit = item.strip().split('=')
+        capacity, rate = limit.split('/')
+        limits[endpoint] = (int(capacity), float(rate))
+    return limits
+
+LIMITS = _parse_limits(os.environ.get('RATE_LIMITS', ''))
+
+
+def _take(key, capacity, rate, count):
+    """Takes up to count tokens from a bucket. Returns how many it took."""
+    client = memcache.Client()
+    expires = int(capacity / rate) + 1
+    bucket = None
+    for _ in range(CAS_RETRIES):
+        now = time.time()
+        bucket = client.gets(key)
+        if bucket is None:
+            taken = min(count, capacity)
+            if client.add(key, (capacity - taken, now), time=expires):
+                return taken
+            continue
+        tokens, updated = bucket
+        tokens = min(capacity, tokens + max(now - updated, 0) * rate)
+        taken = min(count, int(tokens))
+        if not taken:
+            return 0
+        if client.cas(key, (tokens - taken, now), time=expires):
+            return taken
+    ## no bucket could be read or added: memcache is unavailable, do not
+    ## lock players out
+    return count if bucket is None else 0
+
+
+def check(endpoint, client, count=1):
+    """Takes count tokens of client, its address, for endpoint, which must
+    be one of LIMITS or is not limited.
+    Returns:
+        The number of tokens taken, count unless fewer were left.
+    Raises:
+        RateLimitedException: If the client has no token left.
+    """
+    if endpoint not in LIMITS:
+        return count
+    capacity, rate = LIMITS[endpoint]
+    taken = _take('%s%s:%s' % (MEMCACHE_PREFIX, endpoint, client),
+                  capacity, rate, count)
+    metrics.count('rate_allowed', taken)
+    if taken < count:
+        metrics.count('rate_limited', count - taken)
+    if not taken:
+        raise limited(endpoint)
+    return taken
+
+
+def limited(endpoint):
+    """Returns the RateLimitedException of endpoint"""
+    return RateLimitedException(
+            'Too many %s calls, please slow down' % endpoint)
@@ -0,0 +1,103 @@
+"""ratings.py - Elo ratings of users and their ranks.
+
+Ratings are stored on User and updated in a transaction once a game has
+ended. A histogram of ratings in RATING_BUCKET_WIDTH wide buckets
+(models.RatingBucket) answers "what is the rank of this user" by adding
+the counts of the buckets above it instead of scanning users."""
+from google.appengine.ext import ndb
+
+import models
+
+INITIAL_RATING = 1200.0
+K_FACTOR = 32
+RATING_BUCKET_WIDTH = 25
+## most users listed by get_top
+MAX_TOP = 100
+
+
+def bucket_floor(rating):
+    return int(rating // RATING_BUCKET_WIDTH) * RATING_BUCKET_WIDTH
+
+
+def bucket_key(floor):
+    return ndb.Key(models.RatingBucket, str(floor))
+
+
+def expected_score(rating, opponent_rating):
+    """The Elo expected score of a player against an opponent"""
+    return 1.0 / (1.0 + 10 ** ((opponent_rating - rating) / 400.0))
+
+
+@ndb.transactional(xg=True)
+def _rate(user_key, opponent_key, user_score):
+    user, opponent = ndb.get_multi([user_key, opponent_key])
+    old_ratings = [user.rating, opponent.rating]
+    user_rating = user.rating_or_initial()
+    opponent_rating = opponent.rating_or_initial()
+    expected = expected_score(user_rating, opponent_rating)
+    user.rating = user_rating + K_FACTOR * (user_score - expected)
+    opponent.rating = opponent_rating - K_FACTOR * (user_score - expected)
+    user.rated_games = (user.rated_games or 0) + 1
+    opponent.rated_games = (opponent.rated_games or 0) + 1
+
+    ## move both players in the histogram
+    deltas = {}
+    for old, player in zip(old_ratings, (user, opponent)):
+        new_floor = bucket_floor(player.rating)
+        if old is not None:
+            old_floor = bucket_floor(old)
+            if old_floor == new_floor:
+                continue
+            deltas[old_floor] = deltas.get(old_floor, 0) - 1
+        deltas[new_floor] = deltas.get(new_floor, 0) + 1
+
+    floors = list(deltas)
+    buckets = ndb.get_multi([bucket_key(floor) for floor in floors])
+    for i, floor in enumerate(floors):
+        if buckets[i] is None:
+            buckets[i] = models.RatingBucket(key=bucket_key(floor),
+                                             floor=floor)
+        buckets[i].count += deltas[floor]
+    ndb.put_multi([user, opponent] + buckets)
+    return user, opponent
+
+
+def record_game(user_key, opponent_key, result):
+    """Updates the ratings of both players of a game that ended with
+    result (a models.Result for the user). Joins the current transaction
+    if there is one; the players must be dropped from the directory once
+    it commits.
+    Returns:
+        The updated user and opponent.
+    """
+    if result == models.Result.WIN:
+        user_score = 1.0
+    elif result == models.Result.TIE:
+        user_score = 0.5
+    else:
+        user_score = 0.0
+    return _rate(user_key, opponent_key, user_score)
+
+
+def get_top(max_number):
+    """Returns the max_number best rated users, at most MAX_TOP"""
+    limit = min(max_number, MAX_TOP)
+    if limit < 1:
+        return []
+    users = models.User.query().order(-models.User.rating).fetch(limit)
+    ## users who never played a game sort last
+    return [user for user in users if user.rating is not None]
+
+
+def get_rank(user):
+    """Returns the 1-based rank of a user by rating, None if unrated"""
+    if user.rating is None:
+        return None
+    floor = bucket_floor(user.rating)
+    above = models.RatingBucket.query(models.RatingBucket.floor > floor)
+    higher = sum(bucket.count for bucket in above)
+    ## only the users of the same bucket are looked at
+    higher += models.User.query(
+        models.User.rating > user.rating,
+        models.User.rating < floor + RATING_BUCKET_WIDTH).count()
+    return higher + 1
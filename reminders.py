@@ -0,0 +1,135 @@
+"""reminders.py - Reminder emails about unfinished games.
+
+The cron job splits the users into up to SHARDS ranges of keys, split at
+a random sample of user keys read through the __scatter__ property, and
+enqueues the first batch of each shard. The shards run in parallel, so
+a run takes about as long as its largest shard. Each batch task pages
+through the active games of its shard, ordered by user, from the cursor
+it was given, hands the rest of the shard to the next task, and sends one
+digest email per user of its slice. Shards and slices end on a user
+boundary, so a user's games are never split over two digests."""
+import logging
+import time
+
+from google.appengine.api import app_identity, mail
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+
+import taskchain
+from models import Game, GameStatus, User
+
+BATCH_URL = '/tasks/send_reminders'
+BATCH_SIZE = 200
+SHARDS = 16
+## user keys sampled per shard, to even out the ranges
+OVERSAMPLING = 32
+## a slice stops at the first user boundary after this time
+TIME_BUDGET_SECONDS = 60
+## a user with more games than fit in this time is cut in the middle
+HARD_TIME_BUDGET_SECONDS = 2 * TIME_BUDGET_SECONDS
+MAX_GAMES_LISTED = 20
+
+
+def _split_points(shards):
+    """Returns up to shards - 1 sorted user keys splitting the users into
+    ranges of about the same size"""
+    ## entities get a __scatter__ property at random, ordering by it
+    ## samples the keys
+    keys = User.query().order(ndb.GenericProperty('__scatter__')).fetch(
+        shards * OVERSAMPLING, keys_only=True)
+    keys.sort()
+    step = max(len(keys) // shards, 1)
+    return sorted(set(keys[step::step][:shards - 1]))
+
+
+def start():
+    """Starts a reminder run, one chain of batches per shard"""
+    run = taskchain.new_run()
+    points = _split_points(SHARDS)
+    for shard, (first, end) in enumerate(zip([None] + points,
+                                             points + [None])):
+        _enqueue(run, shard, 0, None, first=first, end=end)
+
+
+def _urlsafe(value):
+    return value.urlsafe() if value else None
+
+
+def _enqueue(run, shard, page, cursor, skip_user=None, first=None,
+             end=None):
+    taskchain.enqueue(BATCH_URL, 'reminders-%d' % shard, run, page,
+                      shard=shard, cursor=_urlsafe(cursor),
+                      skip_user=_urlsafe(skip_user),
+                      first_user=_urlsafe(first), end_user=_urlsafe(end))
+
+
+def send_batch(run, page, cursor=None, skip_user=None, shard=0,
+               first_user=None, end_user=None):
+    """Sends the digests of one slice of the active games of a shard.
+    Args:
+        run: Id of the reminder run
+        page: Number of the slice in the shard
+        cursor: Urlsafe cursor where the slice starts
+        skip_user: Urlsafe key of a user whose digest was already sent by
+            the previous slice
+        shard: Number of the shard in the run
+        first_user, end_user: Urlsafe keys of the first user of the shard
+            and of the first user past it, None for no bound
+    """
+    began = time.time()
+    skip_user = ndb.Key(urlsafe=skip_user) if skip_user else None
+    first = ndb.Key(urlsafe=first_user) if first_user else None
+    end = ndb.Key(urlsafe=end_user) if end_user else None
+    ### only the key and user of each game are needed, read them from the index
+    query = Game.query(Game.status == GameStatus.ACTIVE.name)
+    if first:
+        query = query.filter(Game.user >= first)
+    if end:
+        query = query.filter(Game.user < end)
+    query = query.order(Game.user)
+    games = query.iter(start_cursor=Cursor(urlsafe=cursor) if cursor else None,
+                       produce_cursors=True, projection=[Game.user])
+
+    digests = {}
+    last_user = None
+    count = 0
+    for game in games:
+        elapsed = time.time() - began
+        if game.user != last_user:
+            if count >= BATCH_SIZE or elapsed > TIME_BUDGET_SECONDS:
+                _enqueue(run, shard, page + 1, games.cursor_before(),
+                         first=first, end=end)
+                break
+            last_user = game.user
+        elif elapsed > HARD_TIME_BUDGET_SECONDS:
+            _enqueue(run, shard, page + 1, games.cursor_before(), game.user,
+                     first=first, end=end)
+            break
+        count += 1
+        if game.user == skip_user:
+            continue
+        digests.setdefault(game.user, []).append(game)
+
+    _send_digests(digests)
+
+
+def _send_digests(digests):
+    app_id = app_identity.get_application_id()
+    users = ndb.get_multi(digests.keys())
+    for user in users:
+        if user is None or user.email is None:
+            continue
+        games = digests[user.key]
+        keys = '\n'.join(game.key.urlsafe() for game in games[:MAX_GAMES_LISTED])
+        if len(games) > MAX_GAMES_LISTED:
+            keys += '\n...'
+        subject = 'This is a reminder!'
+        body = 'Hello {}, You have {} unfinished Tic-Tac-Toe! urlsafe_game_keys are\n{}'.format(
+            user.name, len(games), keys)
+        # This will send test emails, the arguments to send_mail are:
+        # from, to, subject, body
+        mail.send_mail('noreply@{}.appspotmail.com'.format(app_id),
+                       user.email,
+                       subject,
+                       body)
+    logging.info('Sent %s reminder digests', len(users))
@@ -0,0 +1,214 @@
+"""repository.py - Storage of users, games and scores behind one interface.
+
+The rules of a move (moves.check_move, moves.apply_move, Game.judge_game)
+only change entities in memory. A Repository reads and writes them, so
+the moves of make_move, make_moves and cancel_game in moves.py run
+against either NdbRepository, the datastore, or MemoryRepository, plain
+dicts that let simulations, benchmarks and bulk replays run at CPU speed
+without any API call."""
+import abc
+import itertools
+
+from google.appengine.ext import ndb
+
+import directory
+import moves
+from models import COMPUTER_NAME, Game, User
+
+
+def _finished(result):
+    """Returns a future already set to result"""
+    future = ndb.Future()
+    future.set_result(result)
+    return future
+
+
+class Repository(object):
+    """The storage of users, games and scores used by moves.py. The batch
+    methods default to one call per entity, and the async ones to a
+    finished future of their synchronous method."""
+    __metaclass__ = abc.ABCMeta
+
+    @abc.abstractmethod
+    def get_user(self, name):
+        """Returns the User with the given name or None"""
+
+    def get_user_async(self, name):
+        """Returns a future of get_user"""
+        return _finished(self.get_user(name))
+
+    def get_users_by_name(self, names):
+        """Returns a dict of name to User of the names that exist"""
+        users = dict((name, self.get_user(name)) for name in set(names))
+        return dict((name, user) for name, user in users.iteritems() if user)
+
+    @abc.abstractmethod
+    def get_users(self, keys):
+        """Returns a dict of key to User of the keys that exist"""
+
+    def get_users_async(self, keys):
+        """Returns a future of get_users"""
+        return _finished(self.get_users(keys))
+
+    @abc.abstractmethod
+    def get_game(self, key):
+        """Returns the Game with the given key or None"""
+
+    def get_game_async(self, key):
+        """Returns a future of get_game"""
+        return _finished(self.get_game(key))
+
+    def get_games(self, keys):
+        """Returns a dict of key to Game of the keys that exist"""
+        games = dict((key, self.get_game(key)) for key in set(keys))
+        return dict((key, game) for key, game in games.iteritems() if game)
+
+    def get_games_async(self, keys):
+        """Returns a future of get_games"""
+        return _finished(self.get_games(keys))
+
+    @abc.abstractmethod
+    def add_user(self, name, email=None):
+        """Creates a user. Returns the User, or None if the name is taken."""
+
+    @abc.abstractmethod
+    def add_game(self, game):
+        """Stores a new Game, as built by Game.build. Returns its key."""
+
+    @abc.abstractmethod
+    def commit(self, game, version, scores=()):
+        """Writes game, at the version it was read at, with its scores.
+        Raises:
+            moves.StaleGameError: If the game was written since it was read.
+        """
+
+    def commit_multi(self, commits):
+        """Writes a list of (game, version, scores) as commit does.
+        Returns the set of keys of the games written since they were read."""
+        stale = set()
+        for game, version, scores in commits:
+            try:
+                self.commit(game, version, scores)
+            except moves.StaleGameError:
+                stale.add(game.key)
+        return stale
+
+    @abc.abstractmethod
+    def computer_key(self):
+        """Returns the key of the computer player"""
+
+
+class NdbRepository(Repository):
+    """The datastore, through the user directory and moves.commit_async"""
+
+    def get_user(self, name):
+        return directory.get_user(name)
+
+    def get_user_async(self, name):
+        return directory.get_user_async(name)
+
+    def get_users_by_name(self, names):
+        return directory.get_users(names)
+
+    def get_users(self, keys):
+        return self.get_users_async(keys).get_result()
+
+    @ndb.tasklet
+    def get_users_async(self, keys):
+        users = yield ndb.get_multi_async(keys)
+        raise ndb.Return(dict((user.key, user) for user in users if user))
+
+    def get_game(self, key):
+        return self.get_game_async(key).get_result()
+
+    @ndb.tasklet
+    def get_game_async(self, key):
+        ## the context cache would return a game changed by a failed commit
+        game = yield key.get_async(use_cache=False)
+        raise ndb.Return(game if isinstance(game, Game) else None)
+
+    def get_games(self, keys):
+        return self.get_games_async(keys).get_result()
+
+    @ndb.tasklet
+    def get_games_async(self, keys):
+        keys = list(set(keys))
+        games = yield ndb.get_multi_async(keys, use_cache=False)
+        raise ndb.Return(dict((key, game) for key, game in zip(keys, games)
+                              if isinstance(game, Game)))
+
+    def add_user(self, name, email=None):
+        return directory.create_user(name, email)
+
+    def add_game(self, game):
+        return game.put()
+
+    def commit(self, game, version, scores=()):
+        moves.commit_async(game, version, scores).get_result()
+
+    def commit_multi(self, commits):
+        ## all games are committed concurrently
+        futures = [(game.key, moves.commit_async(game, version, scores))
+                   for game, version, scores in commits]
+        stale = set()
+        for key, future in futures:
+            try:
+                future.get_result()
+            except moves.StaleGameError:
+                stale.add(key)
+        return stale
+
+    def computer_key(self):
+        return directory.get_computer().key
+
+
+class MemoryRepository(Repository):
+    """Keeps entities in dicts of the process. Entities are shared, not
+    copied, and ended games are not tallied. Keys belong to the app id
+    APP so they never clash with stored ones."""
+    APP = 'memory'
+
+    def __init__(self):
+        self.users = {}
+        self.games = {}
+        self.scores = []
+        self._versions = {}
+        self._ids = itertools.count(1)
+        self._computer = None
+
+    def get_user(self, name):
+        return self.users.get(ndb.Key(User, name, app=self.APP))
+
+    def get_users(self, keys):
+        return dict((key, self.users[key]) for key in keys if key in self.users)
+
+    def get_game(self, key):
+        return self.games.get(key)
+
+    def add_user(self, name, email=None):
+        key = ndb.Key(User, name, app=self.APP)
+        if key in self.users:
+            return None
+        user = User(key=key, name=name, email=email)
+        self.users[key] = user
+        return user
+
+    def add_game(self, game):
+        game.key = ndb.Key(Game, next(self._ids), app=self.APP)
+        self.games[game.key] = game
+        self._versions[game.key] = game.version
+        return game.key
+
+    def commit(self, game, version, scores=()):
+        if self._versions.get(game.key) != version:
+            raise moves.StaleGameError()
+        game.version = version + 1
+        self._versions[game.key] = game.version
+        self.games[game.key] = game
+        self.scores.extend(scores)
+
+    def computer_key(self):
+        if self._computer is None:
+            self._computer = (self.add_user(COMPUTER_NAME) or
+                              self.get_user(COMPUTER_NAME))
+        return self._computer.key
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+"""selfplay.py - Plays tic-tac-toe between policies to make priors.
+
+Every ordered pair of policies plays --games games with the rules of
+judge.py. The games are split in chunks of CHUNK_GAMES, each with its own
+seed derived from --seed, and played by a pool of processes, so the
+table is the same whatever the number of processes. The table holds the
+outcome probabilities of each pair of policies after every opening of
+up to --depth moves, and chances.py reads it as priors.
+
+    python selfplay.py --games 1000000 --processes 8 --output priors.json
+"""
+import argparse
+import json
+import multiprocessing
+import random
+import time
+
+import judge
+import solver
+
+POLICIES = ('random', 'greedy', 'perfect')
+CHUNK_GAMES = 10000
+## outcome counts of a table row
+FIRST_WINS, SECOND_WINS, TIES = range(3)
+
+
+def _winning_positions(code, mark):
+    won = judge.USER_WINS if mark == judge.USER else judge.OPPONENT_WINS
+    return [position for position in judge.free_positions(code)
+            if judge.outcome(judge.place(code, position, mark)) == won]
+
+
+def random_policy(code, mark, rng):
+    return rng.choice(judge.free_positions(code))
+
+
+def greedy_policy(code, mark, rng):
+    """Wins if it can, else blocks a win of the other player, else plays
+    at random"""
+    other = judge.OPPONENT if mark == judge.USER else judge.USER
+    for positions in (_winning_positions(code, mark),
+                      _winning_positions(code, other)):
+        if positions:
+            return rng.choice(positions)
+    return random_policy(code, mark, rng)
+
+
+def perfect_policy(code, mark, rng):
+    return solver.best_move(code, mark)
+
+
+_POLICIES = {
+    'random': random_policy,
+    'greedy': greedy_policy,
+    'perfect': perfect_policy,
+}
+
+
+def play(first, second, rng):
+    """Plays a game, first moving first. Returns the positions played
+    and the judge outcome."""
+    policies = ((_POLICIES[first], judge.USER), (_POLICIES[second], judge.OPPONENT))
+    code = judge.EMPTY_BOARD
+    played = []
+    outcome = judge.ONGOING
+    while outcome == judge.ONGOING:
+        policy, mark = policies[len(played) % 2]
+        position = policy(code, mark, rng)
+        code = judge.place(code, position, mark)
+        played.append(position)
+        outcome = judge.outcome(code)
+    return played, outcome
+
+
+def opening(played, depth):
+    return ','.join(str(position) for position in played[:depth])
+
+
+def play_chunk(task):
+    """Plays a chunk of games of a pair. Returns the outcome counts of
+    every opening of up to depth moves."""
+    first, second, games, seed, depth = task
+    rng = random.Random(seed)
+    counts = {}
+    column = {judge.USER_WINS: FIRST_WINS, judge.OPPONENT_WINS: SECOND_WINS,
+              judge.TIE: TIES}
+    for _ in range(games):
+        played, outcome = play(first, second, rng)
+        for moves in range(min(depth, len(played)) + 1):
+            row = counts.setdefault(opening(played, moves), [0, 0, 0])
+            row[column[outcome]] += 1
+    return first, second, counts
+
+
+def _tasks(policies, games, seed, depth):
+    pairs = [(first, second) for first in policies for second in policies]
+    for index, (first, second) in enumerate(pairs):
+        for chunk, start in enumerate(range(0, games, CHUNK_GAMES)):
+            ## a seed per chunk, independent of the process playing it
+            chunk_seed = hash((seed, index, chunk)) & 0xFFFFFFFF
+            yield first, second, min(CHUNK_GAMES, games - start), chunk_seed, depth
+
+
+def simulate(policies, games, seed=0, depth=2, processes=None):
+    """Plays games games between every ordered pair of policies. Returns
+    {'first-second': {opening: [first wins, second wins, ties]}}"""
+    pool = multiprocessing.Pool(processes, initializer=solver.warm)
+    try:
+        results = pool.imap_unordered(play_chunk,
+                                      _tasks(policies, games, seed, depth))
+        table = {}
+        for first, second, counts in results:
+            rows = table.setdefault('%s-%s' % (first, second), {})
+            for key, row in counts.iteritems():
+                total = rows.setdefault(key, [0, 0, 0])
+                for i, count in enumerate(row):
+                    total[i] += count
+    finally:
+        pool.close()
+        pool.join()
+    return table
+
+
+def probabilities(table):
+    """Turns the counts of each row into [games, P(first wins),
+    P(second wins), P(tie)]"""
+    return dict(
+        (pair, dict((key, [sum(row)] + [round(count / float(sum(row)), 4)
+                                       for count in row])
+                    for key, row in rows.iteritems()))
+        for pair, rows in table.iteritems())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--games', type=int, default=100000,
+                        help='games per ordered pair of policies')
+    parser.add_argument('--policies', nargs='+', choices=POLICIES,
+                        default=list(POLICIES))
+    parser.add_argument('--depth', type=int, default=2,
+                        help='longest opening in the table, in moves')
+    parser.add_argument('--processes', type=int,
+                        default=multiprocessing.cpu_count())
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', default='priors.json')
+    args = parser.parse_args()
+
+    began = time.time()
+    table = simulate(args.policies, args.games, args.seed, args.depth,
+                     args.processes)
+    elapsed = time.time() - began
+    games = args.games * len(args.policies) ** 2
+    print '%d games in %.1f s, %.0f games/s on %d processes' % (
+        games, elapsed, games / elapsed, args.processes)
+    with open(args.output, 'w') as output:
+        json.dump({'games': args.games, 'seed': args.seed, 'depth': args.depth,
+                   'pairs': probabilities(table)},
+                  output, sort_keys=True, separators=(',', ':'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+"""solver.py - Perfect play for the "computer" player.
+
+The whole tic-tac-toe game tree is solved once per instance with negamax.
+Boards are normalized so the player to move owns the USER digit and are
+reduced over the 8 symmetries of the square, which leaves a few hundred
+positions to memoize. Finding a reply is then a dictionary lookup."""
+import threading
+
+import judge
+
+## each symmetry maps a position of the canonical board to a position of
+## the original board
+SYMMETRIES = (
+    (0, 1, 2, 3, 4, 5, 6, 7, 8),  # identity
+    (6, 3, 0, 7, 4, 1, 8, 5, 2),  # rotate 90
+    (8, 7, 6, 5, 4, 3, 2, 1, 0),  # rotate 180
+    (2, 5, 8, 1, 4, 7, 0, 3, 6),  # rotate 270
+    (2, 1, 0, 5, 4, 3, 8, 7, 6),  # mirror left-right
+    (6, 7, 8, 3, 4, 5, 0, 1, 2),  # mirror top-bottom
+    (0, 3, 6, 1, 4, 7, 2, 5, 8),  # main diagonal
+    (8, 5, 2, 7, 4, 1, 6, 3, 0),  # anti diagonal
+)
+
+## canonical board -> (value for the player to move, best position)
+_solutions = {}
+_lock = threading.Lock()
+_warm = False
+
+
+def swap(code):
+    """Exchanges the USER and OPPONENT marks of a board"""
+    swapped = 0
+    for i, digit in enumerate(judge.digits(code)):
+        if digit:
+            swapped += (3 - digit) * judge.POW3[i]
+    return swapped
+
+
+def canonical(code):
+    """Returns the smallest symmetric image of a board and the symmetry
+    that produced it"""
+    cells = judge.digits(code)
+    best = None
+    for symmetry in SYMMETRIES:
+        image = 0
+        for i, source in enumerate(symmetry):
+            image += cells[source] * judge.POW3[i]
+        if best is None or image < best[0]:
+            best = (image, symmetry)
+    return best
+
+
+def _solve(code):
+    """Negamax over a canonical board where USER is to move. Faster wins
+    and slower losses score higher."""
+    if code in _solutions:
+        return _solutions[code]
+
+    free = judge.free_positions(code)
+    outcome = judge.outcome(code)
+    if outcome == judge.OPPONENT_WINS:
+        solution = (-(len(free) + 1), None)
+    elif outcome == judge.USER_WINS:
+        solution = (len(free) + 1, None)
+    elif outcome == judge.TIE:
+        solution = (0, None)
+    else:
+        solution = None
+        for position in free:
+            child = swap(judge.place(code, position, judge.USER))
+            value = -_solve(canonical(child)[0])[0]
+            if solution is None or value > solution[0]:
+                solution = (value, position)
+
+    _solutions[code] = solution
+    return solution
+
+
+def warm():
+    """Solves the game tree from the empty board"""
+    global _warm
+    if not _warm:
+        with _lock:
+            if not _warm:
+                judge.outcomes()
+                _solve(judge.EMPTY_BOARD)
+                _warm = True
+
+
+def best_move(code, mark):
+    """Returns the best position for mark (judge.USER or judge.OPPONENT)
+    to play on an encoded board, or None if the game is over"""
+    warm()
+    if mark == judge.OPPONENT:
+        code = swap(code)
+    image, symmetry = canonical(code)
+    if image in _solutions:
+        position = _solutions[image][1]
+    else:
+        ## a board that cannot be reached by legal play
+        with _lock:
+            position = _solve(image)[1]
+    if position is None:
+        return None
+    return symmetry[position]
@@ -0,0 +1,33 @@
+"""taskchain.py - Long jobs run as a chain of tasks.
+
+Each task of a run handles one page, from the cursor it was given, and
+enqueues the next page before it ends. Tasks are named after their run
+and page, so a retried task does not chain its successor twice. Pages are
+read with utils.query_page."""
+import uuid
+
+from google.appengine.api import taskqueue
+
+
+def new_run():
+    """Returns a unique id for a run"""
+    return uuid.uuid4().hex
+
+
+def enqueue(url, prefix, run, page, **params):
+    """Enqueues the task of one page of a run.
+    Args:
+        url: The task handler, which gets run, page and params
+        prefix: Name of the kind of job, names the tasks
+        run: Id of the run
+        page: Number of the page in the run
+        params: More task parameters, the ones that are None are left out
+    """
+    params = dict((name, value) for name, value in params.iteritems()
+                  if value is not None)
+    params.update(run=run, page=page)
+    try:
+        taskqueue.add(url=url, params=params,
+                      name='%s-%s-%d' % (prefix, run, page))
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        pass
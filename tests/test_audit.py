@@ -0,0 +1,35 @@
+"""Tests of the vectorized judging of audit.py, which needs numpy and the
+App Engine SDK on the path"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import judge
+try:
+    import audit
+except ImportError:
+    audit = None
+
+
+@unittest.skipIf(audit is None, 'numpy or the App Engine SDK is missing')
+class JudgeBoardsTest(unittest.TestCase):
+
+    def test_matches_judge(self):
+        import numpy as np
+        cells = np.array([judge.digits(code) for code in range(judge.STATES)],
+                         dtype=np.int8)
+        outcomes = audit.judge_boards(cells)
+        for code in range(judge.STATES):
+            self.assertEqual(outcomes[code], judge.outcome(code))
+
+    def test_to_cells(self):
+        cells = audit.to_cells(['-O--XO--X', 'XXX------'], ['O', 'X'])
+        self.assertEqual(cells.tolist()[0], judge.digits(
+            judge.encode('-O--XO--X', 'O', 'X')))
+        self.assertEqual(cells.tolist()[1], [1, 1, 1] + [0] * 6)
+
+
+if __name__ == '__main__':
+    unittest.main()
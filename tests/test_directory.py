@@ -0,0 +1,75 @@
+"""Tests of the lookups of directory.py on the datastore stub, which needs
+the App Engine SDK on the path"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from google.appengine.datastore import datastore_stub_util
+    from google.appengine.ext import ndb, testbed
+    import backfill
+    import directory
+    import models
+except ImportError:
+    directory = None
+
+
+@unittest.skipIf(directory is None, 'the App Engine SDK is missing')
+class DirectoryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub(
+            consistency_policy=datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+                probability=1))
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub()
+        ndb.get_context().clear_cache()
+        directory._local.clear()
+        directory._computer = None
+        directory._names_mapped = False
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def test_create_and_get(self):
+        user = directory.create_user('alice', 'a@example.com')
+        self.assertEqual(user.key, ndb.Key(models.User, 'alice'))
+        self.assertIsNone(directory.create_user('alice'))
+        self.assertEqual(directory.get_user('alice').email, 'a@example.com')
+        self.assertEqual(directory.get_users(['alice', 'bob']).keys(),
+                         ['alice'])
+
+    def test_legacy_user_before_backfill(self):
+        legacy = models.User(name='old')
+        legacy.put()
+        self.assertEqual(directory.get_user('old').key, legacy.key)
+        self.assertIsNotNone(models.UserName.get_by_id('old'))
+        self.assertIsNone(directory.create_user('old'))
+
+    def test_legacy_name_not_registered_again(self):
+        legacy = models.User(name='old')
+        legacy.put()
+        self.assertIsNone(directory.create_user('old'))
+        self.assertIsNone(models.User.get_by_id('old'))
+
+    def test_legacy_computer_kept(self):
+        computer = models.User(name=models.COMPUTER_NAME)
+        computer.put()
+        self.assertEqual(directory.get_computer().key, computer.key)
+
+    def test_backfill_done_stops_queries(self):
+        legacy = models.User(name='old')
+        legacy.put()
+        backfill.user_names_batch('run', 0)
+        self.assertIsNotNone(backfill.USER_NAMES_DONE.get())
+        self.assertIsNone(directory.get_user('nobody'))
+        self.assertTrue(directory._names_mapped)
+        self.assertEqual(directory.get_user('old').key, legacy.key)
+
+
+if __name__ == '__main__':
+    unittest.main()
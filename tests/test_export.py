@@ -0,0 +1,76 @@
+"""Tests of the chunked exports of export.py on the datastore stub, which
+needs the App Engine SDK on the path"""
+import gzip
+import io
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from google.appengine.datastore import datastore_stub_util
+    from google.appengine.ext import ndb, testbed
+    import export
+    import models
+except ImportError:
+    export = None
+
+
+@unittest.skipIf(export is None, 'the App Engine SDK is missing')
+class ExportTest(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub(
+            consistency_policy=datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+                probability=1))
+        self.testbed.init_memcache_stub()
+        ndb.get_context().clear_cache()
+        alice = models.User(id='alice', name='alice').put()
+        bob = models.User(id='bob', name='bob').put()
+        for _ in range(3):
+            models.Game.build(user=alice, user_tic='O', opponent=bob,
+                              opponent_tic='X', user_of_next_move=alice).put()
+        self.directory = tempfile.mkdtemp()
+        self.page_size = export.PAGE_SIZE
+        self.chunk_pages = export.CHUNK_PAGES
+        export.PAGE_SIZE = 1
+        export.CHUNK_PAGES = 2
+
+    def tearDown(self):
+        export.PAGE_SIZE = self.page_size
+        export.CHUNK_PAGES = self.chunk_pages
+        shutil.rmtree(self.directory)
+        self.testbed.deactivate()
+
+    def test_sinks_number_chunks_from_one(self):
+        run = export.create('game', 'csv')
+        job = export.run_job(run, export.EntitySink())
+        self.assertTrue(job.done)
+        self.assertEqual((job.chunks, job.rows), (2, 3))
+        self.assertEqual(
+            sorted(chunk.key.id() for chunk in
+                   models.ExportChunk.query(ancestor=job.key)), [1, 2])
+
+        run = export.create('game', 'csv')
+        export.run_job(run, export.FileSink(self.directory))
+        self.assertEqual(sorted(os.listdir(self.directory)),
+                         ['%s-%s-%05d.csv.gz' % ('game', run, number)
+                          for number in (1, 2)])
+
+    def test_csv_rows(self):
+        run = export.create('game', 'csv')
+        export.run_job(run, export.EntitySink())
+        chunk = models.ExportChunk.get_by_id(1, parent=ndb.Key(models.ExportJob, run))
+        lines = gzip.GzipFile(fileobj=io.BytesIO(chunk.data)).read().splitlines()
+        self.assertEqual(lines[0].split(','), list(export.KINDS['game'][3]))
+        self.assertEqual(len(lines), 3)
+        self.assertIn('alice,bob', lines[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+"""Tests of the versioned game cache of gamecache.py on the datastore and
+memcache stubs, which needs the App Engine SDK on the path"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from google.appengine.datastore import datastore_stub_util
+    from google.appengine.ext import ndb, testbed
+    import gamecache
+    import models
+except ImportError:
+    gamecache = None
+
+
+@unittest.skipIf(gamecache is None, 'the App Engine SDK is missing')
+class GameCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub(
+            consistency_policy=datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+                probability=1))
+        self.testbed.init_memcache_stub()
+        ndb.get_context().clear_cache()
+        alice = models.User(id='alice', name='alice').put()
+        bob = models.User(id='bob', name='bob').put()
+        self.game = models.Game.build(
+            user=alice, user_tic='O', opponent=bob, opponent_tic='X',
+            user_of_next_move=alice)
+        self.urlsafe = self.game.put().urlsafe()
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def test_get_reads_through(self):
+        self.assertIsNone(gamecache.get_version(self.urlsafe))
+        form = gamecache.get(self.urlsafe)
+        self.assertEqual(form.board_state, '---------')
+        self.assertEqual(gamecache.get_version(self.urlsafe), 0)
+        self.assertEqual(gamecache.get_form(self.urlsafe).urlsafe_key,
+                         self.urlsafe)
+
+    def test_missing_game(self):
+        self.game.key.delete()
+        self.assertIsNone(gamecache.get(self.urlsafe))
+
+    def test_store_keeps_message_out(self):
+        form = self.game.to_form('Next move: alice')
+        gamecache.store(form)
+        self.assertEqual(form.message, 'Next move: alice')
+        self.assertEqual(gamecache.get_form(self.urlsafe).message, '')
+
+    def test_version_never_moves_back(self):
+        self.game.version = 2
+        gamecache.store(self.game.to_form(''))
+        self.game.version = 1
+        gamecache.store(self.game.to_form(''))
+        self.assertEqual(gamecache.get_version(self.urlsafe), 2)
+        self.assertIsNotNone(gamecache.get_form(self.urlsafe, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
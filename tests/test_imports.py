@@ -0,0 +1,54 @@
+"""Tests of the cold start of the apps: importing api and main in a fresh
+interpreter, which needs the App Engine SDK on the path"""
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+try:
+    import endpoints
+    from google.appengine.ext import ndb
+except ImportError:
+    endpoints = None
+
+## generous, an import this slow means something heavy is loaded eagerly
+IMPORT_SECONDS_LIMIT = 5
+## only the instances running an audit load these
+LAZY_MODULES = ('audit', 'numpy')
+
+IMPORT_APPS = '''
+import json
+import sys
+import time
+started = time.time()
+import api
+import main
+print json.dumps({'seconds': time.time() - started,
+                  'modules': sorted(sys.modules)})
+'''
+
+
+@unittest.skipIf(endpoints is None, 'the App Engine SDK is missing')
+class ImportTest(unittest.TestCase):
+
+    def setUp(self):
+        environment = dict(os.environ)
+        environment['PYTHONPATH'] = os.pathsep.join(sys.path)
+        output = subprocess.check_output([sys.executable, '-c', IMPORT_APPS],
+                                         cwd=ROOT, env=environment)
+        self.imported = json.loads(output.splitlines()[-1])
+
+    def test_lazy_modules_not_loaded(self):
+        for module in LAZY_MODULES:
+            self.assertNotIn(module, self.imported['modules'])
+
+    def test_import_time(self):
+        self.assertLess(self.imported['seconds'], IMPORT_SECONDS_LIMIT)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+"""Tests of judge.py, run with python -m unittest discover tests"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import judge
+
+
+class JudgeTest(unittest.TestCase):
+
+    def test_table_matches_cells(self):
+        table = judge.outcomes()
+        self.assertEqual(len(table), judge.STATES)
+        for code in range(judge.STATES):
+            self.assertEqual(table[code], judge._judge_cells(judge.digits(code)))
+
+    def test_outcomes(self):
+        cases = [
+            ('---------', judge.ONGOING),
+            ('OOO-XX---', judge.USER_WINS),
+            ('O-XOX-X--', judge.OPPONENT_WINS),
+            ('OXOOXXXOO', judge.TIE),
+            ('XXXOOO---', judge.TIE),
+        ]
+        for board, expected in cases:
+            self.assertEqual(judge.outcome(judge.encode(board, 'O', 'X')),
+                             expected, board)
+
+    def test_encode_render_round_trip(self):
+        for board in ('---------', '-O--XO--X', 'OXOOXXXOO'):
+            code = judge.encode(board, 'O', 'X')
+            self.assertEqual(judge.render(code, 'O', 'X'), board)
+
+    def test_place(self):
+        code = judge.place(judge.EMPTY_BOARD, 4, judge.USER)
+        self.assertEqual(judge.cell(code, 4), judge.USER)
+        self.assertFalse(judge.is_free(code, 4))
+        self.assertFalse(judge.is_free(code, judge.SIZE))
+        self.assertEqual(judge.free_positions(code), [0, 1, 2, 3, 5, 6, 7, 8])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+"""Tests of the total scores and leaderboard of leaderboard.py on the
+datastore stub, which needs the App Engine SDK on the path"""
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+try:
+    from google.appengine.api import memcache
+    from google.appengine.datastore import datastore_stub_util
+    from google.appengine.ext import ndb, testbed
+    import leaderboard
+    import models
+except ImportError:
+    leaderboard = None
+
+
+@unittest.skipIf(leaderboard is None, 'the App Engine SDK is missing')
+class LeaderboardTest(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub(
+            consistency_policy=datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+                probability=1))
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub(root_path=ROOT)
+        ndb.get_context().clear_cache()
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def persist_tasks(self):
+        return [task for task in
+                self.testbed.get_stub('taskqueue').GetTasks('default')
+                if task['url'] == leaderboard.PERSIST_URL]
+
+    def test_merge(self):
+        entries = leaderboard.merge([], 'alice', 4)
+        entries = leaderboard.merge(entries, 'bob', 6)
+        self.assertEqual(entries, [['bob', 6], ['alice', 4]])
+        self.assertEqual(leaderboard.merge(entries, 'alice', 8),
+                         [['alice', 8], ['bob', 6]])
+
+    def test_publish_persists_later(self):
+        leaderboard.add_score('alice', 2)
+        leaderboard.add_score('alice', 1)
+        leaderboard.publish('alice')
+        leaderboard.add_score('bob', 2)
+        leaderboard.publish('bob')
+        self.assertEqual(leaderboard.get_total('alice'), (3, 2))
+        self.assertEqual(leaderboard.get_top(10), [['alice', 3], ['bob', 2]])
+        self.assertIsNone(models.Leaderboard.get_by_id(leaderboard.LEADERBOARD_ID))
+        self.assertEqual(len(self.persist_tasks()), 1)
+
+        leaderboard.persist()
+        memcache.flush_all()
+        self.assertEqual(leaderboard.get_top(10), [['alice', 3], ['bob', 2]])
+
+    def test_get_top_limits(self):
+        for name, points in [('alice', 3), ('bob', 2), ('carol', 1)]:
+            leaderboard.add_score(name, points)
+            leaderboard.publish(name)
+        self.assertEqual(leaderboard.get_top(1), [['alice', 3]])
+        self.assertEqual(leaderboard.get_top(0), [])
+        self.assertEqual(leaderboard.get_top(-1), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+"""Tests of the memcache matchmaking of matchmaking.py on the datastore and
+memcache stubs, which needs the App Engine SDK on the path"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from google.appengine.datastore import datastore_stub_util
+    from google.appengine.ext import ndb, testbed
+    import directory
+    import matchmaking
+    import models
+except ImportError:
+    matchmaking = None
+
+
+@unittest.skipIf(matchmaking is None, 'the App Engine SDK is missing')
+class MatchmakingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub(
+            consistency_policy=datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+                probability=1))
+        self.testbed.init_memcache_stub()
+        ndb.get_context().clear_cache()
+        directory._local.clear()
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def user(self, name, rating=None):
+        user = models.User(id=name, name=name, rating=rating)
+        user.put()
+        return user
+
+    def test_waits_then_matches(self):
+        alice = self.user('alice')
+        ticket, status, game = matchmaking.find_match(alice)
+        self.assertEqual(status, matchmaking.WAITING)
+        self.assertIsNone(game)
+        self.assertEqual(matchmaking.poll(ticket), (matchmaking.WAITING, None))
+        ## looking again keeps the same ticket
+        self.assertEqual(matchmaking.find_match(alice)[0], ticket)
+
+        _, status, game = matchmaking.find_match(self.user('bob', 1250.0))
+        self.assertEqual(status, matchmaking.MATCHED)
+        self.assertEqual(game.user, alice.key)
+        self.assertEqual(game.user_of_next_move, alice.key)
+        self.assertEqual(matchmaking.poll(ticket),
+                         (matchmaking.MATCHED, game.key.urlsafe()))
+
+    def test_distant_ratings_wait(self):
+        matchmaking.find_match(self.user('alice', 1200.0))
+        _, status, _ = matchmaking.find_match(self.user('bob', 1600.0))
+        self.assertEqual(status, matchmaking.WAITING)
+
+    def test_unknown_ticket_expired(self):
+        self.assertEqual(matchmaking.poll('missing'),
+                         (matchmaking.EXPIRED, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+"""Tests of mnk.py"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mnk
+
+
+def bits(positions):
+    return sum(1 << position for position in positions)
+
+
+class MnkTest(unittest.TestCase):
+    ROWS, COLS, K = 7, 9, 4
+
+    def _wins(self, cells):
+        board = bits(r * self.COLS + c for r, c in cells)
+        return [mnk.wins(board, self.ROWS, self.COLS, self.K, r * self.COLS + c)
+                for r, c in cells]
+
+    def test_edge_lines(self):
+        self.assertEqual(self._wins([(0, 5), (0, 6), (0, 7), (0, 8)]), [True] * 4)
+        self.assertEqual(self._wins([(3, 0), (4, 0), (5, 0), (6, 0)]), [True] * 4)
+        self.assertEqual(self._wins([(6, 0), (6, 1), (6, 2), (6, 3)]), [True] * 4)
+
+    def test_diagonals(self):
+        self.assertEqual(self._wins([(3, 5), (4, 6), (5, 7), (6, 8)]), [True] * 4)
+        self.assertEqual(self._wins([(0, 3), (1, 2), (2, 1), (3, 0)]), [True] * 4)
+
+    def test_lines_do_not_wrap(self):
+        ## the end of a row is next to the start of the next one in bits
+        self.assertFalse(any(self._wins([(0, 7), (0, 8), (1, 0), (1, 1)])))
+        self.assertFalse(any(self._wins([(0, 1), (1, 0), (1, 8), (2, 7)])))
+
+    def test_short_line(self):
+        self.assertFalse(any(self._wins([(2, 2), (3, 3), (4, 4)])))
+
+    def test_pack_round_trip(self):
+        cells = self.ROWS * self.COLS
+        user, opponent = bits([0, 62, 30]), bits([1, 61])
+        self.assertEqual(mnk.unpack(mnk.pack(user, opponent, cells), cells),
+                         (user, opponent))
+        self.assertEqual(mnk.unpack('', cells), (0, 0))
+
+    def test_heuristic_move(self):
+        rows = cols = 5
+        self.assertEqual(mnk.heuristic_move(0, 0, rows, cols, 4), 12)
+        ## three in a row, one more wins
+        own = bits([0, 1, 2])
+        self.assertEqual(mnk.heuristic_move(own, bits([10, 11]), rows, cols, 4), 3)
+        ## blocks the other player's win
+        self.assertEqual(mnk.heuristic_move(bits([20]), own, rows, cols, 4), 3)
+
+    def test_validate(self):
+        mnk.validate(3, 3, 3)
+        mnk.validate(19, 19, 5)
+        self.assertRaises(ValueError, mnk.validate, 2, 3, 3)
+        self.assertRaises(ValueError, mnk.validate, 3, 20, 3)
+        self.assertRaises(ValueError, mnk.validate, 4, 4, 5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+"""Tests of movelog.py"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import movelog
+
+
+class MovelogTest(unittest.TestCase):
+
+    def test_nibble_round_trip(self):
+        for played in ([], [4], [4, 0], [0, 8, 4, 2, 6], range(movelog.MAX_POSITION + 1)):
+            packed = movelog.pack(played)
+            self.assertEqual(len(packed), (len(played) + 1) // 2)
+            self.assertEqual(movelog.positions(packed, len(played)), list(played))
+
+    def test_nibble_append(self):
+        packed = ''
+        for count, position in enumerate([3, 7, 1]):
+            packed = movelog.append(packed, count, position)
+        self.assertEqual(packed, '\x37\x1f')
+
+    def test_nibble_overflow(self):
+        self.assertRaises(ValueError, movelog.append, '', 0, movelog.MAX_POSITION + 1)
+
+    def test_varint_round_trip(self):
+        played = [0, 1, 127, 128, 200, 360, 16383, 16384]
+        packed = movelog.pack(played, wide=True)
+        self.assertEqual(movelog.positions(packed, len(played), wide=True), played)
+        self.assertEqual(movelog.positions(packed, 3, wide=True), played[:3])
+
+    def test_varint_sizes(self):
+        self.assertEqual(movelog.pack([127], wide=True), '\x7f')
+        self.assertEqual(movelog.pack([128], wide=True), '\x80\x01')
+
+    def test_fits_nibbles(self):
+        self.assertTrue(movelog.fits_nibbles(9))
+        self.assertTrue(movelog.fits_nibbles(15))
+        self.assertFalse(movelog.fits_nibbles(16))
+
+    def test_parse_legacy(self):
+        self.assertEqual(movelog.parse_legacy('(bob,4),(computer,0),'),
+                         [('bob', 4), ('computer', 0)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,110 @@
+"""Tests of the rules of moves.py against repository.MemoryRepository,
+which needs the App Engine SDK on the path"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import endpoints
+    import models
+    import moves
+    import repository
+except ImportError:
+    moves = None
+
+
+@unittest.skipIf(moves is None, 'the App Engine SDK is missing')
+class MovesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.repository = repository.MemoryRepository()
+        self.repository.computer_key()
+        self.alice = self.repository.add_user('alice')
+        self.bob = self.repository.add_user('bob')
+
+    def new_game(self, opponent=None):
+        opponent = opponent or self.bob
+        return self.repository.add_game(models.Game.build(
+            user=self.alice.key, user_tic='O', opponent=opponent.key,
+            opponent_tic='X', user_of_next_move=self.alice.key))
+
+    def test_make_move(self):
+        key = self.new_game()
+        game, message, players = moves.make_move(self.repository, key,
+                                                 'alice', 4)
+        self.assertEqual(game.board_state, '----O----')
+        self.assertEqual(game.version, 1)
+        self.assertEqual(message, 'Next move: bob')
+        self.assertEqual(set(players), set([self.alice.key, self.bob.key]))
+
+    def test_make_move_rules(self):
+        key = self.new_game()
+        with self.assertRaises(endpoints.ForbiddenException):
+            moves.make_move(self.repository, key, 'bob', 0)
+        with self.assertRaises(endpoints.NotFoundException):
+            moves.make_move(self.repository, key, 'carol', 0)
+        moves.make_move(self.repository, key, 'alice', 0)
+        _, message, _ = moves.make_move(self.repository, key, 'bob', 0)
+        self.assertIn('already been taken', message)
+
+    def test_win_records_scores(self):
+        key = self.new_game()
+        for user_name, position in [('alice', 0), ('bob', 3), ('alice', 1),
+                                    ('bob', 4), ('alice', 2)]:
+            game, message, _ = moves.make_move(self.repository, key,
+                                               user_name, position)
+        self.assertTrue(game.game_over)
+        self.assertEqual(message, 'Game Over, alice has won')
+        self.assertEqual(len(self.repository.scores), 2)
+
+    def test_computer_replies(self):
+        key = self.new_game(self.repository.get_user(models.COMPUTER_NAME))
+        game, message, _ = moves.make_move(self.repository, key, 'alice', 4)
+        self.assertEqual(game.move_count, 2)
+        self.assertEqual(game.user_of_next_move, self.alice.key)
+        self.assertIn('Next move: alice', message)
+
+    def test_stale_batch_conflicts(self):
+        key = self.new_game()
+
+        def stale(game, version, scores=()):
+            raise moves.StaleGameError()
+        self.repository.commit = stale
+        results, _ = moves.make_moves(self.repository,
+                                      [(key.urlsafe(), 'alice', 4)])
+        self.assertIsInstance(results[0][2], endpoints.ConflictException)
+
+    def test_make_moves(self):
+        first = self.new_game()
+        second = self.new_game()
+        results, _ = moves.make_moves(self.repository, [
+            (first.urlsafe(), 'alice', 0),
+            (first.urlsafe(), 'bob', 1),
+            (second.urlsafe(), 'bob', 1),
+            ('not a key', 'alice', 0),
+            (second.urlsafe(), 'alice', 8),
+        ])
+        self.assertEqual(results[1][1], 'Next move: alice')
+        self.assertIsInstance(results[2][2], endpoints.ForbiddenException)
+        self.assertIsInstance(results[3][2], endpoints.BadRequestException)
+        self.assertIsNone(results[4][2])
+        self.assertEqual(self.repository.get_game(first).board_state,
+                         'OX-------')
+        ## one commit per game
+        self.assertEqual(self.repository.get_game(first).version, 1)
+
+    def test_cancel_game(self):
+        key = self.new_game()
+        game, message = moves.cancel_game(self.repository, key)
+        self.assertTrue(game.is_canceled)
+        self.assertEqual(message, 'You just canceled the game!')
+        _, message = moves.cancel_game(self.repository, key)
+        self.assertEqual(message, 'You have already canceled the game!')
+        with self.assertRaises(endpoints.ForbiddenException):
+            moves.make_move(self.repository, key, 'alice', 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
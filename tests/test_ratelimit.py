@@ -0,0 +1,78 @@
+"""Tests of the token buckets of ratelimit.py, which needs the App Engine
+SDK on the path"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from google.appengine.ext import testbed
+    import ratelimit
+except ImportError:
+    ratelimit = None
+
+
+class FakeTime(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@unittest.skipIf(ratelimit is None, 'the App Engine SDK is missing')
+class TakeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_memcache_stub()
+        self.clock = FakeTime()
+        self.time = ratelimit.time
+        ratelimit.time = self.clock
+
+    def tearDown(self):
+        ratelimit.time = self.time
+        self.testbed.deactivate()
+
+    def take(self, times):
+        return [ratelimit._take('bucket', 3, 2, 1) for _ in range(times)]
+
+    def test_capacity(self):
+        self.assertEqual(self.take(4), [1, 1, 1, 0])
+
+    def test_rejections_take_no_token(self):
+        self.take(10)
+        self.clock.now += 0.5
+        self.assertEqual(self.take(2), [1, 0])
+
+    def test_refills_by_elapsed_time(self):
+        self.take(3)
+        self.clock.now += 1
+        self.assertEqual(self.take(3), [1, 1, 0])
+
+    def test_refills_up_to_capacity(self):
+        self.take(3)
+        self.clock.now += 60
+        self.assertEqual(self.take(4), [1, 1, 1, 0])
+
+    def test_takes_what_is_left(self):
+        self.assertEqual(ratelimit._take('bucket', 3, 2, 2), 2)
+        self.assertEqual(ratelimit._take('bucket', 3, 2, 2), 1)
+        self.clock.now += 1
+        self.assertEqual(ratelimit._take('bucket', 3, 2, 5), 2)
+
+    def test_check_raises_forbidden(self):
+        capacity = ratelimit.LIMITS['make_move'][0]
+        self.assertEqual(ratelimit.check('make_move', '10.0.0.1', capacity + 5),
+                         capacity)
+        with self.assertRaises(ratelimit.RateLimitedException) as raised:
+            ratelimit.check('make_move', '10.0.0.1')
+        self.assertEqual(raised.exception.http_status, 403)
+        ratelimit.check('make_move', '10.0.0.2')
+
+
+if __name__ == '__main__':
+    unittest.main()
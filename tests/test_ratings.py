@@ -0,0 +1,58 @@
+"""Tests of the ratings and ranks of ratings.py on the datastore stub,
+which needs the App Engine SDK on the path"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    from google.appengine.datastore import datastore_stub_util
+    from google.appengine.ext import ndb, testbed
+    import models
+    import ratings
+except ImportError:
+    ratings = None
+
+
+@unittest.skipIf(ratings is None, 'the App Engine SDK is missing')
+class RatingsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub(
+            consistency_policy=datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+                probability=1))
+        self.testbed.init_memcache_stub()
+        ndb.get_context().clear_cache()
+        self.alice = models.User(id='alice', name='alice').put()
+        self.bob = models.User(id='bob', name='bob').put()
+        models.User(id='carol', name='carol').put()
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def test_record_game(self):
+        alice, bob = ratings.record_game(self.alice, self.bob,
+                                         models.Result.WIN)
+        self.assertEqual(alice.rating, ratings.INITIAL_RATING + 16)
+        self.assertEqual(bob.rating, ratings.INITIAL_RATING - 16)
+        self.assertEqual((alice.rated_games, bob.rated_games), (1, 1))
+        self.assertEqual(ratings.get_rank(alice), 1)
+        self.assertEqual(ratings.get_rank(bob), 2)
+
+    def test_get_top(self):
+        ratings.record_game(self.alice, self.bob, models.Result.LOSE)
+        self.assertEqual([user.name for user in ratings.get_top(10)],
+                         ['bob', 'alice'])
+        self.assertEqual(len(ratings.get_top(1)), 1)
+
+    def test_get_top_below_one(self):
+        ratings.record_game(self.alice, self.bob, models.Result.TIE)
+        self.assertEqual(ratings.get_top(0), [])
+        self.assertEqual(ratings.get_top(-5), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
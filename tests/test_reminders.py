@@ -0,0 +1,93 @@
+"""Tests of the sharded reminder digests of reminders.py on the datastore,
+task queue and mail stubs, which needs the App Engine SDK on the path"""
+import os
+import sys
+import unittest
+import urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+try:
+    from google.appengine.datastore import datastore_stub_util
+    from google.appengine.ext import ndb, testbed
+    import models
+    import reminders
+except ImportError:
+    reminders = None
+
+
+@unittest.skipIf(reminders is None, 'the App Engine SDK is missing')
+class RemindersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub(
+            consistency_policy=datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+                probability=1))
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub(root_path=ROOT)
+        self.testbed.init_app_identity_stub()
+        self.testbed.init_mail_stub()
+        ndb.get_context().clear_cache()
+        computer = models.User(id='computer', name='computer').put()
+        self.users = []
+        for i in range(40):
+            user = models.User(id='user%02d' % i, name='user%02d' % i,
+                               email='user%02d@example.com' % i).put()
+            self.users.append(user)
+            for _ in range(i % 3 + 1):
+                models.Game.build(user=user, user_tic='O', opponent=computer,
+                                  opponent_tic='X',
+                                  user_of_next_move=user).put()
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def run_tasks(self):
+        queue = self.testbed.get_stub('taskqueue')
+        shards = set()
+        while True:
+            tasks = queue.GetTasks('default')
+            if not tasks:
+                return shards
+            queue.FlushQueue('default')
+            for task in tasks:
+                params = dict(urlparse.parse_qsl(task['body'].decode('base64')))
+                shards.add(params['shard'])
+                reminders.send_batch(params['run'], int(params['page']),
+                                     params.get('cursor'),
+                                     params.get('skip_user'),
+                                     int(params['shard']),
+                                     params.get('first_user'),
+                                     params.get('end_user'))
+
+    def test_one_digest_per_user(self):
+        reminders.start()
+        shards = self.run_tasks()
+        self.assertGreater(len(shards), 1)
+        messages = self.testbed.get_stub('mail').get_sent_messages()
+        self.assertEqual(sorted(message.to for message in messages),
+                         ['user%02d@example.com' % i for i in range(40)])
+
+    def test_batches_chain_within_shards(self):
+        batch_size = reminders.BATCH_SIZE
+        reminders.BATCH_SIZE = 5
+        try:
+            reminders.start()
+            self.run_tasks()
+        finally:
+            reminders.BATCH_SIZE = batch_size
+        messages = self.testbed.get_stub('mail').get_sent_messages()
+        self.assertEqual(len(messages), 40)
+        self.assertEqual(len(set(message.to for message in messages)), 40)
+
+    def test_split_points(self):
+        points = reminders._split_points(4)
+        self.assertLessEqual(len(points), 3)
+        self.assertEqual(points, sorted(points))
+
+
+if __name__ == '__main__':
+    unittest.main()
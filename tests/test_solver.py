@@ -0,0 +1,52 @@
+"""Tests of solver.py"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import judge
+import solver
+
+
+class SolverTest(unittest.TestCase):
+
+    def _outcomes(self, code, mark, solver_mark):
+        """Yields the outcome of every game from code where solver_mark
+        plays the solver and the other mark plays every legal move"""
+        outcome = judge.outcome(code)
+        if outcome != judge.ONGOING:
+            yield outcome
+            return
+        other = judge.OPPONENT if mark == judge.USER else judge.USER
+        if mark == solver_mark:
+            positions = [solver.best_move(code, mark)]
+        else:
+            positions = judge.free_positions(code)
+        for position in positions:
+            self.assertTrue(judge.is_free(code, position))
+            for result in self._outcomes(judge.place(code, position, mark),
+                                         other, solver_mark):
+                yield result
+
+    def test_never_loses_first(self):
+        outcomes = set(self._outcomes(judge.EMPTY_BOARD, judge.USER, judge.USER))
+        self.assertNotIn(judge.OPPONENT_WINS, outcomes)
+
+    def test_never_loses_second(self):
+        outcomes = set(self._outcomes(judge.EMPTY_BOARD, judge.USER,
+                                      judge.OPPONENT))
+        self.assertNotIn(judge.USER_WINS, outcomes)
+
+    def test_takes_a_win(self):
+        code = judge.encode('OO-XX----', 'O', 'X')
+        self.assertEqual(solver.best_move(code, judge.USER), 2)
+        self.assertEqual(solver.best_move(code, judge.OPPONENT), 5)
+
+    def test_over(self):
+        code = judge.encode('OXOOXXXOO', 'O', 'X')
+        self.assertIsNone(solver.best_move(code, judge.USER))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+"""Tests of the tally of ended games in moves.py on the datastore stub,
+which needs the App Engine SDK on the path"""
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+try:
+    from google.appengine.datastore import datastore_stub_util
+    from google.appengine.ext import ndb, testbed
+    import directory
+    import leaderboard
+    import models
+    import moves
+    import repository
+except ImportError:
+    moves = None
+
+
+@unittest.skipIf(moves is None, 'the App Engine SDK is missing')
+class TallyTest(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub(
+            consistency_policy=datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+                probability=1))
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub(root_path=ROOT)
+        ndb.get_context().clear_cache()
+        directory._local.clear()
+        directory._computer = None
+        self.repository = repository.NdbRepository()
+        alice = directory.create_user('alice')
+        bob = directory.create_user('bob')
+        self.key = models.Game.build(
+            user=alice.key, user_tic='O', opponent=bob.key, opponent_tic='X',
+            user_of_next_move=alice.key).put()
+        for user_name, position in [('alice', 0), ('bob', 3), ('alice', 1),
+                                    ('bob', 4), ('alice', 2)]:
+            moves.make_move(self.repository, self.key, user_name, position)
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def test_ended_game_enqueues_tally(self):
+        tasks = self.testbed.get_stub('taskqueue').GetTasks('default')
+        self.assertIn(moves.GAME_ENDED_URL, [task['url'] for task in tasks])
+
+    def test_tally_once(self):
+        moves.tally_game(self.key)
+        moves.tally_game(self.key)
+        self.assertTrue(self.key.get().tallied)
+        self.assertEqual(leaderboard.get_total('alice'), (2, 1))
+        self.assertEqual(leaderboard.get_top(10)[0], ['alice', 2])
+        self.assertEqual(directory.get_user('alice').rated_games, 1)
+
+    def test_retry_finishes_updates(self):
+        publish = leaderboard.publish
+
+        def failing(user_name):
+            raise RuntimeError('leaderboard unavailable')
+        leaderboard.publish = failing
+        try:
+            with self.assertRaises(RuntimeError):
+                moves.tally_game(self.key)
+        finally:
+            leaderboard.publish = publish
+        self.assertEqual(leaderboard.get_top(10), [])
+
+        moves.tally_game(self.key)
+        self.assertEqual(leaderboard.get_total('alice'), (2, 1))
+        self.assertEqual(leaderboard.get_top(10)[0], ['alice', 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+"""Tests of the write-behind buffering of writebehind.py on the datastore,
+memcache and task queue stubs, which needs the App Engine SDK on the
+path"""
+import os
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+try:
+    from google.appengine.api import memcache
+    from google.appengine.datastore import datastore_stub_util
+    from google.appengine.ext import ndb, testbed
+    import directory
+    import models
+    import moves
+    import writebehind
+except ImportError:
+    writebehind = None
+
+
+@unittest.skipIf(writebehind is None, 'the App Engine SDK is missing')
+class WriteBehindTest(unittest.TestCase):
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_datastore_v3_stub(
+            consistency_policy=datastore_stub_util.PseudoRandomHRConsistencyPolicy(
+                probability=1))
+        self.testbed.init_memcache_stub()
+        self.testbed.init_taskqueue_stub(root_path=ROOT)
+        ndb.get_context().clear_cache()
+        directory._local.clear()
+        directory._computer = None
+        alice = directory.create_user('alice')
+        bob = directory.create_user('bob')
+        self.key = models.Game.build(
+            user=alice.key, user_tic='O', opponent=bob.key, opponent_tic='X',
+            user_of_next_move=alice.key).put()
+
+    def tearDown(self):
+        self.testbed.deactivate()
+
+    def play(self, *turns):
+        for user_name, position in turns:
+            game, _, _ = moves.make_move(writebehind.WriteBehindRepository(),
+                                         self.key, user_name, position)
+        return game
+
+    def stored(self):
+        return self.key.get(use_cache=False)
+
+    def test_moves_are_buffered(self):
+        game = self.play(('alice', 0), ('bob', 1))
+        self.assertEqual(game.board_state, 'OX-------')
+        self.assertEqual(self.stored().version, 0)
+        self.assertEqual(writebehind.get_game(self.key).board_state,
+                         'OX-------')
+        self.assertEqual(writebehind.get_games([self.key])[0].board_state,
+                         'OX-------')
+
+    def test_flushes_every_few_moves(self):
+        self.play(('alice', 0), ('bob', 1), ('alice', 3), ('bob', 4),
+                  ('alice', 8))
+        self.assertEqual(self.stored().board_state, 'OX-OX---O')
+        self.assertEqual(self.stored().version, writebehind.FLUSH_EVERY_MOVES)
+
+    def test_flush_task(self):
+        self.play(('alice', 0))
+        self.assertTrue(writebehind.flush_game(self.key))
+        self.assertEqual(self.stored().board_state, 'O--------')
+
+    def test_rebuild_from_journal(self):
+        self.play(('alice', 0), ('bob', 1), ('alice', 3))
+        memcache.flush_all()
+        game = writebehind.get_game(self.key)
+        self.assertEqual(game.board_state, 'OX-O-----')
+        self.assertEqual(game.version, 3)
+        ## the journal is still there for the next rebuild
+        memcache.flush_all()
+        self.assertEqual(writebehind.get_game(self.key).version, 3)
+        self.play(('bob', 4))
+        self.assertEqual(writebehind.get_game(self.key).board_state,
+                         'OX-OX----')
+
+    def test_batch_moves_on_buffered_game(self):
+        self.play(('alice', 0))
+        results, _ = moves.make_moves(writebehind.WriteBehindRepository(), [
+            (self.key.urlsafe(), 'bob', 1),
+            (self.key.urlsafe(), 'alice', 2),
+        ])
+        self.assertEqual([error for _, _, error in results], [None, None])
+        self.assertEqual(writebehind.get_game(self.key).board_state,
+                         'OXO------')
+
+    def test_end_writes_game(self):
+        game = self.play(('alice', 0), ('bob', 3), ('alice', 1), ('bob', 4),
+                         ('alice', 2))
+        self.assertTrue(game.game_over)
+        stored = self.stored()
+        self.assertTrue(stored.game_over)
+        self.assertEqual(models.Score.query().count(), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
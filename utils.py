@@ -1,9 +1,26 @@
 """utils.py - File for collecting general utility functions."""
 
 import logging
+from google.appengine.api import datastore_errors
+from google.appengine.datastore.datastore_query import Cursor
 from google.appengine.ext import ndb
 import endpoints
 
+def key_from_urlsafe(urlsafe):
+    """Returns the ndb.Key of a urlsafe key string.
+    Raises:
+        endpoints.BadRequestException: If the key String is malformed."""
+    try:
+        return ndb.Key(urlsafe=urlsafe)
+    except TypeError:
+        raise endpoints.BadRequestException('Invalid Key')
+    except Exception, e:
+        if e.__class__.__name__ == 'ProtocolBufferDecodeError':
+            raise endpoints.BadRequestException('Invalid Key')
+        else:
+            raise
+
+
 def get_by_urlsafe(urlsafe, model):
     """Returns an ndb.Model entity that the urlsafe key points to. Checks
         that the type of entity returned is of the correct kind. Raises an
@@ -17,15 +34,7 @@ def get_by_urlsafe(urlsafe, model):
         exists.
     Raises:
         ValueError:"""
-    try:
-        key = ndb.Key(urlsafe=urlsafe)
-    except TypeError:
-        raise endpoints.BadRequestException('Invalid Key')
-    except Exception, e:
-        if e.__class__.__name__ == 'ProtocolBufferDecodeError':
-            raise endpoints.BadRequestException('Invalid Key')
-        else:
-            raise
+    key = key_from_urlsafe(urlsafe)
 
     entity = key.get()
     if not entity:
@@ -54,3 +63,66 @@ def get_endpoints_current_user(raise_unauthorized=True):
         return None
 
 
+
+def get_referenced(entities, *properties):
+    """Fetches every entity referenced by the given KeyProperty names of
+        entities with a single batched get.
+    Args:
+        entities: An iterable of ndb.Model entities
+        properties: Names of KeyProperty attributes to follow
+    Returns:
+        A dict mapping each referenced key to its entity (None if missing).
+    """
+    keys = set()
+    for entity in entities:
+        for name in properties:
+            key = getattr(entity, name)
+            if key is not None:
+                keys.add(key)
+    keys = list(keys)
+    return dict(zip(keys, ndb.get_multi(keys)))
+
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def query_page(query, page_size, cursor=None, **options):
+    """Fetches page_size results of a query from a urlsafe cursor.
+    Returns:
+        A tuple (results, urlsafe cursor of the next page or None).
+    Raises:
+        endpoints.BadRequestException: If the cursor is malformed.
+    """
+    try:
+        start_cursor = Cursor(urlsafe=cursor) if cursor else None
+        results, next_cursor, more = query.fetch_page(
+            page_size, start_cursor=start_cursor, **options)
+    except (datastore_errors.BadValueError, datastore_errors.BadRequestError):
+        raise endpoints.BadRequestException('Invalid cursor')
+    if not more or next_cursor is None:
+        return results, None
+    return results, next_cursor.urlsafe()
+
+
+def fetch_page(query, page_size=None, cursor=None, **options):
+    """Fetches one page of a query.
+    Args:
+        query: The ndb.Query to run
+        page_size: Number of results, DEFAULT_PAGE_SIZE if None, from 1 to
+            MAX_PAGE_SIZE
+        cursor: The urlsafe cursor returned with the previous page
+        options: More query options, e.g. projection or keys_only
+    Returns:
+        A tuple (results, urlsafe cursor of the next page or None, more).
+    Raises:
+        endpoints.BadRequestException: If the cursor is malformed or
+            page_size is below 1.
+    """
+    if page_size is None:
+        page_size = DEFAULT_PAGE_SIZE
+    elif page_size < 1:
+        raise endpoints.BadRequestException('page_size must be at least 1')
+    page_size = min(page_size, MAX_PAGE_SIZE)
+    results, next_cursor = query_page(query, page_size, cursor, **options)
+    return results, next_cursor, next_cursor is not None
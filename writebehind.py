@@ -0,0 +1,301 @@
+"""writebehind.py - Optional write-behind buffering of games in progress.
+
+With WRITE_BEHIND set to true in app.yaml, a game in progress lives in
+memcache and WriteBehindRepository commits moves to it with
+compare-and-set instead of writing the datastore. The game is written
+(flushed) when it ends or is canceled, every FLUSH_EVERY_MOVES changes
+and by a flush task enqueued FLUSH_SECONDS after its first unflushed
+change. Until then each change is journaled, as the positions it played,
+in the JOURNAL_QUEUE pull queue, tagged with the game.
+
+A game evicted from memcache is rebuilt from its stored snapshot by
+replaying its journal. Reading the journal means leasing its tasks, which
+hides them from everyone else, so only the holder of the game's memcache
+lock leases them: the rebuild, and a flush dropping the tasks it wrote.
+
+A change is journaled right after its compare-and-set, and flushed at
+once if it cannot be, so only a request dying between the two can lose a
+move, if the game is also evicted before its next flush."""
+import json
+import logging
+import os
+import time
+
+import endpoints
+from google.appengine.api import memcache, taskqueue
+from google.appengine.ext import ndb
+
+import moves
+import repository
+from models import Game
+
+ENABLED = os.environ.get('WRITE_BEHIND', '').lower() == 'true'
+FLUSH_EVERY_MOVES = 5
+FLUSH_SECONDS = 60
+FLUSH_URL = '/tasks/flush_game'
+JOURNAL_QUEUE = 'move-journal'
+MEMCACHE_PREFIX = 'writebehind:'
+LOCK_PREFIX = 'writebehind:lock:'
+## a lock outlives a rebuild that died holding it by this much at most
+LOCK_SECONDS = 10
+LEASE_SECONDS = 10
+MAX_JOURNAL = 1000
+CAS_RETRIES = 10
+## how long a move waits for another request rebuilding its game
+REBUILD_WAIT_SECONDS = 0.05
+
+
+def _state_key(game_key):
+    return MEMCACHE_PREFIX + game_key.urlsafe()
+
+
+def _journal(game_key, entry):
+    taskqueue.Queue(JOURNAL_QUEUE).add(taskqueue.Task(
+        payload=json.dumps(entry), method='PULL', tag=game_key.urlsafe()))
+
+
+def _locked(client, game_key, read):
+    """Calls read(queue, journal, deleted) with the journaled changes of a
+    game as sorted (entry, task), holding the lock of the game, and
+    releases the tasks read did not add to deleted. Returns (True, read's
+    result), or (False, None) if another request holds the lock."""
+    lock = LOCK_PREFIX + game_key.urlsafe()
+    if not client.add(lock, 1, time=LOCK_SECONDS):
+        return False, None
+    try:
+        queue = taskqueue.Queue(JOURNAL_QUEUE)
+        tasks = queue.lease_tasks_by_tag(LEASE_SECONDS, MAX_JOURNAL,
+                                         tag=game_key.urlsafe())
+        journal = sorted(((json.loads(task.payload), task) for task in tasks),
+                         key=lambda (entry, task): entry['version'])
+        deleted = []
+        try:
+            return True, read(queue, journal, deleted)
+        finally:
+            for _, task in journal:
+                if task not in deleted:
+                    queue.modify_task_lease(task, 0)
+    finally:
+        client.delete(lock)
+
+
+def _replay(game, entries):
+    """Applies journaled changes newer than the game to it. Returns the
+    scores of the game if they ended it."""
+    replayed = False
+    for entry in entries:
+        if entry['version'] <= game.version:
+            continue
+        if entry['version'] != game.version + 1:
+            logging.error('Journal of game %s misses version %d',
+                          game.key.urlsafe(), game.version + 1)
+            break
+        for position in entry.get('positions', ()):
+            game.place_mark(game.user_of_next_move, position)
+            game.record_move(position)
+        if entry.get('cancel'):
+            game.is_canceled = True
+        game.version = entry['version']
+        replayed = True
+    if not replayed or game.is_canceled:
+        return []
+    return game.judge_game().get('scores', [])
+
+
+def _schedule_flush(game_key, flushed, version):
+    """Enqueues the flush of a game changed since version flushed"""
+    try:
+        taskqueue.add(url=FLUSH_URL, countdown=FLUSH_SECONDS,
+                      params={'urlsafe_game_key': game_key.urlsafe()},
+                      name='flush-%s-%d-%d' % (game_key.urlsafe(), flushed,
+                                               version))
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        pass
+
+
+def _load(game_key, client):
+    """Returns the buffered state of a game, rebuilt if it was evicted,
+    read with client.gets for compare-and-set. None means another request
+    is rebuilding it.
+    Raises:
+        endpoints.NotFoundException: If the game does not exist.
+    """
+    state = client.gets(_state_key(game_key))
+    if state is not None:
+        return state
+
+    def rebuild(queue, journal, deleted):
+        ## rebuilt by the previous holder of the lock
+        if client.gets(_state_key(game_key)) is not None:
+            return
+        game = game_key.get(use_cache=False)
+        if not isinstance(game, Game):
+            raise endpoints.NotFoundException('Game not found!')
+        flushed = game.version
+        scores = _replay(game, [entry for entry, _ in journal])
+        client.add(_state_key(game_key),
+                   {'game': game, 'flushed': flushed, 'scores': scores})
+        if game.version != flushed:
+            _schedule_flush(game_key, flushed, game.version)
+
+    if not _locked(client, game_key, rebuild)[0]:
+        return None
+    return client.gets(_state_key(game_key))
+
+
+@ndb.transactional(xg=True)
+def _write(game, scores):
+    current = game.key.get()
+    if current is not None and current.version >= game.version:
+        return False
+    ndb.put_multi([game] + list(scores))
+    if game.game_over:
+        taskqueue.add(url=moves.GAME_ENDED_URL,
+                      params={'urlsafe_game_key': game.key.urlsafe()},
+                      transactional=True)
+    return True
+
+
+def _flush(game_key, client):
+    """Writes the buffered game, unless a newer version is stored, and
+    drops its journal up to the version written"""
+    state = client.get(_state_key(game_key))
+    if state is None:
+        ## evicted, the journal still has its changes
+        return
+    game = state['game']
+    _write(game, state['scores'])
+
+    def drop(queue, journal, deleted):
+        deleted.extend(task for entry, task in journal
+                       if entry['version'] <= game.version)
+        if deleted:
+            queue.delete_tasks(deleted)
+    ## when a rebuild holds the lock the written tasks are dropped by the
+    ## next flush, a rebuild skips them
+    _locked(client, game_key, drop)
+
+    for _ in range(CAS_RETRIES):
+        state = client.gets(_state_key(game_key))
+        if state is None or state['flushed'] >= game.version:
+            return
+        state['flushed'] = game.version
+        if client.cas(_state_key(game_key), state):
+            return
+
+
+class WriteBehindRepository(repository.NdbRepository):
+    """Games in progress in memcache, users in the datastore. An instance
+    serves one request: it keeps the compare-and-set state of the games
+    it read."""
+
+    def __init__(self):
+        self._client = memcache.Client()
+        self._read = {}
+
+    def get_game(self, key):
+        for _ in range(CAS_RETRIES):
+            try:
+                state = _load(key, self._client)
+            except endpoints.NotFoundException:
+                return None
+            if state is not None:
+                game = state['game']
+                self._read[key] = (state, game.move_count)
+                return game
+            time.sleep(REBUILD_WAIT_SECONDS)
+        raise endpoints.ConflictException(
+                'The game is being restored, please try again')
+
+    def get_game_async(self, key):
+        return repository.Repository.get_game_async(self, key)
+
+    def get_games(self, keys):
+        ## the buffered games in one batch, the others one by one as they
+        ## may need a rebuild
+        keys = list(set(keys))
+        states = self._client.get_multi(
+            [_state_key(key) for key in keys], for_cas=True)
+        games = {}
+        for key in keys:
+            state = states.get(_state_key(key))
+            if state is None:
+                game = self.get_game(key)
+            else:
+                game = state['game']
+                self._read[key] = (state, game.move_count)
+            if game is not None:
+                games[key] = game
+        return games
+
+    def get_games_async(self, keys):
+        return repository.Repository.get_games_async(self, keys)
+
+    def commit(self, game, version, scores=()):
+        state, move_count = self._read[game.key]
+        entry = {'positions': [position for _, position in
+                               game.moves()[move_count:]]}
+        if game.is_canceled and not entry['positions']:
+            entry['cancel'] = True
+        game.version = entry['version'] = version + 1
+        if scores:
+            state['scores'] = list(scores)
+        if not self._client.cas(_state_key(game.key), state):
+            raise moves.StaleGameError()
+
+        flush = game.game_over or game.is_canceled
+        try:
+            _journal(game.key, entry)
+        except taskqueue.Error:
+            logging.exception('Could not journal game %s, flushing it',
+                              game.key.urlsafe())
+            flush = True
+        if flush or game.version - state['flushed'] >= FLUSH_EVERY_MOVES:
+            _flush(game.key, self._client)
+        elif version == state['flushed']:
+            ## the first change since the last flush
+            _schedule_flush(game.key, version, game.version)
+
+    def commit_multi(self, commits):
+        return repository.Repository.commit_multi(self, commits)
+
+
+def get_game(game_key):
+    """Returns the current state of a game, buffered or stored, or None"""
+    try:
+        state = _load(game_key, memcache.Client())
+    except endpoints.NotFoundException:
+        return None
+    if state is None:
+        ## being rebuilt, the stored game is a little behind
+        game = game_key.get()
+        return game if isinstance(game, Game) else None
+    return state['game']
+
+
+def get_games(game_keys):
+    """Returns the current state of games as a list in the order of
+    game_keys, buffered or stored, leaving out the ones that do not exist.
+    Games evicted from memcache are read as stored, without a rebuild."""
+    states = memcache.get_multi([_state_key(key) for key in game_keys])
+    stored = [key for key in game_keys if _state_key(key) not in states]
+    games = dict(zip(stored, ndb.get_multi(stored)))
+    games.update((key, states[_state_key(key)]['game']) for key in game_keys
+                 if _state_key(key) in states)
+    return [games[key] for key in game_keys
+            if isinstance(games[key], Game)]
+
+
+def flush_game(game_key):
+    """Flushes a game, rebuilding it if it was evicted. Called by the
+    flush task of its first unflushed change. Returns False when it must
+    be retried."""
+    client = memcache.Client()
+    try:
+        if _load(game_key, client) is None:
+            return False
+    except endpoints.NotFoundException:
+        logging.warning('Flush of missing game %s', game_key.urlsafe())
+        return True
+    _flush(game_key, client)
+    return True